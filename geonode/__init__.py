@@ -22,13 +22,19 @@ import os
 
 __version__ = (3, 1, 0, 'unstable', 0)
 
+# resolved once per process by get_version
+_version = None
+
 
 default_app_config = "geonode.apps.AppConfig"
 
 
 def get_version():
-    import geonode.version
-    return geonode.version.get_version(__version__)
+    global _version
+    if _version is None:
+        import geonode.version
+        _version = geonode.version.get_version(__version__)
+    return _version
 
 
 def main(global_settings, **settings):
@@ -62,6 +62,7 @@ from tastypie.constants import ALL, ALL_WITH_RELATIONS
 from tastypie.utils import trailing_slash
 
 from geonode.utils import check_ogc_backend
+from geonode.base.facets import get_cached_counts
 from geonode.security.utils import get_visible_resources
 
 FILTER_TYPES = {
@@ -75,6 +76,16 @@ class CountJSONSerializer(Serializer):
     """Custom serializer to post process the api and add counts"""
 
     def get_resources_counts(self, options):
+        _type_filter = options['type_filter']
+        if _type_filter and not isinstance(_type_filter, str):
+            _type_filter = _type_filter.__name__.lower()
+
+        return get_cached_counts(
+            options['user'],
+            ['counts', options['count_type'], options['title_filter'], _type_filter],
+            lambda: self._get_resources_counts(options, _type_filter))
+
+    def _get_resources_counts(self, options, type_filter):
         if settings.SKIP_PERMS_FILTER:
             resources = ResourceBase.objects.all()
         else:
@@ -90,15 +101,11 @@ class CountJSONSerializer(Serializer):
             unpublished_not_visible=settings.RESOURCE_PUBLISHING,
             private_groups_not_visibile=settings.GROUP_PRIVATE_RESOURCES)
 
-        if resources and resources.count() > 0:
-            if options['title_filter']:
-                resources = resources.filter(title__icontains=options['title_filter'])
+        if options['title_filter']:
+            resources = resources.filter(title__icontains=options['title_filter'])
 
-            if options['type_filter']:
-                _type_filter = options['type_filter']
-                if not isinstance(_type_filter, str):
-                    _type_filter = _type_filter.__name__.lower()
-                resources = resources.filter(polymorphic_ctype__model=_type_filter)
+        if type_filter:
+            resources = resources.filter(polymorphic_ctype__model=type_filter)
 
         counts = list(resources.values(options['count_type']).annotate(count=Count(options['count_type'])))
 
@@ -24,6 +24,7 @@ from django.urls import resolve
 from django.db.models import Q
 from django.http import HttpResponse
 from django.conf import settings
+from django.contrib.auth.models import Group
 from django.contrib.staticfiles.templatetags import staticfiles
 from tastypie.authentication import MultiAuthentication, SessionAuthentication
 from django.template.response import TemplateResponse
@@ -54,7 +55,7 @@ from geonode.base.models import HierarchicalKeyword
 from geonode.base.bbox_utils import filter_bbox
 from geonode.groups.models import GroupProfile
 from geonode.utils import check_ogc_backend
-from geonode.security.utils import get_visible_resources
+from geonode.security.utils import get_visible_resources, get_resources_with_perms_filter
 from .authentication import OAuthAuthentication
 from .authorization import GeoNodeAuthorization, GeonodeApiKeyAuthentication
 
@@ -460,6 +461,75 @@ class CommonModelApi(ModelResource):
 
         return sqs
 
+    def apply_haystack_perms_filters(self, sqs, user):
+        """
+        Restricts ``sqs`` to the resources ``user`` is allowed to view.
+
+        Same rules as ``get_objects_for_user`` and ``get_visible_resources``,
+        applied to the permission fields of the search documents (see
+        ``geonode.security.search_indexes``): the query only carries the ids
+        of the user and of its groups, whatever the number of resources.
+
+        :return: The filtered SearchQuerySet or None if nothing is visible
+        """
+        from haystack.query import SQ
+
+        is_authenticated = user is not None and user.is_authenticated
+        if is_authenticated and not user.is_active:
+            return None
+        if is_authenticated and user.is_superuser:
+            return sqs
+
+        anonymous_groups = list(Group.objects.filter(name='anonymous').values_list('id', flat=True))
+        member_groups = []
+        if is_authenticated:
+            member_groups = list(user.group_list_all().values_list('group', flat=True))
+            if not user.has_perm('base.view_resourcebase'):
+                groups = list(Group.objects.filter(
+                    Q(user=user) | Q(name='anonymous') | Q(groupprofile__groupmember__user=user)
+                ).values_list('id', flat=True).distinct())
+                perms_filter = SQ(acl_anonymous=True) | SQ(acl_users=user.id)
+                if groups:
+                    perms_filter |= SQ(acl_groups__in=groups)
+                sqs = sqs.filter(perms_filter)
+        else:
+            sqs = sqs.filter(acl_anonymous=True)
+
+        if settings.ADMIN_MODERATE_UPLOADS and not is_authenticated:
+            public_groups = list(
+                GroupProfile.objects.exclude(access="private").values_list('group', flat=True))
+            visible_filter = SQ(is_published=True)
+            if public_groups + anonymous_groups:
+                visible_filter |= SQ(acl_group__in=public_groups + anonymous_groups)
+            sqs = sqs.filter(visible_filter).exclude(is_approved=False)
+
+        # Hide Unpublished Resources to Anonymous Users
+        if settings.RESOURCE_PUBLISHING and not is_authenticated:
+            sqs = sqs.exclude(is_published=False)
+
+        # Owners and group members still see private and dirty resources
+        owned_filter = None
+        if is_authenticated:
+            owned_filter = SQ(acl_owner=user.id)
+            if member_groups:
+                owned_filter |= SQ(acl_group__in=member_groups)
+
+        # Hide Resources Belonging to Private Groups
+        if settings.GROUP_PRIVATE_RESOURCES:
+            private_groups = list(
+                GroupProfile.objects.filter(access="private").values_list('group', flat=True))
+            if private_groups:
+                private_filter = SQ(acl_group__in=private_groups)
+                if owned_filter is not None:
+                    private_filter &= ~owned_filter
+                sqs = sqs.exclude(private_filter)
+
+        # Hide Dirty State Resources
+        dirty_filter = SQ(dirty_state=True)
+        if owned_filter is not None:
+            dirty_filter &= ~owned_filter
+        return sqs.exclude(dirty_filter)
+
     def get_search(self, request, **kwargs):
         self.method_check(request, allowed=['get'])
         self.is_authenticated(request)
@@ -469,35 +539,38 @@ class CommonModelApi(ModelResource):
         sqs = self.build_haystack_filters(request.GET)
 
         if not settings.SKIP_PERMS_FILTER:
-
-            filter_set = get_objects_for_user(
-                request.user, 'base.view_resourcebase')
-
-            filter_set = get_visible_resources(
-                filter_set,
-                request.user if request else None,
-                admin_approval_required=settings.ADMIN_MODERATE_UPLOADS,
-                unpublished_not_visible=settings.RESOURCE_PUBLISHING,
-                private_groups_not_visibile=settings.GROUP_PRIVATE_RESOURCES)
-
-            filter_set_ids = filter_set.values_list('id')
-            # Do the query using the filterset and the query term. Facet the
-            # results
-            if len(filter_set) > 0:
-                sqs = sqs.filter(id__in=filter_set_ids).facet('type').facet('subtype').facet(
-                    'owner') .facet('keywords').facet('regions').facet('category')
+            if getattr(settings, 'HAYSTACK_PERMS_FIELDS', False):
+                # Filter the results on the permission fields of the documents
+                sqs = self.apply_haystack_perms_filters(sqs, request.user if request else None)
             else:
-                sqs = None
-        else:
+                # the documents indexed before the permission fields were added do not have them
+                filter_set = get_objects_for_user(
+                    request.user, 'base.view_resourcebase')
+
+                filter_set = get_visible_resources(
+                    filter_set,
+                    request.user if request else None,
+                    admin_approval_required=settings.ADMIN_MODERATE_UPLOADS,
+                    unpublished_not_visible=settings.RESOURCE_PUBLISHING,
+                    private_groups_not_visibile=settings.GROUP_PRIVATE_RESOURCES)
+
+                filter_set_ids = filter_set.values_list('id')
+                if len(filter_set) > 0:
+                    sqs = sqs.filter(id__in=filter_set_ids)
+                else:
+                    sqs = None
+
+        if sqs is not None:
             sqs = sqs.facet('type').facet('subtype').facet(
                 'owner').facet('keywords').facet('regions').facet('category')
 
         if sqs:
             # Build the Facet dict
             facets = {}
-            for facet in sqs.facet_counts()['fields']:
+            facet_counts = sqs.facet_counts()
+            for facet in facet_counts.get('fields', {}):
                 facets[facet] = {}
-                for item in sqs.facet_counts()['fields'][facet]:
+                for item in facet_counts['fields'][facet]:
                     facets[facet][item[0]] = item[1]
 
             # Paginate the results
@@ -612,6 +685,20 @@ class CommonModelApi(ModelResource):
 
         return formatted_objects
 
+    def get_viewable_objects_ids(self, request, objects):
+        """
+        Returns the ids of the ``objects`` the request user is allowed to view.
+
+        The object permissions of the whole page are resolved with a single
+        query instead of a ``has_perm`` check for each object.
+        """
+        return set(
+            ResourceBase.objects.filter(
+                id__in=[obj.id for obj in objects]
+            ).filter(
+                get_resources_with_perms_filter(request.user)
+            ).values_list('id', flat=True))
+
     def create_response(
             self,
             request,
@@ -625,29 +712,21 @@ class CommonModelApi(ModelResource):
         Mostly a useful shortcut/hook.
         """
 
-        # If an user does not have at least view permissions, he won't be able
-        # to see the resource at all.
-        filtered_objects_ids = None
-        try:
-            if data['objects']:
-                filtered_objects_ids = [
-                    item.id for item in data['objects'] if request.user.has_perm(
-                        'view_resourcebase', item.get_self_resource())]
-        except Exception:
-            pass
-
         if isinstance(
                 data,
                 dict) and 'objects' in data and not isinstance(
                 data['objects'],
                 list):
-            if filtered_objects_ids:
-                data['objects'] = [
-                    x for x in list(
-                        self.format_objects(
-                            data['objects'])) if x['id'] in filtered_objects_ids]
-            else:
-                data['objects'] = list(self.format_objects(data['objects']))
+            # If an user does not have at least view permissions, he won't be able
+            # to see the resource at all.
+            objects = data['objects']
+            if objects:
+                try:
+                    viewable_ids = self.get_viewable_objects_ids(request, objects)
+                    objects = [obj for obj in objects if obj.id in viewable_ids]
+                except Exception:
+                    pass
+            data['objects'] = list(self.format_objects(objects))
 
             # give geonode version
             data['geonode_version'] = get_version()
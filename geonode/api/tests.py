@@ -88,6 +88,31 @@ class PermissionsApiTests(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
         self.assertValidJSONResponse(resp)
         self.assertEqual(len(self.deserialize(resp)['objects']), 8)
 
+    def test_viewable_objects_ids(self):
+        """
+        Test that the page permissions are resolved with a single query and
+        match the per-object has_perm check
+        """
+        from django.test.client import RequestFactory
+        from geonode.api.resourcebase_api import LayerResource
+
+        perm_spec = {"users": {"admin": ['view_resourcebase']}, "groups": {}}
+        layer = Layer.objects.all()[0]
+        layer.set_permissions(perm_spec)
+        bobby = get_user_model().objects.get(username='bobby')
+        request = RequestFactory().get(self.list_url)
+        request.user = bobby
+
+        objects = list(Layer.objects.all())
+        # warm up the content types cache
+        LayerResource().get_viewable_objects_ids(request, objects)
+        with self.assertNumQueries(1):
+            viewable_ids = LayerResource().get_viewable_objects_ids(request, objects)
+        self.assertNotIn(layer.id, viewable_ids)
+        self.assertEqual(
+            viewable_ids,
+            set(obj.id for obj in objects if bobby.has_perm('view_resourcebase', obj.get_self_resource())))
+
     def test_layer_get_list_layer_private_to_one_user(self):
         """
         Test that if a layer is only visible by admin, then does not appear
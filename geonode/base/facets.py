@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2020 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+import json
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Count
+
+logger = logging.getLogger(__name__)
+
+FACETS_CACHE_VERSION_KEY = 'geonode_facets_version'
+
+
+def invalidate_facets_cache(*args, **kwargs):
+    """
+    Invalidates all the cached facet counts at once by bumping the version
+    stored along with the cache keys.
+    Can be connected directly to model signals.
+    """
+    try:
+        cache.incr(FACETS_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(FACETS_CACHE_VERSION_KEY, 1, None)
+
+
+def user_groups_changed(sender, **kwargs):
+    """
+    Invalidates the cached facet counts when the groups of a user change.
+    Connected to m2m_changed: the through model of the users groups is only
+    known once the apps are loaded.
+    """
+    from django.contrib.auth import get_user_model
+    if sender is get_user_model().groups.through:
+        invalidate_facets_cache()
+
+
+def get_permissions_fingerprint(user):
+    """
+    Returns a string identifying the set of resources visible to ``user``.
+    Superusers and anonymous users share their fingerprint since they all
+    see the very same resources.
+    """
+    if not user or user.is_anonymous:
+        return 'anonymous'
+    if user.is_superuser:
+        return 'superuser'
+    return 'user-{}'.format(user.pk)
+
+
+def get_cached_counts(user, filters, compute):
+    """
+    Returns the counts computed by ``compute()`` caching them for the given
+    ``user`` permissions fingerprint and ``filters`` set.
+    """
+    version = cache.get(FACETS_CACHE_VERSION_KEY) or 0
+    key = 'geonode_facets_{}'.format(hashlib.md5(json.dumps(
+        [version, get_permissions_fingerprint(user), filters],
+        sort_keys=True, default=str).encode('utf-8')).hexdigest())
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute()
+        cache.set(key, counts, getattr(settings, 'FACETS_CACHE_TIMEOUT', 60))
+    return counts
+
+
+def get_facets_filters(request):
+    """
+    Extracts the facets filters from the request query string.
+    """
+    return {
+        'title': request.GET.get('title__icontains', ''),
+        'extent': request.GET.get('extent', None),
+        'keywords': request.GET.getlist('keywords__slug__in', None),
+        'category': request.GET.getlist('category__identifier__in', None),
+        'regions': request.GET.getlist('regions__name__in', None),
+        'owner': request.GET.getlist('owner__username__in', None),
+        'date_gte': request.GET.get('date__gte', None),
+        'date_lte': request.GET.get('date__lte', None),
+        'date_range': request.GET.get('date__range', None),
+    }
+
+
+def filter_resources(queryset, user, filters):
+    """
+    Applies the facets ``filters`` and the ``user`` visibility rules to a
+    ResourceBase ``queryset``.
+    """
+    from guardian.shortcuts import get_objects_for_user
+    from geonode.base.models import HierarchicalKeyword
+    from geonode.base.bbox_utils import filter_bbox
+    from geonode.security.utils import get_visible_resources
+
+    if filters.get('title'):
+        queryset = queryset.filter(title__icontains=filters['title'])
+    if filters.get('category'):
+        queryset = queryset.filter(category__identifier__in=filters['category'])
+    if filters.get('regions'):
+        queryset = queryset.filter(regions__name__in=filters['regions'])
+    if filters.get('owner'):
+        queryset = queryset.filter(owner__username__in=filters['owner'])
+    if filters.get('date_gte'):
+        queryset = queryset.filter(date__gte=filters['date_gte'])
+    if filters.get('date_lte'):
+        queryset = queryset.filter(date__lte=filters['date_lte'])
+    if filters.get('date_range'):
+        queryset = queryset.filter(date__range=filters['date_range'].split(','))
+
+    queryset = get_visible_resources(
+        queryset,
+        user,
+        admin_approval_required=settings.ADMIN_MODERATE_UPLOADS,
+        unpublished_not_visible=settings.RESOURCE_PUBLISHING,
+        private_groups_not_visibile=settings.GROUP_PRIVATE_RESOURCES)
+
+    if filters.get('extent'):
+        queryset = filter_bbox(queryset, filters['extent'])
+
+    if filters.get('keywords'):
+        treeqs = HierarchicalKeyword.objects.none()
+        for keyword in filters['keywords']:
+            try:
+                kws = HierarchicalKeyword.objects.filter(name__iexact=keyword)
+                for kw in kws:
+                    treeqs = treeqs | HierarchicalKeyword.get_tree(kw)
+            except Exception:
+                # Ignore keywords not actually used?
+                pass
+
+        queryset = queryset.filter(Q(keywords__in=treeqs))
+
+    if not settings.SKIP_PERMS_FILTER:
+        try:
+            authorized = get_objects_for_user(
+                user, 'base.view_resourcebase').values('id')
+            queryset = queryset.filter(id__in=authorized)
+        except Exception:
+            queryset = queryset.none()
+
+    return queryset
+
+
+def _compute_facets_counts(user, filters):
+    from geonode.base.models import ResourceBase
+
+    resources = filter_resources(ResourceBase.objects.all(), user, filters)
+    rows = resources.order_by().values(
+        'polymorphic_ctype__model',
+        'layer__storeType',
+        'layer__has_time',
+        'document__doc_type'
+    ).annotate(count=Count('id', distinct=True))
+
+    counts = {
+        'layer': {},
+        'vector_time': 0,
+        'map': 0,
+        'document': 0,
+        'doc_type': {},
+    }
+    for row in rows:
+        model = row['polymorphic_ctype__model']
+        if model == 'layer':
+            store_type = row['layer__storeType']
+            counts['layer'][store_type] = counts['layer'].get(store_type, 0) + row['count']
+            if store_type == 'dataStore' and row['layer__has_time']:
+                counts['vector_time'] += row['count']
+        elif model == 'map':
+            counts['map'] += row['count']
+        elif model == 'document':
+            counts['document'] += row['count']
+            doc_type = row['document__doc_type']
+            if doc_type is not None:
+                counts['doc_type'][doc_type] = counts['doc_type'].get(doc_type, 0) + row['count']
+    return counts
+
+
+def get_facets_counts(user, filters):
+    """
+    Returns the number of resources visible to ``user`` matching ``filters``,
+    grouped by resource type, layer storeType, time dimension and document
+    type.
+
+    All the counts are computed by a single grouped query over ResourceBase
+    and cached until the next change to resources or object permissions.
+    """
+    return get_cached_counts(
+        user, ['facets', filters], lambda: _compute_facets_counts(user, filters))
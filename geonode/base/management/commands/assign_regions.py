@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from geonode.base.facets import invalidate_facets_cache
+from geonode.base.models import ResourceBase
+from geonode.base.regions import get_regions_index
+
+
+class Command(BaseCommand):
+
+    help = """
+    Assigns the regions intersecting their bounding box to the resources
+    which have no region yet (or to all of them with --overwrite).
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--overwrite',
+            dest='overwrite',
+            action='store_true',
+            default=False,
+            help='Replace the regions of the resources already having some.'
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=500,
+            help='Number of resources updated at once. Default: 500'
+        )
+
+    def handle(self, *args, **options):
+        overwrite = options.get('overwrite')
+        batch_size = options.get('batch_size')
+        index = get_regions_index()
+        through = ResourceBase.regions.through
+
+        queryset = ResourceBase.objects.filter(bbox_polygon__isnull=False)
+        if not overwrite:
+            queryset = queryset.filter(regions__isnull=True)
+        resources = queryset.order_by('id').values_list('id', 'bbox_polygon')
+
+        def _flush(batch):
+            with transaction.atomic():
+                if overwrite:
+                    through.objects.filter(resourcebase_id__in=[_id for _id, _ in batch]).delete()
+                through.objects.bulk_create([
+                    through(resourcebase_id=_id, region_id=region_id)
+                    for _id, regions in batch for region_id in regions], ignore_conflicts=True)
+
+        updated = 0
+        batch = []
+        for _id, bbox_polygon in resources.iterator():
+            batch.append((_id, index.get_regions_for(bbox_polygon)))
+            if len(batch) >= batch_size:
+                _flush(batch)
+                updated += len(batch)
+                batch = []
+        if batch:
+            _flush(batch)
+            updated += len(batch)
+
+        if updated:
+            invalidate_facets_cache()
+        print("Regions assigned to %s resources (%s regions indexed)" % (updated, len(index)))
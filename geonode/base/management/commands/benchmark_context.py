@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+
+from django.conf import settings
+from django.test import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+import geonode
+from geonode import version
+
+
+def _timeit(func, count):
+    start = time.time()
+    for _ in range(count):
+        func()
+    return (time.time() - start) / count * 1000.0
+
+
+class Command(BaseCommand):
+
+    help = """
+    Measures the time spent resolving the GeoNode version, with and without
+    the process-level memoization, and running the template context
+    processors once per request and once per rendered template.
+    The database is left untouched.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c',
+            '--count',
+            dest='count',
+            type=int,
+            default=100,
+            help='Number of iterations. Default: 100'
+        )
+        parser.add_argument(
+            '-t',
+            '--templates',
+            dest='templates',
+            type=int,
+            default=5,
+            help='Number of templates rendered by each request. Default: 5'
+        )
+
+    def handle(self, *args, **options):
+        count = options.get('count')
+        templates = options.get('templates')
+
+        def _uncached_version():
+            version.get_git_changeset.cache_clear()
+            return version.get_version(geonode.__version__)
+
+        print("get_version uncached: %.3fms" % _timeit(_uncached_version, count))
+        print("get_version memoized: %.3fms" % _timeit(geonode.get_version, count))
+
+        processors = [
+            import_string(_p) for _p in settings.TEMPLATES[0]['OPTIONS']['context_processors']]
+        factory = RequestFactory()
+
+        def _request():
+            request = factory.get('/')
+            request.user = AnonymousUser()
+            for _ in range(templates):
+                for processor in processors:
+                    processor(request)
+
+        def _uncached_request():
+            request = factory.get('/')
+            request.user = AnonymousUser()
+            for _ in range(templates):
+                # a new cache for every template, as before the request caching
+                request._context_processors_cache = {}
+                for processor in processors:
+                    processor(request)
+
+        print("[%s templates] context processors uncached: %.3fms per request" % (
+            templates, _timeit(_uncached_request, count)))
+        print("[%s templates] context processors request cached: %.3fms per request" % (
+            templates, _timeit(_request, count)))
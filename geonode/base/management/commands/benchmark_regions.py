@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import re
+import time
+import random
+
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.core.management.base import BaseCommand
+
+from geonode.base.models import Region
+from geonode.base.regions import RegionsIndex
+
+
+def _legacy_regions_for(bbox_polygon):
+    """
+    The former per-resource check: every region bounding box is parsed,
+    transformed and intersected.
+    """
+    regions = []
+    for region in Region.objects.all().order_by('name'):
+        srid, wkt = region.geographic_bounding_box.split(";")
+        srid = re.findall(r'\d+', srid)
+        poly = GEOSGeometry(wkt, srid=int(srid[0]))
+        poly.transform(4326)
+        if poly.intersects(bbox_polygon):
+            regions.append(region.id)
+    return regions
+
+
+class Command(BaseCommand):
+
+    help = """
+    Compares the time spent looking up the regions intersecting random
+    bounding boxes with the regions index and with the former loop on
+    all the regions. The database is left untouched.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c',
+            '--count',
+            dest='count',
+            type=int,
+            default=100,
+            help='Number of random bounding boxes. Default: 100'
+        )
+        parser.add_argument(
+            '--skip-legacy',
+            dest='skip_legacy',
+            action='store_true',
+            default=False,
+            help='Do not run the former loop on all the regions.'
+        )
+
+    def handle(self, *args, **options):
+        count = options.get('count')
+        bboxes = []
+        for _ in range(count):
+            x0, y0 = random.uniform(-180, 170), random.uniform(-90, 80)
+            bboxes.append(Polygon.from_bbox(
+                (x0, y0, x0 + random.uniform(0.1, 10), y0 + random.uniform(0.1, 10))))
+            bboxes[-1].srid = 4326
+
+        start = time.time()
+        index = RegionsIndex(Region.objects.all())
+        elapsed = time.time() - start
+        print("[%s regions] index built in %.3fs" % (len(index), elapsed))
+
+        start = time.time()
+        matches = sum(len(index.intersecting(bbox)) for bbox in bboxes)
+        elapsed = time.time() - start
+        print("[%s bboxes] index: %s matches in %.3fs" % (count, matches, elapsed))
+
+        if not options.get('skip_legacy'):
+            start = time.time()
+            matches = sum(len(_legacy_regions_for(bbox)) for bbox in bboxes)
+            elapsed = time.time() - start
+            print("[%s bboxes] regions loop: %s matches in %.3fs" % (count, matches, elapsed))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.core.management.base import BaseCommand
+
+from geonode.base.models import ThumbnailFile
+from geonode.base.thumb_utils import get_thumbs, get_thumb_name, thumb_path
+
+
+class Command(BaseCommand):
+
+    help = """
+    Records the thumbnails already stored, so that they can be found and
+    removed without listing the thumbnails folder.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=1000,
+            help='Number of thumbnails recorded at once. Default: 1000'
+        )
+
+    def handle(self, *args, **options):
+        thumbs = get_thumbs()
+        ThumbnailFile.objects.bulk_create([
+            ThumbnailFile(name=get_thumb_name(filename), path=thumb_path(filename))
+            for filename in thumbs], batch_size=options.get('batch_size'), ignore_conflicts=True)
+        print("%s thumbnails indexed" % len(thumbs))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from geonode.base.search import rebuild_search_index, SEARCH_INDEX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+
+    help = """
+    Clears and rebuilds the haystack search index with parallel workers,
+    each one indexing batches of instances loaded with their related objects.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-w',
+            '--workers',
+            dest='workers',
+            type=int,
+            default=4,
+            help='Number of indexing threads. Default: 4'
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=SEARCH_INDEX_BATCH_SIZE,
+            help='Number of instances indexed at once. Default: %s' % SEARCH_INDEX_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--no-clear',
+            dest='clear',
+            action='store_false',
+            default=True,
+            help='Update the documents without clearing the index first.'
+        )
+
+    def handle(self, *args, **options):
+        start = time.time()
+        counts = rebuild_search_index(
+            workers=options.get('workers'),
+            batch_size=options.get('batch_size'),
+            clear=options.get('clear'))
+        for model, count in counts.items():
+            print("%s: %s documents indexed" % (model.__name__, count))
+        print("Search index rebuilt in %.3fs" % (time.time() - start))
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.16 on 2020-12-01 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0048_auto_20201116_0914'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('path', models.CharField(max_length=512, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -35,7 +35,7 @@ from django.db.models import Q, signals
 from django.contrib.auth.models import Group
 from django.core.files.base import ContentFile
 from django.contrib.auth import get_user_model
-from django.contrib.gis.geos import GEOSGeometry, Polygon, Point
+from django.contrib.gis.geos import Polygon, Point
 from django.contrib.gis.db.models import PolygonField
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
@@ -55,6 +55,7 @@ from pinax.ratings.models import OverallRating
 from taggit.models import TagBase, ItemBase
 from taggit.managers import TaggableManager, _TaggableManager
 
+from guardian.models import UserObjectPermission, GroupObjectPermission
 from guardian.shortcuts import get_anonymous_user, get_objects_for_user
 from treebeard.mp_tree import MP_Node, MP_NodeQuerySet, MP_NodeManager
 
@@ -66,12 +67,15 @@ from geonode.base.enumerations import (
     UPDATE_FREQUENCIES,
     DEFAULT_SUPPLEMENTAL_INFORMATION)
 from geonode.base.bbox_utils import BBOXHelper
+from geonode.base.facets import invalidate_facets_cache, user_groups_changed
+from geonode.base.regions import get_regions_index, invalidate_regions_cache
 from geonode.utils import (
     add_url_params,
     bbox_to_wkt)
-from geonode.groups.models import GroupProfile
+from geonode.groups.models import GroupProfile, GroupMember
 from geonode.security.utils import get_visible_resources
 from geonode.security.models import PermissionLevelMixin
+from geonode.security.signals import permissions_bulk_changed
 
 from geonode.notifications_helper import (
     send_notification,
@@ -79,7 +83,9 @@ from geonode.notifications_helper import (
 from geonode.people.enumerations import ROLE_VALUES
 from geonode.base.thumb_utils import (
     thumb_path,
-    remove_thumbs)
+    remove_thumbs,
+    register_thumb,
+    encode_thumbnail)
 
 from pyproj import transform, Proj
 
@@ -1437,6 +1443,12 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin, ItemBase):
             remove_thumbs(name)
 
             if upload_path and image:
+                # Optimize the Thumbnail size and resolution
+                try:
+                    image = encode_thumbnail(image)
+                except Exception as e:
+                    logger.debug(e)
+
                 actual_name = storage.save(upload_path, ContentFile(image))
                 url = storage.url(actual_name)
                 _url = urlparse(url)
@@ -1449,25 +1461,10 @@ class ResourceBase(PolymorphicModel, PermissionLevelMixin, ItemBase):
                             storage.path(upload_path),
                             storage.path(_upload_path)
                         )
+                        actual_name = _upload_path
                     except Exception as e:
                         logger.debug(e)
-
-                try:
-                    # Optimize the Thumbnail size and resolution
-                    from PIL import Image
-                    from resizeimage import resizeimage
-                    _default_thumb_size = getattr(
-                        settings, 'THUMBNAIL_GENERATOR_DEFAULT_SIZE', {'width': 240, 'height': 200})
-                    im = Image.open(open(storage.path(_upload_path), mode='rb'))
-                    im.thumbnail(
-                        (_default_thumb_size['width'], _default_thumb_size['height']),
-                        resample=Image.ANTIALIAS)
-                    cover = resizeimage.resize_cover(
-                        im,
-                        [_default_thumb_size['width'], _default_thumb_size['height']])
-                    cover.save(storage.path(_upload_path), format='JPEG')
-                except Exception as e:
-                    logger.debug(e)
+                register_thumb(name, actual_name)
 
                 # check whether it is an URI or not
                 parsed = urlsplit(url)
@@ -1795,6 +1792,40 @@ class CuratedThumbnail(models.Model):
         return self.img_thumbnail.url
 
 
+class ThumbnailFile(models.Model):
+    """
+    Keeps track of the thumbnail files saved in storage, so that they can be
+    found and removed without listing the whole thumbnails folder.
+    """
+    # the thumbnail file name without extension, e.g. 'layer-<uuid>-thumb'
+    name = models.CharField(max_length=255, db_index=True)
+    # the actual path of the file in storage
+    path = models.CharField(max_length=512, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{0}".format(self.path)
+
+
+class SearchIndexUpdate(models.Model):
+    """
+    A pending update of the search document of a model instance, applied by
+    the next flush of the queue (see geonode.base.search). There is at most
+    one entry per instance, whatever the number of times it has been saved.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    # the document is to be removed from the index
+    remove = models.BooleanField(default=False)
+    queued = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = (('content_type', 'object_id'),)
+
+    def __str__(self):
+        return "{0}.{1}".format(self.content_type_id, self.object_id)
+
+
 class Configuration(SingletonModel):
     """
     A model used for managing the Geonode instance's global configuration,
@@ -1873,38 +1904,11 @@ def resourcebase_post_save(instance, *args, **kwargs):
         instance.set_missing_info()
 
     try:
-        if not instance.regions or instance.regions.count() == 0:
-            srid1, wkt1 = instance.geographic_bounding_box.split(";")
-            srid1 = re.findall(r'\d+', srid1)
-
-            poly1 = GEOSGeometry(wkt1, srid=int(srid1[0]))
-            poly1.transform(4326)
-
-            queryset = Region.objects.all().order_by('name')
-            global_regions = []
-            regions_to_add = []
-            for region in queryset:
-                try:
-                    srid2, wkt2 = region.geographic_bounding_box.split(";")
-                    srid2 = re.findall(r'\d+', srid2)
-
-                    poly2 = GEOSGeometry(wkt2, srid=int(srid2[0]))
-                    poly2.transform(4326)
-
-                    if poly2.intersection(poly1):
-                        regions_to_add.append(region)
-                    if region.level == 0 and region.parent is None:
-                        global_regions.append(region)
-                except Exception:
-                    tb = traceback.format_exc()
-                    if tb:
-                        logger.debug(tb)
-            if regions_to_add or global_regions:
-                if regions_to_add and len(
-                        regions_to_add) > 0 and len(regions_to_add) <= 30:
-                    instance.regions.add(*regions_to_add)
-                else:
-                    instance.regions.add(*global_regions)
+        if instance.bbox_polygon and (not instance.regions or instance.regions.count() == 0):
+            regions = get_regions_index().get_regions_for(instance.bbox_polygon)
+            if regions:
+                # the index may be a bit behind the regions table
+                instance.regions.add(*Region.objects.filter(id__in=regions))
     except Exception:
         tb = traceback.format_exc()
         if tb:
@@ -1913,6 +1917,8 @@ def resourcebase_post_save(instance, *args, **kwargs):
         # refresh catalogue metadata records
         from geonode.catalogue.models import catalogue_post_save
         catalogue_post_save(instance=instance, sender=instance.__class__)
+        # cached facet counts may be stale now
+        invalidate_facets_cache()
 
 
 def rating_post_save(instance, *args, **kwargs):
@@ -1925,3 +1931,26 @@ def rating_post_save(instance, *args, **kwargs):
 
 
 signals.post_save.connect(rating_post_save, sender=OverallRating)
+signals.post_delete.connect(invalidate_facets_cache, sender=ResourceBase)
+signals.post_save.connect(invalidate_facets_cache, sender=UserObjectPermission)
+signals.post_delete.connect(invalidate_facets_cache, sender=UserObjectPermission)
+signals.post_save.connect(invalidate_facets_cache, sender=GroupObjectPermission)
+signals.post_delete.connect(invalidate_facets_cache, sender=GroupObjectPermission)
+permissions_bulk_changed.connect(invalidate_facets_cache)
+# the resources visible to a user depend on the groups it belongs to
+signals.m2m_changed.connect(user_groups_changed)
+signals.post_save.connect(invalidate_facets_cache, sender=GroupMember)
+signals.post_delete.connect(invalidate_facets_cache, sender=GroupMember)
+signals.post_save.connect(invalidate_facets_cache, sender=GroupProfile)
+signals.post_save.connect(invalidate_regions_cache, sender=Region)
+signals.post_delete.connect(invalidate_regions_cache, sender=Region)
+
+if settings.HAYSTACK_SEARCH:
+    # keep the permission fields of the search documents up to date
+    from geonode.security.search_indexes import (
+        object_permission_changed,
+        resources_permissions_bulk_changed)
+    for _model in (UserObjectPermission, GroupObjectPermission):
+        signals.post_save.connect(object_permission_changed, sender=_model)
+        signals.post_delete.connect(object_permission_changed, sender=_model)
+    permissions_bulk_changed.connect(resources_permissions_bulk_changed)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2020 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+"""
+Spatial index of the metadata regions used to automatically assign the
+regions intersecting the bounding box of a resource.
+
+The region bounding boxes are parsed and transformed to EPSG:4326 once and
+kept in an in-process STRtree. Any change to the regions bumps a version
+number which makes every process rebuild its index on the next lookup.
+"""
+import re
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.gis.geos import GEOSGeometry
+
+from shapely import wkb
+from shapely.strtree import STRtree
+
+logger = logging.getLogger(__name__)
+
+REGIONS_CACHE_VERSION_KEY = 'geonode_regions_version'
+
+# above this number of intersecting regions the resource is considered global
+MAX_REGIONS = getattr(settings, 'MAX_AUTO_ASSIGNED_REGIONS', 30)
+
+
+def invalidate_regions_cache(*args, **kwargs):
+    """
+    Makes all the processes rebuild their regions index.
+    Can be connected directly to model signals.
+    """
+    try:
+        cache.incr(REGIONS_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(REGIONS_CACHE_VERSION_KEY, 1, None)
+
+
+def _to_4326(ewkt):
+    srid, wkt = ewkt.split(";")
+    srid = re.findall(r'\d+', srid)
+    geometry = GEOSGeometry(wkt, srid=int(srid[0]))
+    if geometry.srid != 4326:
+        geometry.transform(4326)
+    return geometry
+
+
+class RegionsIndex(object):
+    """
+    STRtree of the regions bounding boxes in EPSG:4326.
+    """
+
+    def __init__(self, regions):
+        self.global_regions = []
+        self._ids = {}
+        geometries = []
+        for region in regions:
+            try:
+                geometry = wkb.loads(bytes(_to_4326(region.geographic_bounding_box).wkb))
+            except Exception:
+                tb = traceback.format_exc()
+                if tb:
+                    logger.debug(tb)
+                continue
+            self._ids[id(geometry)] = region.id
+            geometries.append(geometry)
+            if region.level == 0 and region.parent_id is None:
+                self.global_regions.append(region.id)
+        # keep a reference to the geometries, the tree relies on their identity
+        self._geometries = geometries
+        self._tree = STRtree(geometries) if geometries else None
+
+    def __len__(self):
+        return len(self._geometries)
+
+    def intersecting(self, geometry):
+        """
+        Returns the ids of the regions intersecting ``geometry``,
+        a GEOS geometry with a SRID.
+        """
+        if self._tree is None:
+            return []
+        if geometry.srid and geometry.srid != 4326:
+            geometry = geometry.transform(4326, clone=True)
+        geometry = wkb.loads(bytes(geometry.wkb))
+        return [
+            self._ids[id(candidate)] for candidate in self._tree.query(geometry)
+            if candidate.intersects(geometry)]
+
+    def get_regions_for(self, geometry):
+        """
+        Returns the ids of the regions to be assigned to a resource whose
+        bounding box is ``geometry``: the intersecting regions or, when there
+        are too many of them, the global ones.
+        """
+        regions = self.intersecting(geometry)
+        if regions and len(regions) <= MAX_REGIONS:
+            return regions
+        return self.global_regions
+
+
+_index_lock = threading.Lock()
+_index = (None, None)
+
+
+def get_regions_index():
+    """
+    Returns the regions index of the current process, rebuilding it if the
+    regions have changed since it was built.
+    """
+    global _index
+    from geonode.base.models import Region
+
+    version = cache.get(REGIONS_CACHE_VERSION_KEY) or 0
+    with _index_lock:
+        if _index[0] != version or _index[1] is None:
+            regions = Region.objects.only(
+                'id', 'level', 'parent', 'bbox_x0', 'bbox_x1', 'bbox_y0', 'bbox_y1', 'srid')
+            _index = (version, RegionsIndex(regions))
+        return _index[1]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+"""
+Queued updates of the haystack search index.
+
+Instead of updating the search documents within the request which saved
+the model instances, the QueuedSignalProcessor only records the instances
+to be updated or removed in the SearchIndexUpdate table: saving the same
+instance many times queues a single update. The queue is flushed in
+batches, one bulk request to the search engine per model, by the periodic
+``flush_search_index_queue`` task.
+"""
+import logging
+
+from itertools import islice
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection, models
+from django.utils import timezone
+from django.contrib.contenttypes.models import ContentType
+
+from haystack import connections
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_BATCH_SIZE = getattr(settings, 'HAYSTACK_BATCH_SIZE', 1000)
+
+
+def _get_index(model):
+    try:
+        return connections['default'].get_unified_index().get_index(model)
+    except NotHandled:
+        return None
+
+
+def _get_indexed_content_type(instance):
+    """
+    The content type of the index of ``instance``, resolving the actual
+    model of the resources saved through their ResourceBase.
+    """
+    ctype_id = getattr(instance, 'polymorphic_ctype_id', None)
+    if ctype_id:
+        ctype = ContentType.objects.get_for_id(ctype_id)
+    else:
+        ctype = ContentType.objects.get_for_model(instance)
+    model = ctype.model_class()
+    if model is None or _get_index(model) is None:
+        return None
+    return ctype
+
+
+def queue_search_index_updates(instances, remove=False):
+    """
+    Queues the update, or the removal, of the search documents of
+    ``instances``. The instances of models which are not indexed are skipped.
+    """
+    from geonode.base.models import SearchIndexUpdate
+
+    by_ctype = defaultdict(set)
+    for instance in instances:
+        if instance.pk is None:
+            continue
+        ctype = _get_indexed_content_type(instance)
+        if ctype is not None:
+            by_ctype[ctype].add(instance.pk)
+    for ctype, ids in by_ctype.items():
+        # the entries already in the queue are refreshed, the others created
+        SearchIndexUpdate.objects.filter(
+            content_type=ctype, object_id__in=ids).update(remove=remove, queued=timezone.now())
+        SearchIndexUpdate.objects.bulk_create(
+            [SearchIndexUpdate(content_type=ctype, object_id=_id, remove=remove) for _id in ids],
+            ignore_conflicts=True)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    Haystack signal processor queuing the updates of the search documents
+    of the saved and deleted instances.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def handle_save(self, sender, instance, **kwargs):
+        queue_search_index_updates([instance])
+
+    def handle_delete(self, sender, instance, **kwargs):
+        queue_search_index_updates([instance], remove=True)
+
+
+def _update_documents(index, ids):
+    """
+    Updates the documents of the instances ``ids`` of the model of
+    ``index``, removing those whose instance does not exist anymore.
+
+    :return: The number of documents updated and removed
+    :rtype: int
+    """
+    backend = connections['default'].get_backend()
+    model = index.get_model()
+    instances = list(index.index_queryset().filter(pk__in=ids))
+    if instances:
+        backend.update(index, instances)
+    for _id in set(ids) - set(_i.pk for _i in instances):
+        backend.remove('{}.{}.{}'.format(model._meta.app_label, model._meta.model_name, _id))
+    return len(ids)
+
+
+def _index_batch(index, ids):
+    try:
+        return _update_documents(index, ids)
+    finally:
+        # the indexing threads must not leak their connections
+        connection.close()
+
+
+def flush_search_index_queue(batch_size=None):
+    """
+    Applies the queued updates of the search documents, batch_size entries
+    at a time with one request to the search engine per model and action.
+    The entries queued again meanwhile are kept for the next flush, as well
+    as those whose update failed.
+
+    :return: Tuple (updated, removed) number of documents
+    :rtype: tuple
+    """
+    from geonode.base.models import SearchIndexUpdate
+
+    batch_size = batch_size or SEARCH_INDEX_BATCH_SIZE
+    backend = connections['default'].get_backend()
+    start = timezone.now()
+    updated = removed = 0
+    last_id = 0
+    while True:
+        entries = list(
+            SearchIndexUpdate.objects.filter(queued__lt=start, id__gt=last_id).order_by('id')[:batch_size])
+        if not entries:
+            break
+        last_id = entries[-1].id
+        done = []
+        batches = defaultdict(list)
+        for entry in entries:
+            batches[(entry.content_type_id, entry.remove)].append(entry)
+        for (ctype_id, remove), batch in batches.items():
+            model = ContentType.objects.get_for_id(ctype_id).model_class()
+            index = _get_index(model) if model is not None else None
+            try:
+                if index is None:
+                    pass
+                elif remove:
+                    for entry in batch:
+                        backend.remove('{}.{}.{}'.format(
+                            model._meta.app_label, model._meta.model_name, entry.object_id))
+                    removed += len(batch)
+                else:
+                    updated += _update_documents(index, [_e.object_id for _e in batch])
+                done.extend(_e.id for _e in batch)
+            except Exception as e:
+                logger.exception(e)
+        SearchIndexUpdate.objects.filter(id__in=done, queued__lt=start).delete()
+    if updated or removed:
+        logger.debug("Search index: {} documents updated, {} removed".format(updated, removed))
+    return updated, removed
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def rebuild_search_index(workers=4, batch_size=None, clear=True):
+    """
+    Rebuilds the search index with ``workers`` threads, each one indexing
+    batches of batch_size instances. The ids of the instances are streamed
+    from the database, each batch is then loaded with the related objects
+    its documents need (see the ``index_queryset`` of the indexes).
+
+    :return: The number of indexed instances by model
+    :rtype: dict
+    """
+    from geonode.base.models import SearchIndexUpdate
+
+    batch_size = batch_size or SEARCH_INDEX_BATCH_SIZE
+    backend = connections['default'].get_backend()
+    # the queued updates are superseded by the rebuild
+    SearchIndexUpdate.objects.filter(queued__lt=timezone.now()).delete()
+    if clear:
+        backend.clear()
+    if hasattr(backend, 'setup'):
+        # create the index before the workers try to
+        backend.setup()
+
+    counts = defaultdict(int)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for index in connections['default'].get_unified_index().get_indexes().values():
+            ids = index.index_queryset().order_by('pk').values_list('pk', flat=True).iterator()
+            for batch in _chunks(ids, batch_size):
+                futures[executor.submit(_index_batch, index, batch)] = index.get_model()
+        for future in as_completed(futures):
+            model = futures[future]
+            try:
+                counts[model] += future.result()
+            except Exception as e:
+                logger.exception(e)
+    return dict(counts)
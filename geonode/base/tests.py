@@ -19,7 +19,9 @@
 #########################################################################
 
 import os
-from unittest.mock import patch
+import time
+import threading
+from unittest.mock import Mock, patch
 
 from guardian.shortcuts import assign_perm, get_perms
 from imagekit.cachefiles.backends import Simple
@@ -33,7 +35,8 @@ from geonode.maps.models import Map
 from geonode.services.models import Service
 from geonode.tests.base import GeoNodeBaseTestSupport
 from geonode.base.models import (
-    ResourceBase, MenuPlaceholder, Menu, MenuItem, Configuration, TopicCategory
+    ResourceBase, MenuPlaceholder, Menu, MenuItem, Configuration, TopicCategory, Region, ThumbnailFile,
+    SearchIndexUpdate
 )
 from django.template import Template, Context
 from django.contrib.auth import get_user_model
@@ -43,10 +46,16 @@ from django.shortcuts import reverse
 from geonode.base.middleware import ReadOnlyMiddleware, MaintenanceMiddleware
 from geonode.base.models import CuratedThumbnail
 from geonode.base.templatetags.base_tags import get_visibile_resources
+from geonode.base.facets import get_facets_counts
+from geonode.base.regions import get_regions_index
+from geonode.base.search import flush_search_index_queue, queue_search_index_updates
+from geonode.base.thumb_utils import ThumbnailRenderer, encode_thumbnail, remove_thumbs
 from geonode import geoserver
 from geonode.decorators import on_ogc_backend
 
 from django.core.files import File
+from django.core.files.storage import default_storage as storage
+from django.contrib.gis.geos import Polygon
 from django.core.management import call_command
 from django.core.management.base import CommandError
 
@@ -64,6 +73,65 @@ class ThumbnailTests(GeoNodeBaseTestSupport):
         missing = self.rb.get_thumbnail_url()
         self.assertTrue('missing_thumb' in os.path.splitext(missing)[0])
 
+    def test_thumbnails_are_recorded(self):
+        content = BytesIO()
+        test_image.save(content, format='PNG')
+        filename = 'layer-%s-thumb.png' % self.rb.uuid
+        self.rb.save_thumbnail(filename, content.getvalue())
+        thumbs = ThumbnailFile.objects.filter(name='layer-%s-thumb' % self.rb.uuid)
+        self.assertEqual(thumbs.count(), 1)
+        path = thumbs.get().path
+        self.assertTrue(storage.exists(path))
+
+        # the previous thumbnail is found without listing the thumbnails folder
+        with patch.object(storage, 'listdir', side_effect=AssertionError):
+            self.rb.save_thumbnail(filename, content.getvalue())
+        self.assertEqual(thumbs.count(), 1)
+        self.assertTrue(storage.exists(thumbs.get().path))
+        remove_thumbs('layer-%s-thumb' % self.rb.uuid)
+        self.assertFalse(thumbs.exists())
+
+
+class ThumbnailRendererTests(SimpleTestCase):
+
+    def test_encode_thumbnail(self):
+        content = BytesIO()
+        test_image.save(content, format='PNG')
+        thumbnail = encode_thumbnail(content.getvalue())
+        im = Image.open(BytesIO(thumbnail))
+        self.assertEqual(im.format, 'JPEG')
+        self.assertEqual(im.size, (240, 200))
+        # already optimized images are not encoded again
+        self.assertIs(encode_thumbnail(thumbnail), thumbnail)
+
+    def test_concurrent_renderings_are_deduplicated(self):
+        renderer = ThumbnailRenderer(max_workers=2)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compose(tiles, width, height):
+            calls.append(tiles)
+            started.set()
+            release.wait(5)
+            return b'image'
+
+        results = []
+        with patch.object(renderer, '_compose', side_effect=compose):
+            first = threading.Thread(target=lambda: results.append(renderer.render('key', [], 240, 200)))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=lambda: results.append(renderer.render('key', [], 240, 200)))
+            second.start()
+            time.sleep(0.1)
+            release.set()
+            first.join()
+            second.join()
+            # a new rendering is performed once the previous one is over
+            renderer.render('key', [], 240, 200)
+        self.assertEqual(results, [b'image', b'image'])
+        self.assertEqual(len(calls), 2)
+
 
 class TestThumbnailUrl(GeoNodeBaseTestSupport):
     def setUp(self):
@@ -806,6 +874,122 @@ class TestGetVisibleResource(TestCase):
         self.assertEqual(categories['iso_formats'].count(), 1)
 
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestFacetsCounts(TestCase):
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create(username='admin', is_superuser=True)
+        Layer.objects.create(owner=self.admin, title='vector', storeType='dataStore')
+        Layer.objects.create(owner=self.admin, title='vector time', storeType='dataStore', has_time=True)
+        Layer.objects.create(owner=self.admin, title='raster', storeType='coverageStore')
+        Map.objects.create(owner=self.admin, title='map', zoom=0, center_x=0.0, center_y=0.0)
+        Document.objects.create(owner=self.admin, title='document', doc_type='pdf')
+
+    def test_facets_counts(self):
+        counts = get_facets_counts(self.admin, {})
+        self.assertEqual(counts['layer'], {'dataStore': 2, 'coverageStore': 1})
+        self.assertEqual(counts['vector_time'], 1)
+        self.assertEqual(counts['map'], 1)
+        self.assertEqual(counts['document'], 1)
+        self.assertEqual(counts['doc_type'], {'pdf': 1})
+
+        counts = get_facets_counts(self.admin, {'title': 'vector'})
+        self.assertEqual(counts['layer'], {'dataStore': 2})
+        self.assertEqual(counts['map'], 0)
+
+    def test_facets_counts_cache_invalidation(self):
+        get_facets_counts(self.admin, {})
+        with self.assertNumQueries(0):
+            counts = get_facets_counts(self.admin, {})
+        self.assertEqual(counts['map'], 1)
+
+        Map.objects.create(owner=self.admin, title='another map', zoom=0, center_x=0.0, center_y=0.0)
+        self.assertEqual(get_facets_counts(self.admin, {})['map'], 2)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_facets_counts_invalidated_on_group_membership(self):
+        from django.core.cache import cache
+        from django.contrib.auth.models import Group
+        from geonode.base.facets import FACETS_CACHE_VERSION_KEY
+        user = get_user_model().objects.create(username='member')
+        group = Group.objects.create(name='members')
+        version = cache.get(FACETS_CACHE_VERSION_KEY) or 0
+        user.groups.add(group)
+        self.assertNotEqual(cache.get(FACETS_CACHE_VERSION_KEY) or 0, version)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TestRegionsIndex(TestCase):
+
+    def setUp(self):
+        Region.objects.all().delete()
+        self.world = Region.objects.create(
+            code='WRL', name='World', bbox_x0=-180, bbox_x1=180, bbox_y0=-90, bbox_y1=90)
+        self.europe = Region.objects.create(
+            code='EUR', name='Europe', parent=self.world, bbox_x0=-25, bbox_x1=45, bbox_y0=34, bbox_y1=72)
+        self.italy = Region.objects.create(
+            code='ITA', name='Italy', parent=self.europe, bbox_x0=6, bbox_x1=19, bbox_y0=35, bbox_y1=48)
+
+    def test_regions_for_bbox(self):
+        index = get_regions_index()
+        self.assertEqual(index.global_regions, [self.world.id])
+        bbox = Polygon.from_bbox((10, 40, 12, 42))
+        bbox.srid = 4326
+        self.assertEqual(
+            set(index.get_regions_for(bbox)),
+            {self.world.id, self.europe.id, self.italy.id})
+        # the bbox is reprojected to EPSG:4326 before the lookup
+        bbox = Polygon.from_bbox((-8000000, 5000000, -7000000, 6000000))
+        bbox.srid = 3857
+        self.assertEqual(index.get_regions_for(bbox), [self.world.id])
+
+    def test_regions_index_invalidation(self):
+        index = get_regions_index()
+        self.assertIs(get_regions_index(), index)
+        Region.objects.create(
+            code='FRA', name='France', parent=self.europe, bbox_x0=-5, bbox_x1=10, bbox_y0=41, bbox_y1=51)
+        self.assertIsNot(get_regions_index(), index)
+        self.assertEqual(len(get_regions_index()), 4)
+
+    def test_regions_assigned_on_save(self):
+        admin = get_user_model().objects.create(username='admin', is_superuser=True)
+        layer = Layer.objects.create(
+            owner=admin, title='layer', bbox_polygon=Polygon.from_bbox((10, 40, 12, 42)))
+        self.assertEqual(
+            set(layer.regions.values_list('id', flat=True)),
+            {self.world.id, self.europe.id, self.italy.id})
+
+
+class TestSearchIndexQueue(TestCase):
+
+    def setUp(self):
+        self.index = Mock()
+        self.index.get_model.return_value = Layer
+        self.index.index_queryset.side_effect = lambda: Layer.objects.all()
+        admin = get_user_model().objects.create(username='admin', is_superuser=True)
+        self.layer = Layer.objects.create(owner=admin, title='layer')
+
+    def test_queued_updates_are_coalesced_and_flushed(self):
+        with patch('geonode.base.search._get_index',
+                   side_effect=lambda model: self.index if model is Layer else None), \
+                patch('geonode.base.search.connections') as connections:
+            SearchIndexUpdate.objects.all().delete()
+            resource = ResourceBase.objects.non_polymorphic().get(id=self.layer.id)
+            queue_search_index_updates([self.layer, self.layer, resource])
+            self.assertEqual(SearchIndexUpdate.objects.count(), 1)
+            self.assertFalse(SearchIndexUpdate.objects.get().remove)
+
+            backend = connections['default'].get_backend.return_value
+            self.assertEqual(flush_search_index_queue(), (1, 0))
+            backend.update.assert_called_once_with(self.index, [self.layer])
+            self.assertFalse(SearchIndexUpdate.objects.exists())
+
+            queue_search_index_updates([self.layer], remove=True)
+            self.assertEqual(flush_search_index_queue(), (0, 1))
+            backend.remove.assert_called_once_with('layers.layer.{}'.format(self.layer.id))
+            self.assertFalse(SearchIndexUpdate.objects.exists())
+
+
 class TestHtmlTagRemoval(SimpleTestCase):
 
     def test_not_tags_in_attribute(self):
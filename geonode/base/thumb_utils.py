@@ -1,8 +1,19 @@
 import os
+import re
+import logging
+import threading
+
+from io import BytesIO
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from django.conf import settings
 from django.core.files.storage import default_storage as storage
 
+logger = logging.getLogger(__name__)
+
+thumb_name_regex = re.compile(
+    r"^((?:document|map|layer)-[a-f\d]{8}-[a-f\d]{4}-[a-f\d]{4}-[a-f\d]{4}-[a-f\d]{12}-thumb)")
+
 
 def thumb_path(filename):
     """Return the complete path of the provided thumbnail file accessible
@@ -23,14 +34,149 @@ def get_thumbs():
     return thumbs
 
 
+def get_thumb_name(filename):
+    """Returns the name a stored thumbnail file is recorded with: its file
+    name without the extension and the suffix possibly added by the storage"""
+    match = thumb_name_regex.search(filename)
+    return match.group(1) if match else os.path.splitext(filename)[0]
+
+
+def register_thumb(name, path):
+    """Records a thumbnail file saved in storage"""
+    from geonode.base.models import ThumbnailFile
+    ThumbnailFile.objects.update_or_create(path=path, defaults={'name': name})
+
+
 def remove_thumb(filename):
     """Delete a thumbnail from storage"""
+    from geonode.base.models import ThumbnailFile
     storage.delete(thumb_path(filename))
+    ThumbnailFile.objects.filter(path=thumb_path(filename)).delete()
 
 
 def remove_thumbs(name):
-    """Removes all stored thumbnails that start with the same name as the
+    """Removes all stored thumbnails recorded with the same name as the
     file specified"""
-    for thumb in get_thumbs():
-        if thumb.startswith(name):
-            remove_thumb(thumb)
+    from geonode.base.models import ThumbnailFile
+    thumbs = ThumbnailFile.objects.filter(name=name)
+    paths = set(thumbs.values_list('path', flat=True))
+    # the thumbnails saved before they were recorded have the default name
+    paths.add(thumb_path("%s.png" % name))
+    for path in paths:
+        storage.delete(path)
+    thumbs.delete()
+
+
+def get_thumbnail_size():
+    _default_thumb_size = getattr(
+        settings, 'THUMBNAIL_GENERATOR_DEFAULT_SIZE', {'width': 240, 'height': 200})
+    return _default_thumb_size['width'], _default_thumb_size['height']
+
+
+def optimize_thumbnail(im):
+    """Resizes and crops a PIL image to the thumbnail size and returns it
+    encoded as JPEG"""
+    from PIL import Image
+    from resizeimage import resizeimage
+    size = get_thumbnail_size()
+    im.thumbnail(size, resample=Image.ANTIALIAS)
+    cover = resizeimage.resize_cover(im, list(size))
+    if cover.mode != 'RGB':
+        cover = cover.convert('RGB')
+    content = BytesIO()
+    cover.save(content, format='JPEG')
+    return content.getvalue()
+
+
+def encode_thumbnail(image):
+    """Returns the image bytes optimized for a thumbnail, as they are if they
+    already are a JPEG of the thumbnail size"""
+    from PIL import Image
+    im = Image.open(BytesIO(image))
+    if im.format == 'JPEG' and im.size == get_thumbnail_size():
+        return image
+    return optimize_thumbnail(im)
+
+
+class ThumbnailRenderer(object):
+    """
+    Renders thumbnails out of map tiles.
+
+    The tiles are downloaded concurrently by a bounded pool of workers and
+    composited in memory. Concurrent renderings of the same key are
+    performed only once, all the callers getting the same image.
+    """
+
+    def __init__(self, max_workers=8, timeout=30):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            # the worker threads do not survive a fork
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _fetch(self, url):
+        from geonode.utils import http_client
+        try:
+            response = http_client.get_session(url).get(url, timeout=self.timeout)
+            if response.status_code != 200 or \
+                    not response.headers.get('Content-Type', 'image/').startswith('image/'):
+                logger.debug('Unable to fetch the tile %s: %s' % (url, response.status_code))
+                return None
+            return response.content
+        except Exception as e:
+            logger.debug('Unable to fetch the tile %s: %s' % (url, e))
+            return None
+
+    def _compose(self, tiles, width, height):
+        from PIL import Image
+        contents = list(self._get_executor().map(self._fetch, [url for url, _, _ in tiles]))
+        if not any(contents):
+            return None
+        canvas = Image.new('RGBA', (width, height), (255, 255, 255, 255))
+        for content, (url, left, top) in zip(contents, tiles):
+            if not content:
+                continue
+            try:
+                tile = Image.open(BytesIO(content)).convert('RGBA')
+            except Exception as e:
+                logger.debug('Invalid tile %s: %s' % (url, e))
+                continue
+            canvas.paste(tile, (int(left), int(top)), tile)
+        return optimize_thumbnail(canvas)
+
+    def render(self, key, tiles, width, height):
+        """
+        Returns the JPEG thumbnail composed of ``tiles``, a list of
+        ``(url, left, top)`` drawn in order on a ``width`` x ``height``
+        canvas, or None if no tile could be fetched.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            image = self._compose(tiles, width, height)
+            future.set_result(image)
+            return image
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+thumbnail_renderer = ThumbnailRenderer(
+    max_workers=getattr(settings, 'THUMBNAIL_GENERATOR_WORKERS', 8))
@@ -19,6 +19,9 @@
 #########################################################################
 
 import logging
+import threading
+
+from contextlib import contextmanager
 
 from django.db import connection
 from django.db.models import Max, Min, Count
@@ -33,6 +36,8 @@ from pycsw.core import util
 
 LOGGER = logging.getLogger(__name__)
 
+_local = threading.local()
+
 GEONODE_SERVICE_TYPES = {
     # 'GeoNode enum': 'CSW enum'
     'http://www.opengis.net/cat/csw/2.0.2': 'OGC:CSW',
@@ -44,6 +49,45 @@ GEONODE_SERVICE_TYPES = {
 }
 
 
+class RecordsPage(object):
+    """
+    A page of the records matching a query.
+
+    The records are fetched by chunks while pycsw walks through them, so that
+    a large page is never held in memory as model instances all at once.
+    """
+
+    chunk_size = 100
+
+    def __init__(self, query, total, startposition, maxrecords):
+        self.query = query[startposition:startposition + maxrecords]
+        self.length = max(0, min(maxrecords, total - startposition))
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.query.iterator(chunk_size=self.chunk_size)
+
+    def __getitem__(self, key):
+        return self.query[key]
+
+
+@contextmanager
+def permissions_mask(mask):
+    """
+    Restricts the records served by the repositories created in the current
+    thread to the resources matching ``mask``, a ``Q`` object on ResourceBase.
+    pycsw only accepts a plain SQL string as repository filter, hence the
+    mask is handed over to the repository this way.
+    """
+    _local.mask = mask
+    try:
+        yield
+    finally:
+        _local.mask = None
+
+
 class GeoNodeRepository(Repository):
     """
     Class to interact with underlying repository
@@ -56,6 +100,7 @@ class GeoNodeRepository(Repository):
 
         self.context = context
         self.filter = repo_filter
+        self.mask = getattr(_local, 'mask', None)
         self.fts = False
         self.label = 'GeoNode'
         self.local_ingest = True
@@ -176,26 +221,19 @@ class GeoNodeRepository(Repository):
         # apply sorting, limit and offset
         if sortby is not None:
             if 'spatial' in sortby and sortby['spatial']:  # spatial sort
-                desc = False
+                query = query.extra(
+                    select={'csw_geometry_area': self._get_geometry_area_sql(sortby['propertyname'])})
                 if sortby['order'] == 'DESC':
-                    desc = True
-                query = query.all()
-                return [str(total),
-                        sorted(query,
-                               key=lambda x: float(util.get_geometry_area(
-                                   getattr(x, sortby['propertyname']))),
-                               reverse=desc,
-                               )[startposition:startposition + int(maxrecords)]]
+                    query = query.order_by('-csw_geometry_area')
+                else:
+                    query = query.order_by('csw_geometry_area')
             else:
                 if sortby['order'] == 'DESC':
                     pname = '-%s' % sortby['propertyname']
                 else:
                     pname = sortby['propertyname']
-                return [str(total),
-                        query.order_by(pname)[startposition:startposition + int(maxrecords)]]
-        else:  # no sort
-            return [str(total), query.all()[
-                startposition:startposition + int(maxrecords)]]
+                query = query.order_by(pname)
+        return [str(total), RecordsPage(query, total, startposition, int(maxrecords))]
 
     def delete(self, constraint):
         """
@@ -208,10 +246,22 @@ class GeoNodeRepository(Repository):
         results.delete()
         return deleted
 
+    def _get_geometry_area_sql(self, propertyname):
+        """
+        Returns the SQL expression computing the area of the WKT geometries
+        stored in ``propertyname``
+        """
+        if 'postgis' in self.dbtype:
+            return 'ST_Area(ST_GeomFromText(%s))' % propertyname
+        # pycsw function registered on the SQLite connection
+        return 'get_geometry_area(%s)' % propertyname
+
     def _get_repo_filter(self, query):
         """
         Apply repository wide side filter / mask query
         """
+        if self.mask is not None:
+            query = query.filter(self.mask)
         if self.filter is not None:
             return query.extra(where=[self.filter])
         return query
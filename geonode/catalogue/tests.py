@@ -31,3 +31,33 @@ class CatalogueTest(GeoNodeBaseTestSupport):
 
         c = get_catalogue()
         self.assertIsNotNone(c)
+
+    def test_permissions_mask(self):
+        """Tests the catalogue permissions mask is a cached sub-query."""
+        from django.contrib.auth import get_user_model
+        from guardian.shortcuts import get_objects_for_user
+        from geonode.base.models import ResourceBase
+        from geonode.catalogue.views import get_permissions_mask
+
+        anonymous = get_user_model().objects.get(username='AnonymousUser')
+        mask = get_permissions_mask(anonymous)
+        self.assertIs(get_permissions_mask(anonymous), mask)
+
+        visible = ResourceBase.objects.filter(mask)
+        # the resource ids are not inlined in the query
+        self.assertIn('SELECT', str(visible.query).split('WHERE', 1)[1])
+        self.assertEqual(
+            set(visible.values_list('id', flat=True)),
+            set(get_objects_for_user(anonymous, 'base.view_resourcebase').values_list('id', flat=True)))
+
+    def test_records_page(self):
+        """Tests the records are paged by the database."""
+        from geonode.base.models import ResourceBase
+        from geonode.catalogue.backends.pycsw_plugin import RecordsPage
+
+        query = ResourceBase.objects.order_by('id')
+        total = query.count()
+        page = RecordsPage(query, total, 1, 2)
+        self.assertEqual(len(page), min(2, max(0, total - 1)))
+        self.assertEqual([_r.id for _r in page], list(query.values_list('id', flat=True)[1:3]))
+        self.assertEqual(len(RecordsPage(query, total, total, 10)), 0)
@@ -27,17 +27,61 @@ from django.shortcuts import render
 from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import csrf_exempt
 from pycsw import server
-from guardian.shortcuts import get_objects_for_user
 from geonode.catalogue.backends.pycsw_local import CONFIGURATION
+from geonode.catalogue.backends.pycsw_plugin import permissions_mask
+from geonode.utils import LRUCache
+from geonode.security.utils import get_resources_with_perms_filter
 from geonode.base.models import ResourceBase
 from geonode.layers.models import Layer
 from geonode.base.auth import get_or_create_token
 from geonode.base.models import ContactRole, SpatialRepresentationType
 from geonode.groups.models import GroupProfile
 from django.db import connection
+from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
 
 
+_masks_cache = LRUCache(
+    max_entries=getattr(settings, 'CSW_PERMISSIONS_MASK_CACHE_SIZE', 1000),
+    timeout=getattr(settings, 'CSW_PERMISSIONS_MASK_CACHE_TIMEOUT', 300))
+
+
+def get_permissions_mask(user):
+    """
+    Returns the ``Q`` object selecting the resources ``user`` can see through
+    the catalogue: the ones it is allowed to view, not belonging to the private
+    groups it is not a member of.
+
+    The permissions are resolved by sub-queries run along with the catalogue
+    query itself, hence the mask is built once per user and cached.
+    """
+    if user and user.is_authenticated:
+        key = (user.pk, user.is_superuser)
+    else:
+        key = 'anonymous' if user else None
+    mask = _masks_cache.get(key)
+    if mask is not None:
+        return mask
+
+    mask = get_resources_with_perms_filter(user)
+
+    # Filter out Layers belonging to specific Groups
+    is_admin = user.is_superuser if user else False
+    if not is_admin and settings.GROUP_PRIVATE_RESOURCES:
+        groups_filter = Q(group__isnull=True) | Q(
+            group__in=GroupProfile.objects.exclude(access="private").values('group'))
+        if user and user.is_authenticated:
+            groups_filter |= Q(group__in=user.groups.values('id'))
+            try:
+                groups_filter |= Q(group__in=user.group_list_all().values('group'))
+            except Exception:
+                pass
+        mask &= groups_filter
+
+    _masks_cache.set(key, mask)
+    return mask
+
+
 @csrf_exempt
 def csw_global_dispatch(request):
     """pycsw wrapper"""
@@ -73,80 +117,19 @@ def csw_global_dispatch(request):
     mdict_filter = mdict['repository']['filter']
 
     try:
-        # Filter out Layers not accessible to the User
-        authorized_ids = []
-        if request.user:
-            profiles = get_user_model().objects.filter(username=str(request.user))
-        else:
-            profiles = get_user_model().objects.filter(username="AnonymousUser")
-        if profiles:
-            authorized = list(
-                get_objects_for_user(
-                    profiles[0],
-                    'base.view_resourcebase').values('id'))
-            layers = ResourceBase.objects.filter(
-                id__in=[d['id'] for d in authorized])
-            if layers:
-                authorized_ids = [d['id'] for d in authorized]
-
-        if len(authorized_ids) > 0:
-            authorized_layers = "(" + (", ".join(str(e)
-                                                 for e in authorized_ids)) + ")"
-            authorized_layers_filter = "id IN " + authorized_layers
-            mdict['repository']['filter'] += " AND " + authorized_layers_filter
-            if request.user and request.user.is_authenticated:
-                mdict['repository']['filter'] = "({}) OR ({})".format(mdict['repository']['filter'],
-                                                                      authorized_layers_filter)
-        else:
-            authorized_layers_filter = "id = -9999"
-            mdict['repository']['filter'] += " AND " + authorized_layers_filter
+        user = request.user if request and request.user else None
+        if user and user.is_authenticated:
+            # Authenticated users get all the resources they are allowed to view,
+            # the default repository filter only applies to anonymous users
+            mdict['repository']['filter'] = "1 = 1"
 
         # Filter out Documents and Maps
         if 'ALTERNATES_ONLY' in settings.CATALOGUE['default'] and settings.CATALOGUE['default']['ALTERNATES_ONLY']:
             mdict['repository']['filter'] += " AND alternate IS NOT NULL"
 
-        # Filter out Layers belonging to specific Groups
-        is_admin = False
-        if request.user:
-            is_admin = request.user.is_superuser if request.user else False
-
-        if not is_admin and settings.GROUP_PRIVATE_RESOURCES:
-            groups_ids = []
-            if request.user and request.user.is_authenticated:
-                for group in request.user.groups.all():
-                    groups_ids.append(group.id)
-                group_list_all = []
-                try:
-                    group_list_all = request.user.group_list_all().values('group')
-                except Exception:
-                    pass
-                for group in group_list_all:
-                    if isinstance(group, dict):
-                        if 'group' in group:
-                            groups_ids.append(group['group'])
-                    else:
-                        groups_ids.append(group.id)
-
-            public_groups = GroupProfile.objects.exclude(
-                access="private").values('group')
-            for group in public_groups:
-                if isinstance(group, dict):
-                    if 'group' in group:
-                        groups_ids.append(group['group'])
-                else:
-                    groups_ids.append(group.id)
-
-            if len(groups_ids) > 0:
-                groups = "(" + (", ".join(str(e) for e in groups_ids)) + ")"
-                groups_filter = "(group_id IS NULL OR group_id IN " + groups + ")"
-                mdict['repository']['filter'] += " AND " + groups_filter
-            else:
-                groups_filter = "group_id IS NULL"
-                mdict['repository']['filter'] += " AND " + groups_filter
-
-        csw = server.Csw(mdict, env, version='2.0.2')
-
-        content = csw.dispatch_wsgi()
+        with permissions_mask(get_permissions_mask(user)):
+            csw = server.Csw(mdict, env, version='2.0.2')
+            content = csw.dispatch_wsgi()
 
         # pycsw 2.0 has an API break:
         # pycsw < 2.0: content = xml_response
@@ -18,8 +18,12 @@
 #
 #########################################################################
 
+from functools import lru_cache
+
 from django.conf import settings
+from django.core.signals import setting_changed
 from geonode import get_version
+from geonode.decorators import request_cached
 from geonode.catalogue import default_catalogue_backend
 from django.contrib.sites.models import Site
 
@@ -27,18 +31,16 @@ from geonode.notifications_helper import has_notifications
 from geonode.base.models import Configuration
 
 
-def resource_urls(request):
-    """Global values to pass to templates"""
-    site = Site.objects.get_current()
-
-    defaults = dict(
+@lru_cache(maxsize=None)
+def _get_static_context():
+    """Values depending only on the settings and the deployed version,
+    computed once per process"""
+    return dict(
         STATIC_URL=settings.STATIC_URL,
         CATALOGUE_BASE_URL=default_catalogue_backend()['URL'],
         ACCOUNT_OPEN_SIGNUP=settings.ACCOUNT_OPEN_SIGNUP,
         ACCOUNT_APPROVAL_REQUIRED=settings.ACCOUNT_APPROVAL_REQUIRED,
         VERSION=get_version(),
-        SITE_NAME=site.name,
-        SITE_DOMAIN=site.domain,
         SITEURL=settings.SITEURL,
         INSTALLED_APPS=settings.INSTALLED_APPS,
         THEME_ACCOUNT_CONTACT_EMAIL=settings.THEME_ACCOUNT_CONTACT_EMAIL,
@@ -181,7 +183,26 @@ def resource_urls(request):
         ),
         OGC_SERVER=getattr(settings, 'OGC_SERVER', None),
         DELAYED_SECURITY_SIGNALS=getattr(settings, 'DELAYED_SECURITY_SIGNALS', False),
-        READ_ONLY_MODE=getattr(Configuration.load(), 'read_only', False)
     )
 
+
+def _clear_static_context(**kwargs):
+    _get_static_context.cache_clear()
+
+
+# the tests override the settings at runtime
+setting_changed.connect(_clear_static_context)
+
+
+@request_cached
+def resource_urls(request):
+    """Global values to pass to templates"""
+    site = Site.objects.get_current()
+
+    defaults = dict(_get_static_context())
+    defaults.update(
+        SITE_NAME=site.name,
+        SITE_DOMAIN=site.domain,
+        READ_ONLY_MODE=getattr(Configuration.load(), 'read_only', False)
+    )
     return defaults
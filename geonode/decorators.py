@@ -319,3 +319,25 @@ def dump_func_name(func):
         logger.debug('Start func: {}'.format(func.__name__))
         return func(*func_args, **func_kwargs)
     return echo_func
+
+
+def request_cached(func):
+    """
+    Caches the result of a context processor on the request, so that the
+    templates rendered while handling the same request do not compute it
+    again.
+    """
+    key = '{}.{}'.format(func.__module__, func.__name__)
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        if request is None:
+            return func(request, *args, **kwargs)
+        cached = getattr(request, '_context_processors_cache', None)
+        if cached is None:
+            cached = {}
+            setattr(request, '_context_processors_cache', cached)
+        if key not in cached:
+            cached[key] = func(request, *args, **kwargs)
+        return cached[key]
+    return wrapper
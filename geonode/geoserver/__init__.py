@@ -48,6 +48,21 @@ def run_setup_hooks(*args, **kwargs):
     signals.pre_save.connect(geoserver_pre_save_maplayer, sender=MapLayer)
     signals.post_save.connect(geoserver_post_save_map, sender=Map)
 
+    from django.contrib.auth import get_user_model
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.geoserver.acl import invalidate_acls_cache
+
+    for _model in (UserObjectPermission, GroupObjectPermission, Layer):
+        signals.post_save.connect(invalidate_acls_cache, sender=_model)
+        signals.post_delete.connect(invalidate_acls_cache, sender=_model)
+    signals.m2m_changed.connect(invalidate_acls_cache, sender=get_user_model().groups.through)
+
+    from geonode.security.signals import permissions_bulk_changed
+    from geonode.geoserver.signals import geoserver_permissions_bulk_changed
+
+    permissions_bulk_changed.connect(invalidate_acls_cache)
+    permissions_bulk_changed.connect(geoserver_permissions_bulk_changed)
+
 
 def set_resource_links(*args, **kwargs):
 
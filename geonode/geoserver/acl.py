@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2020 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+"""
+Caching of the layer ACLs and of the verified credentials used by the
+GeoServer authentication callbacks (``layer_acls`` and ``resolve_user``).
+
+The computed read-write/read-only sets are kept in a small in-process LRU
+in front of the Django cache backend. Any change to the object permissions,
+the group memberships or the layers bumps a version number which makes all
+the cached entries stale at once. In-process entries only live for a few
+seconds, which bounds how long other processes may serve a stale ACL.
+"""
+import hmac
+import hashlib
+import threading
+
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import authenticate, get_user_model
+
+from geonode.utils import LRUCache
+
+
+ACLS_CACHE_VERSION_KEY = 'geonode_layer_acls_version'
+
+
+class LatencyStats(object):
+    """
+    Keeps the latency of the most recent calls of each endpoint and
+    the cache hits/misses counters.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._timings = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, elapsed, hit):
+        with self._lock:
+            self._timings.setdefault(endpoint, deque(maxlen=self.window)).append(elapsed)
+            counters = self._counters.setdefault(endpoint, {'hits': 0, 'misses': 0})
+            counters['hits' if hit else 'misses'] += 1
+
+    @staticmethod
+    def _percentile(values, percent):
+        index = min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))
+        return values[index]
+
+    def get(self):
+        stats = {}
+        with self._lock:
+            for endpoint, timings in self._timings.items():
+                values = sorted(timings)
+                stats[endpoint] = dict(
+                    self._counters[endpoint],
+                    count=len(values),
+                    p50=self._percentile(values, 50),
+                    p99=self._percentile(values, 99))
+        return stats
+
+
+_local_cache = LRUCache(
+    max_entries=getattr(settings, 'LAYER_ACLS_LOCAL_CACHE_SIZE', 1000),
+    timeout=getattr(settings, 'LAYER_ACLS_LOCAL_CACHE_TIMEOUT', 10))
+acls_stats = LatencyStats()
+
+
+def _get_version():
+    return cache.get(ACLS_CACHE_VERSION_KEY) or 0
+
+
+def invalidate_acls_cache(*args, **kwargs):
+    """
+    Drops all the cached layer ACLs.
+    Can be connected directly to model signals.
+    """
+    _local_cache.clear()
+    try:
+        cache.incr(ACLS_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(ACLS_CACHE_VERSION_KEY, 1, None)
+
+
+def _cached(key, compute, timeout):
+    value = _local_cache.get(key)
+    if value is not None:
+        return value, True
+    versioned_key = '{}_{}'.format(key, _get_version())
+    value = cache.get(versioned_key)
+    hit = value is not None
+    if not hit:
+        value = compute()
+        cache.set(versioned_key, value, timeout)
+    _local_cache.set(key, value)
+    return value, hit
+
+
+def authenticate_cached(username, password):
+    """
+    Same as ``django.contrib.auth.authenticate`` but the successfully
+    verified credentials are remembered for LAYER_ACLS_CREDENTIALS_TIMEOUT
+    seconds, skipping the password hashing on the following calls.
+    Only a keyed digest of the credentials is stored.
+
+    :return: Tuple (user or None, True if the credentials were cached)
+    """
+    digest = hmac.new(
+        settings.SECRET_KEY.encode('utf-8'),
+        '{}:{}'.format(username, password).encode('utf-8'),
+        hashlib.sha256).hexdigest()
+    key = 'geonode_acl_credentials_{}'.format(digest)
+    user_id = cache.get(key)
+    if user_id is not None:
+        user = get_user_model().objects.filter(id=user_id, is_active=True).first()
+        if user is not None:
+            return user, True
+    user = authenticate(username=username, password=password)
+    if user is not None:
+        cache.set(key, user.id, getattr(settings, 'LAYER_ACLS_CREDENTIALS_TIMEOUT', 60))
+    return user, False
+
+
+def get_layer_acls(user, compute):
+    """
+    Returns the ``(read_write, read_only)`` layer alternates sets of ``user``
+    as computed by ``compute(user)``, caching them until the next
+    permissions or layers change.
+    """
+    return _cached(
+        'geonode_layer_acls_{}'.format(user.pk),
+        lambda: compute(user),
+        getattr(settings, 'LAYER_ACLS_CACHE_TIMEOUT', 600))
@@ -21,8 +21,10 @@
 from django.conf import settings
 from django.urls import reverse
 from geonode.geoserver.helpers import ogc_server_settings
+from geonode.decorators import request_cached
 
 
+@request_cached
 def geoserver_urls(request):
     """Global values to pass to templates"""
     defaults = dict(
@@ -35,6 +35,7 @@ from six import (
 )
 from itertools import cycle
 from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from os.path import basename, splitext, isfile
 from threading import local
 from urllib.parse import urlparse, urlencode, urlsplit, urljoin
@@ -44,7 +45,9 @@ from dialogos.models import Comment
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.db.models.signals import pre_delete
+from django.http.request import validate_host
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext as _
@@ -61,6 +64,7 @@ from owslib.wcs import WebCoverageService
 from owslib.wms import WebMapService
 from geonode import GeoNodeException
 from geonode.base.auth import get_or_create_token
+from geonode.base.thumb_utils import encode_thumbnail, thumbnail_renderer
 from geonode.utils import http_client
 from geonode.layers.models import Layer, Attribute, Style
 from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
@@ -566,11 +570,22 @@ def gs_slurp(
         skip_geonode_registered=False,
         remove_deleted=False,
         permissions=None,
-        execute_signals=False):
+        execute_signals=False,
+        workers=1,
+        checkpoint=None,
+        dry_run=False):
     """Configure the layers available in GeoServer in GeoNode.
 
        It returns a list of dictionaries with the name of the layer,
        the result of the operation and the errors and traceback if it failed.
+
+       *filter*: only the layers whose name contains this string, or the
+           layers with one of the names of a list, are synchronized.
+       *workers*: number of threads synchronizing the layers concurrently.
+       *checkpoint*: path of a file keeping track of the synchronized layers,
+           a run interrupted before completion resumes from there.
+       *dry_run*: only report the layers which would be created, updated
+           or deleted, without changing anything.
     """
     if console is None:
         console = open(os.devnull, 'w')
@@ -616,7 +631,9 @@ def gs_slurp(
             else:
                 raise
 
-    if filter:
+    if isinstance(filter, (list, tuple, set)):
+        resources = [k for k in resources if k.name in filter]
+    elif filter:
         resources = [k for k in resources if filter in k.name]
 
     # filter out layers depending on enabled, advertised status:
@@ -642,7 +659,7 @@ def gs_slurp(
                 raise
 
     # filter out layers already registered in geonode
-    layer_names = Layer.objects.all().values_list('alternate', flat=True)
+    layer_names = set(Layer.objects.all().values_list('alternate', flat=True))
     if skip_geonode_registered:
         try:
             resources = [k for k in resources
@@ -657,6 +674,27 @@ def gs_slurp(
     # i.e. look for matching layers in GeoNode and also disable?
     # disabled_resources = [k for k in resources if k.enabled == "false"]
 
+    # skip the layers already synchronized by an interrupted run
+    checkpoint_layers = set()
+    if checkpoint and not dry_run and os.path.exists(checkpoint):
+        with open(checkpoint) as checkpoint_file:
+            checkpoint_layers = set(json.load(checkpoint_file).get('layers', []))
+        resources = [k for k in resources
+                     if '%s:%s' % (k.store.workspace.name, k.name) not in checkpoint_layers]
+        if verbosity > 0:
+            print("Resuming from %s, skipping %d layers" % (checkpoint, len(checkpoint_layers)), file=console)
+
+    def save_checkpoint():
+        tmp_checkpoint = '%s.tmp' % checkpoint
+        with open(tmp_checkpoint, 'w') as checkpoint_file:
+            json.dump({'layers': sorted(checkpoint_layers)}, checkpoint_file)
+        os.replace(tmp_checkpoint, checkpoint)
+
+    # fetch the matching GeoNode layers at once
+    existing_layers = {}
+    for layer in Layer.objects.filter(name__in=[k.name for k in resources]):
+        existing_layers[(layer.workspace, layer.name)] = layer
+
     number = len(resources)
     if verbosity > 0:
         msg = "Found %d layers, starting processing" % number
@@ -669,16 +707,23 @@ def gs_slurp(
             'deleted': 0,
         },
         'layers': [],
-        'deleted_layers': []
+        'deleted_layers': [],
+        'dry_run': dry_run,
     }
-    start = datetime.datetime.now(timezone.get_current_timezone())
-    for i, resource in enumerate(resources):
+
+    def sync_resource(resource):
+        """
+        Creates or updates the GeoNode layer of a GeoServer resource.
+        Returns the name of the resource, its status and the error info if any.
+        """
         name = resource.name
         the_store = resource.store
         workspace = the_store.workspace
+        layer = existing_layers.get((workspace.name, name))
+        if dry_run:
+            return resource, 'updated' if layer else 'created', None
         try:
             created = False
-            layer = Layer.objects.filter(name=name, workspace=workspace.name).first()
             if not layer:
                 layer = Layer.objects.create(
                     name=name,
@@ -718,42 +763,65 @@ def gs_slurp(
                     resource.metadata_links = metadata_links
                     cat.save(resource)
 
-        except Exception as e:
-            if ignore_errors:
-                status = 'failed'
-                exception_type, error, traceback = sys.exc_info()
-            else:
-                if verbosity > 0:
-                    msg = "Stopping process because --ignore-errors was not set and an error was found."
-                    print(msg, file=sys.stderr)
-                raise_(
-                    Exception,
-                    Exception("Failed to process {}".format(resource.name), e),
-                    sys.exc_info()[2]
-                )
-        else:
             if created:
                 if not permissions:
                     layer.set_default_permissions()
                 else:
                     layer.set_permissions(permissions)
+        except Exception:
+            return resource, 'failed', sys.exc_info()
+        return resource, 'created' if created else 'updated', None
 
-                status = 'created'
-                output['stats']['created'] += 1
-            else:
-                status = 'updated'
-                output['stats']['updated'] += 1
-
-        msg = "[%s] Layer %s (%d/%d)" % (status, name, i + 1, number)
-        info = {'name': name, 'status': status}
-        if status == 'failed':
-            output['stats']['failed'] += 1
-            info['traceback'] = traceback
-            info['exception_type'] = exception_type
-            info['error'] = error
-        output['layers'].append(info)
-        if verbosity > 0:
-            print(msg, file=console)
+    def sync_resource_in_thread(resource):
+        try:
+            return sync_resource(resource)
+        finally:
+            connection.close()
+
+    start = datetime.datetime.now(timezone.get_current_timezone())
+    if workers > 1 and not dry_run:
+        # the REST round-trips of each layer are run by a bounded pool of threads
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(sync_resource_in_thread, resource) for resource in resources]
+        results = (future.result() for future in as_completed(futures))
+    else:
+        executor = futures = None
+        results = (sync_resource(resource) for resource in resources)
+
+    try:
+        for i, (resource, status, exc_info) in enumerate(results):
+            name = resource.name
+            if status == 'failed' and not ignore_errors:
+                if verbosity > 0:
+                    msg = "Stopping process because --ignore-errors was not set and an error was found."
+                    print(msg, file=sys.stderr)
+                raise_(
+                    Exception,
+                    Exception("Failed to process {}".format(name), exc_info[1]),
+                    exc_info[2]
+                )
+            msg = "[%s] Layer %s (%d/%d)" % (status, name, i + 1, number)
+            info = {'name': name, 'status': status}
+            output['stats'][status] += 1
+            if status == 'failed':
+                info['exception_type'], info['error'], info['traceback'] = exc_info
+            elif checkpoint and not dry_run:
+                checkpoint_layers.add('%s:%s' % (resource.store.workspace.name, name))
+                if len(checkpoint_layers) % 10 == 0:
+                    save_checkpoint()
+            output['layers'].append(info)
+            if verbosity > 0:
+                print(msg, file=console)
+    finally:
+        if executor is not None:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+        if checkpoint and not dry_run:
+            save_checkpoint()
+    # the run is complete, there is nothing left to resume
+    if checkpoint and not dry_run and not output['stats']['failed']:
+        os.remove(checkpoint)
 
     if remove_deleted:
         q = Layer.objects.filter()
@@ -779,6 +847,9 @@ def gs_slurp(
         # filtered per options passed to updatelayers: --workspace, --store, --skip-unadvertised
         # add any layers not found in GeoServer to deleted_layers (must match
         # workspace and store as well):
+        geoserver_layers = set(
+            (resource.name, resource.workspace.name, resource.store.name)
+            for resource in resources_for_delete_compare)
         deleted_layers = []
         for layer in q:
             logger.debug(
@@ -786,19 +857,9 @@ def gs_slurp(
                 layer.name,
                 layer.workspace,
                 layer.store)
-            layer_found_in_geoserver = False
-            for resource in resources_for_delete_compare:
-                # if layer.name matches a GeoServer resource, check also that
-                # workspace and store match, mark valid:
-                if layer.name == resource.name:
-                    if layer.workspace == resource.workspace.name and layer.store == resource.store.name:
-                        logger.debug(
-                            "Matches GeoServer layer: name: %s, workspace: %s, store: %s",
-                            resource.name,
-                            resource.workspace.name,
-                            resource.store.name)
-                        layer_found_in_geoserver = True
-            if not layer_found_in_geoserver:
+            # if layer.name matches a GeoServer resource, check also that
+            # workspace and store match, mark valid:
+            if (layer.name, layer.workspace, layer.store) not in geoserver_layers:
                 logger.debug(
                     "----- Layer %s not matched, marked for deletion ---------------",
                     layer.name)
@@ -816,6 +877,12 @@ def gs_slurp(
                 layer.name,
                 layer.workspace,
                 layer.store)
+            if dry_run:
+                output['stats']['deleted'] += 1
+                output['deleted_layers'].append({'name': layer.name, 'status': 'to_delete'})
+                if verbosity > 0:
+                    print("[to_delete] Layer %s (%d/%d)" % (layer.name, i + 1, number_deleted), file=console)
+                continue
             try:
                 # delete ratings, comments, and taggit tags:
                 ct = ContentType.objects.get_for_model(layer)
@@ -915,21 +982,32 @@ def set_attributes(
 
     # Add new layer attributes if they doesn't exist already
     if attribute_map:
-        iter = len(Attribute.objects.filter(layer=layer)) + 1
+        layer_attributes = defaultdict(list)
+        for la in Attribute.objects.filter(layer=layer):
+            layer_attributes[la.attribute].append(la)
+        iter = sum(len(_las) for _las in layer_attributes.values()) + 1
+        new_attributes = []
         for attribute in attribute_map:
             field, ftype, description, label, display_order = attribute
             if field:
-                _gs_attrs = Attribute.objects.filter(layer=layer, attribute=field)
-                if _gs_attrs.count() > 1:
-                    _gs_attrs.delete()
-                la, created = Attribute.objects.get_or_create(layer=layer, attribute=field)
-                if created:
-                    la.visible = ftype.find("gml:") != 0
-                    la.attribute_type = ftype,
-                    la.description = description
-                    la.attribute_label = label
-                    la.display_order = iter
+                _gs_attrs = layer_attributes.get(field, [])
+                if len(_gs_attrs) > 1:
+                    Attribute.objects.filter(id__in=[_la.id for _la in _gs_attrs]).delete()
+                    _gs_attrs = []
+                if _gs_attrs:
+                    la = _gs_attrs[0]
+                else:
+                    la = Attribute(
+                        layer=layer,
+                        attribute=field,
+                        visible=ftype.find("gml:") != 0,
+                        attribute_type=ftype,
+                        description=description,
+                        attribute_label=label,
+                        display_order=iter)
                     iter += 1
+                    layer_attributes[field] = [la]
+                    new_attributes.append(la)
                 if (not attribute_stats or layer.name not in attribute_stats or
                         field not in attribute_stats[layer.name]):
                     result = None
@@ -946,7 +1024,10 @@ def set_attributes(
                     la.sum = result['Sum']
                     la.unique_values = result['unique_values']
                     la.last_stats_updated = datetime.datetime.now(timezone.get_current_timezone())
-                la.save()
+                    if la.pk:
+                        la.save()
+        # the new attributes are stored at once
+        Attribute.objects.bulk_create(new_attributes)
     else:
         logger.debug("No attributes found")
 
@@ -1971,8 +2052,6 @@ def _render_thumbnail(req_body, width=240, height=200):
     spec = _fixup_ows_url(req_body)
     url = "%srest/printng/render.png" % ogc_server_settings.LOCATION
     headers = {'Content-type': 'text/html'}
-    _default_thumb_size = getattr(
-        settings, 'THUMBNAIL_GENERATOR_DEFAULT_SIZE', {'width': 240, 'height': 200})
     params = dict(width=width, height=height)
     url += "?" + urlencode(params)
     try:
@@ -1988,20 +2067,7 @@ def _render_thumbnail(req_body, width=240, height=200):
             raise Exception(content)
 
         # Optimize the Thumbnail size and resolution
-        from PIL import Image
-        from io import BytesIO
-        from resizeimage import resizeimage
-        content_data = BytesIO(content)
-        im = Image.open(content_data)
-        im.thumbnail(
-            (_default_thumb_size['width'], _default_thumb_size['height']),
-            resample=Image.ANTIALIAS)
-        cover = resizeimage.resize_cover(
-            im,
-            [_default_thumb_size['width'], _default_thumb_size['height']])
-        imgByteArr = BytesIO()
-        cover.save(imgByteArr, format='JPEG')
-        content = imgByteArr.getvalue()
+        content = encode_thumbnail(content)
     except Exception as e:
         logger.debug(e)
         raise e
@@ -2039,12 +2105,6 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
         if image is not None:
             return image
 
-        # Defaults
-        _img_src_template = """<img src='{ogc_location}'
-        style='width: {width}px; height: {height}px;
-        left: {left}px; top: {top}px;
-        opacity: 1; visibility: inherit; position: absolute;'/>\n"""
-
         def decimal_encode(bbox):
             import decimal
             _bbox = []
@@ -2119,6 +2179,20 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
                 ogc_server_location,
                 wms_endpoint) + "?" + _p
 
+        # the tiles are fetched by GeoNode: only from the known hosts, and from GeoServer
+        # through its internal location
+        allowed_hosts = _get_thumbnail_allowed_hosts()
+        if smurl:
+            smurl = _fixup_ows_tile_url(smurl)
+        if smurl and not validate_host(urlsplit(smurl).hostname or '', allowed_hosts):
+            logger.warning("The thumbnail background host %s is not allowed" % urlsplit(smurl).hostname)
+            smurl = None
+        if thumbnail_create_url:
+            thumbnail_create_url = _fixup_ows_tile_url(thumbnail_create_url)
+            if not validate_host(urlsplit(thumbnail_create_url).hostname or '', allowed_hosts):
+                logger.warning("The thumbnail WMS host %s is not allowed" % urlsplit(thumbnail_create_url).hostname)
+                return None
+
         # Compute Bounds
         wgs84_bbox = decimal_encode(
             bbox_to_projection([float(coord) for coord in request_body['bbox']] + [request_body['srid'], ],
@@ -2165,22 +2239,16 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
             first_row.append(tmp_tile)
             width_acc += 256
             _n_step = _n_step + 1
-        # Build Image Request Template
-        _img_request_template = "<div style='height:{height}px; width:{width}px;'>\
-            <div style='position: absolute; top:{top}px; left:{left}px; z-index: 749; \
-            transform: translate3d(0px, 0px, 0px) scale3d(1, 1, 1);'> \
-            \n".format(height=height, width=width, top=top, left=left)
-
+        # Basemap tiles first, then the WMS tiles on top of them
+        basemap_tiles = []
+        wms_tiles = []
         for row in range(0, numberOfRows):
             for col in range(0, len(first_row)):
-                box = [col * 256, row * 256]
+                box = [left + col * 256, top + row * 256]
                 t = first_row[col]
                 y = t.y + row
                 if smurl:
-                    imgurl = smurl.format(z=t.z, x=t.x, y=y)
-                    _img_request_template += _img_src_template.format(ogc_location=imgurl,
-                                                                      height=256, width=256,
-                                                                      left=box[0], top=box[1])
+                    basemap_tiles.append((smurl.format(z=t.z, x=t.x, y=y), box[0], box[1]))
                 xy_bounds = mercantile.xy_bounds(t.x, y, t.z)
                 bbox = ",".join([str(xy_bounds.left), str(xy_bounds.bottom),
                                  str(xy_bounds.right), str(xy_bounds.top)])
@@ -2193,12 +2261,14 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
 
                 }
                 _p = "&".join("%s=%s" % item for item in params.items())
-                _img_request_template += \
-                    _img_src_template.format(ogc_location=(thumbnail_create_url + '&' + _p),
-                                             height=256, width=256,
-                                             left=box[0], top=box[1])
-        _img_request_template += "</div></div>"
-        image = _render_thumbnail(_img_request_template, width=width, height=height)
+                wms_tiles.append((thumbnail_create_url + '&' + _p, box[0], box[1]))
+
+        # Concurrent requests for the very same thumbnail are rendered once
+        key = json.dumps([
+            {k: v for k, v in request_body.items() if k != 'access_token'},
+            request.user.pk if request and request.user else None,
+        ], sort_keys=True, default=str)
+        image = thumbnail_renderer.render(key, basemap_tiles + wms_tiles, width, height)
     except Exception as e:
         logger.warning('Error generating thumbnail')
         logger.exception(e)
@@ -2207,6 +2277,31 @@ def _prepare_thumbnail_body_from_opts(request_body, request=None):
     return image
 
 
+def _get_thumbnail_allowed_hosts():
+    """
+    Returns the hosts the thumbnail tiles may be fetched from: GeoNode,
+    GeoServer, the remote services, the default background and the
+    PROXY_ALLOWED_HOSTS.
+    """
+    from geonode.services.models import Service
+    urls = [settings.SITEURL, ogc_server_settings.LOCATION, ogc_server_settings.public_url,
+            getattr(settings, 'THUMBNAIL_GENERATOR_DEFAULT_BG', None)]
+    urls.extend(Service.objects.values_list('base_url', flat=True))
+    hosts = list(getattr(settings, 'PROXY_ALLOWED_HOSTS', ()))
+    hosts.extend(urlsplit(url).hostname for url in urls if url)
+    return [host for host in hosts if host]
+
+
+def _fixup_ows_tile_url(url):
+    """
+    Points the GeoServer public URLs to the GeoServer location, as
+    _fixup_ows_url does in the thumbnail specs.
+    """
+    if ogc_server_settings.public_url and url.startswith(ogc_server_settings.public_url):
+        return ogc_server_settings.LOCATION + url[len(ogc_server_settings.public_url):]
+    return url
+
+
 def _fixup_ows_url(thumb_spec):
     # @HACK - for whatever reason, a map's maplayers ows_url contains only /geoserver/wms
     # so rendering of thumbnails fails - replace those uri's with full geoserver URL
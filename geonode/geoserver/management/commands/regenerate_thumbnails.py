@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+from django.core.management.base import BaseCommand
+
+from geonode.maps.models import Map
+from geonode.layers.models import Layer
+from geonode.base.thumb_utils import thumb_exists
+from geonode.geoserver.helpers import create_gs_thumbnail
+
+
+def _thumbnail_name(resource):
+    if isinstance(resource, Layer):
+        return 'layer-%s-thumb.png' % resource.uuid
+    return 'map-%s-thumb.png' % resource.uuid
+
+
+class Command(BaseCommand):
+    help = 'Regenerate the thumbnails of the layers and maps, several resources at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-t',
+            '--type',
+            dest='type',
+            choices=['layer', 'map', 'all'],
+            default='all',
+            help='Only regenerate the thumbnails of the given type of resources. Default: all')
+        parser.add_argument(
+            '-f',
+            '--filter',
+            dest='filter',
+            default=None,
+            help='Only regenerate the thumbnails of the resources whose title matches the given filter.')
+        parser.add_argument(
+            '-w',
+            '--workers',
+            dest='workers',
+            type=int,
+            default=4,
+            help='Number of resources processed concurrently. Default: 4')
+        parser.add_argument(
+            '--missing-only',
+            action='store_true',
+            dest='missing_only',
+            default=False,
+            help='Only generate the thumbnails which do not exist yet.')
+
+    def handle(self, **options):
+        querysets = []
+        if options.get('type') in ('layer', 'all'):
+            querysets.append(Layer.objects.all().order_by('id'))
+        if options.get('type') in ('map', 'all'):
+            querysets.append(Map.objects.all().order_by('id'))
+        if options.get('filter'):
+            querysets = [_q.filter(title__icontains=options.get('filter')) for _q in querysets]
+
+        resources = [_r for _q in querysets for _r in _q]
+        if options.get('missing_only'):
+            resources = [_r for _r in resources if not thumb_exists(_thumbnail_name(_r))]
+
+        def regenerate(resource):
+            try:
+                create_gs_thumbnail(resource, overwrite=True, check_bbox=False)
+                return resource, None
+            except Exception as e:
+                return resource, e
+            finally:
+                connection.close()
+
+        start = time.time()
+        errors = []
+        with ThreadPoolExecutor(max_workers=max(1, options.get('workers'))) as executor:
+            for count, (resource, error) in enumerate(executor.map(regenerate, resources), start=1):
+                if error:
+                    errors.append(resource)
+                    print("[%s / %s] Thumbnail of %s failed: %s" % (count, len(resources), resource, error))
+                else:
+                    print("[%s / %s] Thumbnail of %s regenerated" % (count, len(resources), resource))
+        print("%s thumbnails regenerated in %.1fs, %s errors" % (
+            len(resources) - len(errors), time.time() - start, len(errors)))
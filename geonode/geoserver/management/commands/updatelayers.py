@@ -86,6 +86,24 @@ class Command(BaseCommand):
             dest="permissions",
             default=None,
             help="Permissions to apply to each layer")
+        parser.add_argument(
+            '--workers',
+            dest="workers",
+            type=int,
+            default=1,
+            help="Number of layers synchronized concurrently")
+        parser.add_argument(
+            '--checkpoint',
+            dest="checkpoint",
+            default=None,
+            help="File where the progress is saved; an interrupted run started "
+                 "again with the same file skips the layers already synchronized")
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only show the layers which would be created, updated or deleted.')
 
     def handle(self, **options):
         ignore_errors = options.get('ignore_errors')
@@ -120,7 +138,10 @@ class Command(BaseCommand):
             skip_geonode_registered=skip_geonode_registered,
             remove_deleted=remove_deleted,
             permissions=permissions,
-            execute_signals=True)
+            execute_signals=True,
+            workers=options.get('workers'),
+            checkpoint=options.get('checkpoint'),
+            dry_run=options.get('dry_run'))
 
         if verbosity > 1:
             print("\nDetailed report of failures:")
@@ -140,6 +161,8 @@ class Command(BaseCommand):
                                                   dict_['traceback'])
 
         if verbosity > 0:
+            if output['dry_run']:
+                print("\n\nDry run, no changes have been made.")
             print("\n\nFinished processing {} layers in {} seconds.\n".format(
                 len(output['layers']), round(output['stats']['duration_sec'], 2)))
             print("{} Created layers".format(output['stats']['created']))
@@ -128,3 +128,20 @@ def geoserver_post_save_map(instance, sender, created, **kwargs):
         instance.thumbnail_url == staticfiles.static(settings.MISSING_THUMBNAIL):
             logger.debug("... Creating Thumbnail for Map [%s]" % (instance.title))
             create_gs_thumbnail(instance, overwrite=False, check_bbox=True)
+
+
+@on_ogc_backend(BACKEND_PACKAGE)
+def geoserver_permissions_bulk_changed(sender, resources, perm_specs, **kwargs):
+    """Reconciles at once the GeoFence rules of the layers whose permissions
+    have been set by set_permissions_bulk
+    """
+    if not settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
+        return
+    from geonode.security.utils import sync_geofence_layers_with_guardian
+    layers = Layer.objects.filter(id__in=[_r.id for _r in resources]).select_related('owner')
+    failed = sync_geofence_layers_with_guardian(
+        [(_l, perm_specs[_l.id], _l.owner) for _l in layers])
+    for layer in failed:
+        # the next sync_resources_with_guardian run will retry
+        logger.error("Could not sync the GeoFence Rules of Layer {}".format(layer))
+        layer.set_dirty_state()
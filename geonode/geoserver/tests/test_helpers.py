@@ -21,7 +21,14 @@ from geonode.tests.base import GeoNodeBaseTestSupport
 
 import os
 import re
+import json
 import gisdata
+import tempfile
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test.utils import override_settings
 
 from geonode import geoserver
 from geonode.decorators import on_ogc_backend
@@ -31,6 +38,7 @@ from geonode.layers.utils import file_upload
 from geonode.layers.populate_layers_data import create_layer_data
 
 from geonode.geoserver.views import _response_callback
+from geonode.geoserver.helpers import gs_slurp, ogc_server_settings, _prepare_thumbnail_body_from_opts
 
 import logging
 logger = logging.getLogger(__name__)
@@ -187,3 +195,116 @@ xlink:href="http://localhost:8080/geoserver/ows?service=WMS&amp;request=GetLegen
                   'content_type': 'text/xml; charset=UTF-8'}
         _content = _response_callback(**kwargs).content
         self.assertTrue(re.findall('http://localhost:8000/gs/ows', str(_content)))
+
+    def _gs_resource(self, name, workspace, store):
+        _workspace = SimpleNamespace(name=workspace)
+        _store = SimpleNamespace(name=store, workspace=_workspace, resource_type='dataStore')
+        return SimpleNamespace(
+            name=name, workspace=_workspace, store=_store, enabled=True, advertised=True,
+            native_bbox=[-180, 180, -90, 90, 'EPSG:4326'], projection='EPSG:4326')
+
+    def test_gs_slurp_dry_run(self):
+        """
+        Ensures gs_slurp only reports the differences when running in dry-run mode.
+        """
+        layer = Layer.objects.all()[0]
+        layers_count = Layer.objects.count()
+
+        resources = [self._gs_resource(layer.name, layer.workspace, layer.store),
+                     self._gs_resource('not_in_geonode', 'geonode', 'geonode_data')]
+        with patch('geonode.geoserver.helpers.gs_catalog') as cat:
+            cat.get_resources.return_value = resources
+            output = gs_slurp(remove_deleted=True, dry_run=True)
+
+        self.assertTrue(output['dry_run'])
+        self.assertEqual(output['stats']['created'], 1)
+        self.assertEqual(output['stats']['updated'], 1)
+        self.assertEqual(output['stats']['deleted'], layers_count - 1)
+        self.assertEqual(Layer.objects.count(), layers_count)
+
+    @patch.object(Layer, 'set_bbox_polygon')
+    @patch.object(Layer, 'set_permissions')
+    @patch('geonode.geoserver.helpers._perms_info_json', return_value='{}')
+    @patch('geonode.geoserver.helpers.set_attributes_from_geoserver')
+    def test_gs_slurp_checkpoint(self, set_attributes, *args):
+        """
+        Ensures gs_slurp skips the layers recorded in the checkpoint file
+        and removes the file once the run is complete.
+        """
+        layers = list(Layer.objects.order_by('id')[:3])
+        checkpoint = os.path.join(tempfile.mkdtemp(), 'gs_slurp.json')
+        with open(checkpoint, 'w') as checkpoint_file:
+            json.dump({'layers': ['%s:%s' % (layers[0].workspace, layers[0].name)]}, checkpoint_file)
+
+        resources = [self._gs_resource(layer.name, layer.workspace, layer.store) for layer in layers]
+        with patch('geonode.geoserver.helpers.gs_catalog') as cat:
+            cat.get_resources.return_value = resources
+            output = gs_slurp(checkpoint=checkpoint)
+
+        self.assertEqual(output['stats']['updated'], 2)
+        self.assertEqual(output['stats']['failed'], 0)
+        self.assertEqual(
+            sorted(info['name'] for info in output['layers']),
+            sorted(layer.name for layer in layers[1:]))
+        self.assertEqual(
+            sorted(call[0][0].name for call in set_attributes.call_args_list),
+            sorted(layer.name for layer in layers[1:]))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    @patch.object(Layer, 'set_bbox_polygon')
+    @patch.object(Layer, 'set_permissions')
+    @patch('geonode.geoserver.helpers._perms_info_json', return_value='{}')
+    @patch('geonode.geoserver.helpers.set_attributes_from_geoserver')
+    def test_gs_slurp_workers(self, set_attributes, *args):
+        """
+        Ensures gs_slurp synchronizes every layer when running on several threads.
+        """
+        layers = list(Layer.objects.all())
+        resources = [self._gs_resource(layer.name, layer.workspace, layer.store) for layer in layers]
+        # a failure in one thread does not stop the others
+        resources[-1].native_bbox = None
+        with patch('geonode.geoserver.helpers.gs_catalog') as cat:
+            cat.get_resources.return_value = resources
+            output = gs_slurp(workers=4)
+
+        self.assertEqual(output['stats']['updated'], len(layers) - 1)
+        self.assertEqual(output['stats']['failed'], 1)
+        self.assertEqual(
+            sorted(info['name'] for info in output['layers']),
+            sorted(layer.name for layer in layers))
+        self.assertEqual(set_attributes.call_count, len(layers) - 1)
+
+    @override_settings(THUMBNAIL_GENERATOR_DEFAULT_BG=None, PROXY_ALLOWED_HOSTS=('.example.org',))
+    def test_thumbnail_tiles_hosts(self):
+        """
+        Ensures the thumbnail tiles are fetched from GeoServer internal location
+        and only from the allowed hosts.
+        """
+        request_body = {
+            'bbox': [-10, 10, -10, 10],
+            'srid': 'EPSG:4326',
+            'zoom': 1,
+            'width': 256,
+            'height': 256,
+            'smurl': 'http://tiles.example.org/{z}/{x}/{y}.png',
+            'thumbnail_create_url': '%swms?service=WMS&request=GetMap&layers=geonode:foo' % (
+                ogc_server_settings.public_url),
+        }
+        with patch('geonode.geoserver.helpers.thumbnail_renderer') as renderer:
+            renderer.render.return_value = b'image'
+            self.assertEqual(_prepare_thumbnail_body_from_opts(dict(request_body)), b'image')
+            tiles = [url for url, left, top in renderer.render.call_args[0][1]]
+            self.assertTrue(any(url.startswith('http://tiles.example.org/') for url in tiles))
+            self.assertTrue(any(url.startswith('%swms?' % ogc_server_settings.LOCATION) for url in tiles))
+
+            # the unknown background hosts are skipped
+            renderer.render.reset_mock()
+            _prepare_thumbnail_body_from_opts(dict(request_body, smurl='http://169.254.169.254/{z}/{x}/{y}'))
+            tiles = [url for url, left, top in renderer.render.call_args[0][1]]
+            self.assertFalse(any('169.254.169.254' in url for url in tiles))
+
+            # nothing is fetched from an unknown WMS host
+            renderer.render.reset_mock()
+            self.assertIsNone(_prepare_thumbnail_body_from_opts(
+                dict(request_body, thumbnail_create_url='http://169.254.169.254/wms?layers=foo')))
+            self.assertFalse(renderer.render.called)
@@ -836,6 +836,49 @@ class LayerTests(GeoNodeBaseTestSupport):
         self.assertEqual('admin', response_json['fullname'])
         self.assertEqual('ad@m.in', response_json['email'])
 
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    def test_layer_acls_cache_invalidation(self):
+        """ Verify that the cached layer_acls are dropped on permissions changes
+        """
+        valid_auth_headers = {
+            'HTTP_AUTHORIZATION': 'basic ' +
+            base64.b64encode(b"bobby:bob").decode(),
+        }
+        bob = get_user_model().objects.get(username='bobby')
+        layer_ca = Layer.objects.get(alternate='geonode:CA')
+
+        response = self.client.get(reverse('layer_acls'), **valid_auth_headers)
+        self.assertNotIn('geonode:CA', json.loads(response.content.decode('UTF-8'))['rw'])
+        response = self.client.get(reverse('layer_acls'), **valid_auth_headers)
+        self.assertNotIn('geonode:CA', json.loads(response.content.decode('UTF-8'))['rw'])
+
+        assign_perm('change_layer_data', bob, layer_ca)
+        response = self.client.get(reverse('layer_acls'), **valid_auth_headers)
+        self.assertIn('geonode:CA', json.loads(response.content.decode('UTF-8'))['rw'])
+
+        # Latency stats are available to superusers only
+        response = self.client.get(reverse('layer_acls_stats'))
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(reverse('layer_acls_stats'))
+        stats = json.loads(response.content.decode('UTF-8'))
+        self.assertIn('layer_acls', stats)
+        self.assertEqual(stats['layer_acls']['count'], stats['layer_acls']['hits'] + stats['layer_acls']['misses'])
+
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_authenticate_cached(self):
+        """ Verify that the credentials cache reports its hits and misses
+        """
+        from geonode.geoserver.acl import authenticate_cached
+        user, hit = authenticate_cached(username='bobby', password='bob')
+        self.assertEqual(user.username, 'bobby')
+        self.assertFalse(hit)
+        user, hit = authenticate_cached(username='bobby', password='bob')
+        self.assertEqual(user.username, 'bobby')
+        self.assertTrue(hit)
+        self.assertEqual(authenticate_cached(username='bobby', password='wrong'), (None, False))
+
     @on_ogc_backend(geoserver.BACKEND_PACKAGE)
     def test_resolve_user(self):
         """Verify that the resolve_user view is behaving as expected
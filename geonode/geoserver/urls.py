@@ -79,6 +79,7 @@ urlpatterns = [  # 'geonode.geoserver.views',
     url(r'^(?P<layername>[^/]*)/style-check?$',
         views.style_edit_check, name="style_edit_check"),
     url(r'^acls/?$', views.layer_acls, name='layer_acls'),
+    url(r'^acls/stats/?$', views.layer_acls_stats, name='layer_acls_stats'),
     url(r'^resolve_user/?$', views.resolve_user,
         name='layer_resolve_user'),
     url(r'^online/?$', views.server_online, name='server_online'),
@@ -21,6 +21,8 @@
 import os
 import re
 import json
+import codecs
+import time
 import logging
 import traceback
 from lxml import etree
@@ -33,8 +35,7 @@ from urllib.parse import (
     unquote,
     parse_qsl)
 
-from django.contrib.auth import authenticate
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import render
 from django.conf import settings
@@ -58,6 +59,7 @@ from geonode.layers.views import _resolve_layer, _PERMISSION_MSG_MODIFY
 from geonode.maps.models import Map
 from geonode.proxy.views import proxy
 from .tasks import geoserver_update_layers
+from .acl import acls_stats, authenticate_cached, get_layer_acls
 from geonode.utils import json_response, _get_basic_auth_info, http_client
 from geoserver.catalog import FailedRequestError
 from geonode.geoserver.signals import (
@@ -560,12 +562,52 @@ def geoserver_proxy(request,
     return response
 
 
+def _rewrite_proxy_urls(chunks):
+    """
+    Replaces the GeoServer URLs with the GeoNode proxy ones in a stream of
+    bytes chunks, the same way _response_callback does on the whole content.
+    """
+    _gn_proxy_url = urljoin(settings.SITEURL, '/gs/')
+    locations = [_l for _l in (ogc_server_settings.LOCATION, ogc_server_settings.PUBLIC_LOCATION) if _l]
+    ows_endpoint = re.compile(r'{}w\ws'.format(re.escape(_gn_proxy_url)), re.IGNORECASE)
+    # no match can be longer than this, as many chars are kept back for the next chunk
+    overlap = max([len(_l) for _l in locations] + [len(_gn_proxy_url) + 3])
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def _replace(text):
+        for location in locations:
+            text = text.replace(location, _gn_proxy_url)
+        return ows_endpoint.sub('{}ows'.format(_gn_proxy_url), text)
+
+    _buffer = ''
+    for chunk in chunks:
+        _buffer = _replace(_buffer + decoder.decode(chunk))
+        if len(_buffer) > overlap:
+            yield _buffer[:-overlap].encode('UTF-8')
+            _buffer = _buffer[-overlap:]
+    _buffer = _replace(_buffer + decoder.decode(b'', final=True))
+    if _buffer:
+        yield _buffer.encode('UTF-8')
+
+
 def _response_callback(**kwargs):
     content = kwargs['content']
     status = kwargs['status']
     content_type = kwargs['content_type']
     content_type_list = ['application/xml', 'text/xml', 'text/plain', 'application/json', 'text/json']
 
+    if kwargs.get('streaming'):
+        # content is an iterator over the upstream response body
+        if content_type and re.findall(r"(?=(\b" + '|'.join(content_type_list) + r"\b))", content_type):
+            content = _rewrite_proxy_urls(content)
+        if 'affected_layers' in kwargs and kwargs['affected_layers']:
+            for layer in kwargs['affected_layers']:
+                geoserver_post_save_local(layer)
+        return StreamingHttpResponse(
+            streaming_content=content,
+            status=status,
+            content_type=content_type or 'application/octet-stream')
+
     if content:
         if not content_type:
             if isinstance(content, bytes):
@@ -604,13 +646,16 @@ def _response_callback(**kwargs):
 
 
 def resolve_user(request):
+    start = time.time()
     user = None
     geoserver = False
     superuser = False
     acl_user = request.user
+    # the session users need no credentials check
+    hit = True
     if 'HTTP_AUTHORIZATION' in request.META:
         username, password = _get_basic_auth_info(request)
-        acl_user = authenticate(username=username, password=password)
+        acl_user, hit = authenticate_cached(username=username, password=password)
         if acl_user:
             user = acl_user.username
             superuser = acl_user.is_superuser
@@ -636,16 +681,39 @@ def resolve_user(request):
     if acl_user and acl_user.is_authenticated:
         resp['fullname'] = acl_user.get_full_name()
         resp['email'] = acl_user.email
+    acls_stats.add('resolve_user', time.time() - start, hit)
     return HttpResponse(json.dumps(resp), content_type="application/json")
 
 
-@logged_in_or_basicauth(realm="GeoNode")
+def _get_layer_acls(acl_user):
+    # Include permissions on the anonymous user
+    # use of polymorphic selectors/functions to optimize performances
+    resources_readable = get_objects_for_user(
+        acl_user, 'view_resourcebase',
+        ResourceBase.objects.filter(polymorphic_ctype__model='layer')).values_list('id', flat=True)
+    layer_writable = get_objects_for_user(
+        acl_user, 'change_layer_data',
+        Layer.objects.all())
+
+    _read = set(
+        Layer.objects.filter(
+            id__in=resources_readable).values_list(
+            'alternate',
+            flat=True))
+    _write = set(layer_writable.values_list('alternate', flat=True))
+
+    read_only = _read ^ _write
+    read_write = _read & _write
+    return list(read_write), list(read_only)
+
+
 def layer_acls(request):
     """
     returns json-encoded lists of layer identifiers that
     represent the sets of read-write and read-only layers
     for the currently authenticated user.
     """
+    start = time.time()
     # the layer_acls view supports basic auth, and a special
     # user which represents the geoserver administrator that
     # is not present in django.
@@ -653,7 +721,7 @@ def layer_acls(request):
     if 'HTTP_AUTHORIZATION' in request.META:
         try:
             username, password = _get_basic_auth_info(request)
-            acl_user = authenticate(username=username, password=password)
+            acl_user = authenticate_cached(username=username, password=password)[0]
 
             # Nope, is it the special geoserver user?
             if (acl_user is None and
@@ -677,29 +745,16 @@ def layer_acls(request):
             return HttpResponse(_("Bad HTTP Authorization Credentials."),
                                 status=401,
                                 content_type="text/plain")
+    elif not acl_user.is_authenticated:
+        response = HttpResponse(status=401)
+        response['WWW-Authenticate'] = 'Basic realm="GeoNode"'
+        return response
 
-    # Include permissions on the anonymous user
-    # use of polymorphic selectors/functions to optimize performances
-    resources_readable = get_objects_for_user(
-        acl_user, 'view_resourcebase',
-        ResourceBase.objects.filter(polymorphic_ctype__model='layer')).values_list('id', flat=True)
-    layer_writable = get_objects_for_user(
-        acl_user, 'change_layer_data',
-        Layer.objects.all())
-
-    _read = set(
-        Layer.objects.filter(
-            id__in=resources_readable).values_list(
-            'alternate',
-            flat=True))
-    _write = set(layer_writable.values_list('alternate', flat=True))
-
-    read_only = _read ^ _write
-    read_write = _read & _write
+    (read_write, read_only), hit = get_layer_acls(acl_user, _get_layer_acls)
 
     result = {
-        'rw': list(read_write),
-        'ro': list(read_only),
+        'rw': read_write,
+        'ro': read_only,
         'name': acl_user.username,
         'is_superuser': acl_user.is_superuser,
         'is_anonymous': acl_user.is_anonymous,
@@ -708,9 +763,19 @@ def layer_acls(request):
         result['fullname'] = acl_user.get_full_name()
         result['email'] = acl_user.email
 
+    acls_stats.add('layer_acls', time.time() - start, hit)
     return HttpResponse(json.dumps(result), content_type="application/json")
 
 
+@user_passes_test(lambda u: u.is_superuser)
+def layer_acls_stats(request):
+    """
+    returns the latency percentiles and the cache counters
+    of the GeoServer authentication callbacks.
+    """
+    return HttpResponse(json.dumps(acls_stats.get()), content_type="application/json")
+
+
 # capabilities
 def get_layer_capabilities(layer, version='1.3.0', access_token=None, tolerant=False):
     """
@@ -23,10 +23,11 @@ from dialogos.models import Comment
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import Avg
 from haystack import indexes
+from geonode.security.search_indexes import ResourceBaseACLIndex
 from geonode.maps.models import Layer
 
 
-class LayerIndex(indexes.SearchIndex, indexes.Indexable):
+class LayerIndex(ResourceBaseACLIndex, indexes.Indexable):
     id = indexes.IntegerField(model_attr='resourcebase_ptr_id')
     abstract = indexes.CharField(model_attr="abstract", boost=1.5)
     category__gn_description = indexes.CharField(model_attr="category__gn_description", null=True)
@@ -57,6 +57,7 @@ from geonode.base.auth import get_or_create_token
 from geonode.base.bbox_utils import BBOXHelper
 from geonode import GeoNodeException, geoserver, qgis_server
 from geonode.people.utils import get_valid_user
+from geonode.security.utils import set_permissions_bulk
 from geonode.layers.models import UploadSession, LayerFile
 from geonode.base.thumb_utils import thumb_exists
 from geonode.base.models import Link, SpatialRepresentationType,  \
@@ -1311,6 +1312,7 @@ def set_layers_permissions(permissions_name, resources_names=None,
                         )
                     else:
                         # RESOURCES
+                        perm_specs = {}
                         for resource in resources:
                             # Existing permissions on the resource
                             perm_spec = resource.get_all_level_info()
@@ -1396,12 +1398,13 @@ def set_layers_permissions(permissions_name, resources_names=None,
                                             "The group %s does not have any permission on the layer %s. "
                                             "It has been skipped." % (g.name, resource.title)
                                         )
-                            # Set final permissions
-                            resource.set_permissions(perm_spec)
+                            perm_specs[resource.id] = perm_spec
                             if verbose:
                                 print(
                                     "Final permissions info for the resource %s:" % resource.title
                                 )
                                 print(perm_spec)
+                        # Set final permissions on all the resources at once
+                        set_permissions_bulk(resources, lambda resource: perm_specs[resource.id])
                         if verbose:
                             print("Permissions successfully updated!")
@@ -21,9 +21,10 @@
 import logging
 import time
 import json
+from collections import OrderedDict
 from datetime import datetime
 
-# from django.conf import settings
+from django.conf import settings
 from kombu.mixins import ConsumerMixin
 from geonode.geoserver.signals import geoserver_post_save_local
 from geonode.security.views import send_email_consumer  # , send_email_owner_on_view
@@ -46,9 +47,88 @@ from .queues import (
 logger = logging.getLogger(__package__)
 
 
+class EventsDebouncer(object):
+    """Coalesces the GeoServer catalog and data events.
+
+    The events are collected per (workspace, store, name) during
+    ``interval`` seconds, duplicates are dropped, then the layers they
+    concern are synchronized with a single ``gs_slurp`` per workspace and
+    store. The messages are acknowledged once synchronized.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = OrderedDict()
+        self._messages = []
+        self._oldest = None
+        self.stats = {
+            'received': 0,
+            'coalesced': 0,
+            'synchronized': 0,
+            'flushes': 0,
+            # seconds between the oldest event of the last batch and its sync
+            'lag': 0,
+        }
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def depth(self):
+        """Number of received messages not synchronized yet."""
+        return len(self._messages)
+
+    def add(self, body, message=None):
+        event = json.loads(body)
+        source = event["source"]
+        key = (source.get("workspace"), source.get("store"), source["name"])
+        self.stats['received'] += 1
+        if key in self._pending:
+            self.stats['coalesced'] += 1
+        else:
+            self._pending[key] = _parse_timestamp(event.get("timestamp"))
+        if self._oldest is None:
+            self._oldest = time.time()
+        if message is not None:
+            self._messages.append(message)
+
+    def is_due(self):
+        return self._oldest is not None and time.time() - self._oldest >= self.interval
+
+    def flush(self):
+        pending, messages, oldest = self._pending, self._messages, self._oldest
+        self._pending, self._messages, self._oldest = OrderedDict(), [], None
+
+        stores = OrderedDict()
+        for workspace, store, name in pending:
+            stores.setdefault((workspace, store), set()).add(name)
+        for (workspace, store), names in stores.items():
+            try:
+                gs_slurp(True, workspace=workspace, store=store, filter=names,
+                         remove_deleted=True, execute_signals=True)
+            except Exception:
+                logger.exception("Could not synchronize layers {} of {}:{}".format(
+                    sorted(names), workspace, store))
+        for message in messages:
+            message.ack()
+
+        if pending:
+            timestamps = [t for t in pending.values() if t is not None]
+            if timestamps:
+                lag = (datetime.utcnow() - min(timestamps)).total_seconds()
+            else:
+                lag = time.time() - oldest
+            self.stats['synchronized'] += len(pending)
+            self.stats['flushes'] += 1
+            self.stats['lag'] = lag
+            logger.info("Synchronized {} layers from {} events in {} stores, lag {:.0f}s".format(
+                len(pending), len(messages), len(stores), lag))
+
+
 class Consumer(ConsumerMixin):
     def __init__(self, connection, messages_limit=None):
-        self.last_message = None
+        self.debouncer = EventsDebouncer(
+            getattr(settings, 'GEOSERVER_EVENTS_COALESCE_INTERVAL', 10))
         self.connection = connection
         self.messages_limit = messages_limit
 
@@ -79,7 +159,13 @@ class Consumer(ConsumerMixin):
                 self.should_stop = True
             return True
 
+    def on_iteration(self):
+        if self.debouncer.is_due():
+            self.debouncer.flush()
+            logger.debug("geoserver events: {}".format(self.debouncer.stats))
+
     def on_consume_end(self, connection, channel):
+        self.debouncer.flush()
         super(Consumer, self).on_consume_end(connection, channel)
         logger.debug("finished.")
 
@@ -135,22 +221,24 @@ class Consumer(ConsumerMixin):
     def on_geoserver_catalog(self, body, message):
         logger.debug("on_geoserver_catalog: RECEIVED MSG - body: %r" % (body,))
         try:
-            _update_layer_data(body, self.last_message)
-            self.last_message = json.loads(body)
+            self.debouncer.add(body, message)
         except Exception:
             logger.debug("Could not encode message {!r}".format(body))
-        message.ack()
+            message.ack()
+        if self.debouncer.is_due():
+            self.debouncer.flush()
         logger.debug("on_geoserver_catalog: finished")
         self._check_message_limit()
 
     def on_geoserver_data(self, body, message):
         logger.debug("on_geoserver_data: RECEIVED MSG - body: %r" % (body,))
         try:
-            _update_layer_data(body, self.last_message)
-            self.last_message = json.loads(body)
+            self.debouncer.add(body, message)
         except Exception:
             logger.debug("Could not encode message {!r}".format(body))
-        message.ack()
+            message.ack()
+        if self.debouncer.is_due():
+            self.debouncer.flush()
         logger.debug("on_geoserver_data: finished")
         self._check_message_limit()
 
@@ -178,31 +266,11 @@ class Consumer(ConsumerMixin):
         self._check_message_limit()
 
 
-def _update_layer_data(body, last_message):
-    message = json.loads(body)
-    workspace = message["source"]["workspace"] if "workspace" in message["source"] else None
-    store = message["source"]["store"] if "store" in message["source"] else None
-    filter = message["source"]["name"]
-
-    update_layer = False
-    if not last_message:
-        last_message = message
-        update_layer = True
-    else:
-        last_workspace = message["source"]["workspace"] if "workspace" in message["source"] else None
-        last_store = message["source"]["store"] if "store" in message["source"] else None
-        last_filter = last_message["source"]["name"]
-        if (last_workspace, last_store, last_filter) != (workspace, store, filter):
-            update_layer = True
-        else:
-            timestamp_t1 = datetime.strptime(last_message["timestamp"], '%Y-%m-%dT%H:%MZ')
-            timestamp_t2 = datetime.strptime(message["timestamp"], '%Y-%m-%dT%H:%MZ')
-            timestamp_delta = timestamp_t2 - timestamp_t1
-            if timestamp_t2 > timestamp_t1 and timestamp_delta.seconds > 60:
-                update_layer = True
-
-    if update_layer:
-        gs_slurp(True, workspace=workspace, store=store, filter=filter, remove_deleted=True, execute_signals=True)
+def _parse_timestamp(timestamp):
+    try:
+        return datetime.strptime(timestamp, '%Y-%m-%dT%H:%MZ')
+    except (TypeError, ValueError):
+        return None
 
 
 def _wait_for_layer(layer_id, num_attempts=5, wait_seconds=1):
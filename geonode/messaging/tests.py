@@ -18,10 +18,17 @@
 #
 #########################################################################
 
+import json
+
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
+
 from geonode.tests.base import GeoNodeBaseTestSupport
 
 from geonode.messaging import connection
-from geonode.messaging.consumer import Consumer
+from geonode.messaging.consumer import Consumer, EventsDebouncer
 
 
 class MessagingTest(GeoNodeBaseTestSupport):
@@ -44,3 +51,32 @@ class MessagingTest(GeoNodeBaseTestSupport):
                 self.assertTrue(worker is not None)
             except Exception:
                 self.fail("could not create a Consumer.")
+
+    @mock.patch('geonode.messaging.consumer.gs_slurp')
+    def test_events_debouncer(self, mock_gs_slurp):
+        def event(store, name):
+            return json.dumps({
+                "source": {"workspace": "geonode", "store": store, "name": name},
+                "timestamp": "2020-12-01T10:00Z"})
+
+        debouncer = EventsDebouncer(60)
+        messages = [mock.MagicMock() for i in range(4)]
+        debouncer.add(event("store_a", "roads"), messages[0])
+        debouncer.add(event("store_a", "roads"), messages[1])
+        debouncer.add(event("store_a", "rivers"), messages[2])
+        debouncer.add(event("store_b", "lakes"), messages[3])
+        self.assertFalse(debouncer.is_due())
+        self.assertEqual(len(debouncer), 3)
+        self.assertEqual(debouncer.depth, 4)
+        mock_gs_slurp.assert_not_called()
+
+        debouncer.flush()
+        self.assertEqual(mock_gs_slurp.call_count, 2)
+        filters = {
+            call[1]['store']: call[1]['filter'] for call in mock_gs_slurp.call_args_list}
+        self.assertEqual(filters, {"store_a": {"roads", "rivers"}, "store_b": {"lakes"}})
+        for message in messages:
+            message.ack.assert_called_once_with()
+        self.assertEqual(debouncer.depth, 0)
+        self.assertEqual(debouncer.stats['coalesced'], 1)
+        self.assertEqual(debouncer.stats['synchronized'], 3)
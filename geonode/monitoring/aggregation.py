@@ -25,11 +25,12 @@ import logging
 import pytz
 
 from django.conf import settings
+from django.db import connection, transaction
 from django.db.models import Sum, F
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 
-from geonode.monitoring.utils import generate_periods
-from geonode.monitoring.models import (Metric, MetricValue, ServiceTypeMetric,
+from geonode.monitoring.utils import generate_periods, align_period_start, align_period_end
+from geonode.monitoring.models import (Metric, MetricValue, MetricValueBucket, ServiceTypeMetric,
                                        MonitoredResource, MetricLabel, EventType,)
 
 
@@ -300,3 +301,98 @@ def aggregate_period(period_start, period_end, metric_data_q, cleanup=True):
     if cleanup:
         source_metric_data.filter(data=to_remove_data).delete()
     return counter
+
+
+# Rolls up the rows of a source table (metric values or finer buckets)
+# into buckets of %(bucket)s seconds, aligned to the epoch.
+ROLLUP_SQL = """
+insert into monitoring_metricvaluebucket
+    (bucket, valid_from, valid_to, service_id, service_metric_id, resource_id, event_type_id, label_id,
+     value_num, value_sum, value_min, value_max, samples_count, metric_count)
+select %(bucket)s, mv.bucket_start, mv.bucket_start + %(bucket)s * interval '1 second',
+       mv.service_id, mv.service_metric_id, mv.resource_id, mv.event_type_id, mv.label_id,
+       case when m.type = 'rate' then
+                 (case when sum(mv.samples_count) > 0
+                       then sum(mv.value_num * mv.samples_count) / sum(mv.samples_count) else 0 end)
+            when m.type = 'value_numeric' then max(mv.value_num)
+            else sum(mv.value_num) end,
+       sum({value_sum}), min({value_min}), max({value_max}), sum(mv.samples_count), {metric_count}
+from (select src.*, to_timestamp(floor(extract(epoch from src.valid_from) / %(bucket)s) * %(bucket)s) as bucket_start
+      from {source} src
+      where src.service_id = %(service_id)s
+        and src.valid_from >= %(valid_from)s and src.valid_from < %(valid_to)s {where}) mv
+join monitoring_servicetypemetric mt on (mv.service_metric_id = mt.id)
+join monitoring_metric m on (m.id = mt.metric_id)
+group by mv.bucket_start, mv.service_id, mv.service_metric_id, mv.resource_id, mv.event_type_id, mv.label_id, m.type
+"""
+
+
+def get_metric_bucket(interval, valid_from=None, buckets=None):
+    """
+    Returns the coarsest bucket size (timedelta) which can be used to
+    compute metrics over periods of ``interval`` starting at ``valid_from``.
+    Buckets which have not been populated back to ``valid_from`` yet (for
+    instance right after an upgrade) are skipped.
+    Returns None if metrics must be computed from the metric values.
+    """
+    if buckets is None:
+        buckets = getattr(settings, 'MONITORING_METRIC_BUCKETS', ())
+    interval_s = interval.total_seconds()
+    candidates = [b for b in buckets if b.total_seconds() <= interval_s and
+                  not interval_s % b.total_seconds()]
+    for bucket in sorted(candidates, reverse=True):
+        first = MetricValueBucket.objects.filter(bucket=bucket.total_seconds())\
+                                         .order_by('valid_from')\
+                                         .values_list('valid_from', flat=True)\
+                                         .first()
+        if first is None:
+            continue
+        if valid_from is None or first <= valid_from or \
+                not MetricValue.objects.filter(valid_from__lt=first).exists():
+            return bucket
+    return None
+
+
+def update_metric_buckets(service, valid_from, valid_to, buckets=None):
+    """
+    Refreshes the pre-aggregated buckets of ``service`` metric values
+    which overlap the [valid_from, valid_to) period.
+
+    The finest buckets are computed from the metric values, each following
+    tier from the previous one, so only a handful of rows are read for
+    the hour and day buckets.
+    """
+    if buckets is None:
+        buckets = getattr(settings, 'MONITORING_METRIC_BUCKETS', ())
+    source = None
+    with transaction.atomic(), connection.cursor() as cursor:
+        for bucket in sorted(buckets):
+            start = align_period_start(valid_from, bucket)
+            end = align_period_end(valid_to, bucket)
+            if end <= start:
+                end = start + bucket
+            MetricValueBucket.objects.filter(service=service,
+                                             bucket=bucket.total_seconds(),
+                                             valid_from__gte=start,
+                                             valid_from__lt=end).delete()
+            params = {'bucket': int(bucket.total_seconds()),
+                      'service_id': service.id,
+                      'valid_from': start,
+                      'valid_to': end}
+            if source is None:
+                q = ROLLUP_SQL.format(source='monitoring_metricvalue',
+                                      value_sum='mv.value_num',
+                                      value_min='mv.value_num',
+                                      value_max='mv.value_num',
+                                      metric_count='count(1)',
+                                      where='')
+            else:
+                q = ROLLUP_SQL.format(source='monitoring_metricvaluebucket',
+                                      value_sum='mv.value_sum',
+                                      value_min='mv.value_min',
+                                      value_max='mv.value_max',
+                                      metric_count='sum(mv.metric_count)',
+                                      where='and src.bucket = %(source_bucket)s')
+                params['source_bucket'] = int(source.total_seconds())
+            cursor.execute(q, params)
+            source = bucket
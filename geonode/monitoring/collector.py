@@ -23,10 +23,11 @@ import pytz
 from datetime import datetime, timedelta
 from decimal import Decimal
 from itertools import chain
+from collections import Counter, OrderedDict, defaultdict
 from six import string_types, integer_types
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils.html import strip_tags
 from django.template.loader import get_template
 from django.core.mail import EmailMultiAlternatives as EmailMessage
@@ -38,15 +39,16 @@ from django.urls import resolve, Resolver404
 from geonode.utils import raw_sql
 from geonode.notifications_helper import send_notification
 from geonode.monitoring import MonitoringAppConfig as AppConf
-from geonode.monitoring.models import (Metric, MetricValue, RequestEvent, MonitoredResource,
-                                       ExceptionEvent, EventType, NotificationCheck, BuiltIns)
+from geonode.monitoring.models import (Metric, MetricValue, MetricValueBucket, MetricLabel, RequestEvent,
+                                       MonitoredResource, ExceptionEvent, EventType, NotificationCheck,
+                                       BuiltIns, ServiceTypeMetric)
 
 from geonode.monitoring.utils import generate_periods, align_period_start, align_period_end
 from geonode.monitoring.aggregation import (aggregate_past_periods, calculate_rate, calculate_percent,
                                             extract_resources, extract_event_type,
                                             extract_event_types, extract_special_event_types,
                                             get_resources_for_metric, get_labels_for_metric,
-                                            get_metric_names)
+                                            get_metric_names, get_metric_bucket, update_metric_buckets)
 from geonode.base.models import ResourceBase
 from geonode.utils import parse_datetime
 
@@ -457,14 +459,26 @@ class CollectorAPI(object):
 
     def process(self, service, data, valid_from, valid_to, *args, **kwargs):
         if service.is_hostgeonode:
-            return self.process_host_geonode(
+            out = self.process_host_geonode(
                 service, data, valid_from, valid_to, *args, **kwargs)
         elif service.is_hostgeoserver:
-            return self.process_host_geoserver(
+            out = self.process_host_geoserver(
                 service, data, valid_from, valid_to, *args, **kwargs)
         else:
-            return self.process_requests(
+            out = self.process_requests(
                 service, data, valid_from, valid_to, *args, **kwargs)
+        try:
+            self.update_metric_buckets(service, valid_from, valid_to)
+        except Exception as err:
+            log.exception("Cannot update metric buckets of %s from %s to %s: %s",
+                          service, valid_from, valid_to, err)
+        return out
+
+    def update_metric_buckets(self, service, valid_from, valid_to):
+        """
+        Refreshes the pre-aggregated metric buckets of the given period
+        """
+        return update_metric_buckets(service, valid_from, valid_to)
 
     def process_requests(self, service, requests, valid_from, valid_to):
         """
@@ -506,92 +520,177 @@ class CollectorAPI(object):
             defaults['samples_count'] = cnt
             log.debug(MetricValue.add(value=cnt, value_num=cnt, value_raw=cnt, **defaults))
 
-    def process_requests_batch(self, service, requests, valid_from, valid_to):
+    # (metric name, request column) pairs computed for each requests group
+    REQUESTS_METRICS = (('request.ip', 'client_ip',),
+                        ('request.users', 'user_identifier',),
+                        ('request.country', 'client_country'),
+                        ('request.city', 'client_city',),
+                        ('request.region', 'client_region'),
+                        ('request.ua', 'user_agent',),
+                        ('request.ua.family', 'user_agent_family',),
+                        ('response.time', 'response_time',),
+                        ('response.size', 'response_size',),
+                        ('response.status', 'response_status',),
+                        ('request.method', 'request_method',),
+                        )
+
+    def aggregate_requests(self, metric, column_name, requests):
         """
-        Processes requests information into metric values
+        In-memory counterpart of ``set_metric_values``: returns the list of
+        (label, value, samples count) computed for ``metric`` over the
+        ``column_name`` values of ``requests`` rows.
         """
-        log.debug("Processing batch of %s requests from %s to %s", requests.count(), valid_from, valid_to)
-        if not requests.count():
-            return
-        event_all = EventType.objects.get(name=EventType.EVENT_ALL)
-        metric_defaults = {'valid_from': valid_from,
-                           'valid_to': valid_to,
-                           'event_type': event_all,
-                           'resource': None,
-                           'service': service}
-        MetricValue.objects.filter(
-            valid_from__gte=valid_from,
-            valid_to__lte=valid_to,
-            service=service).delete()
-        requests = requests.filter(service=service)
-        resources = self.extract_resources(requests)
-
-        def push_metric_values(srequests, **mdefaults):
-
-            count = srequests.count()
-            count_mdefaults = mdefaults.copy()
-            count_mdefaults['value'] = count
-            count_mdefaults['label'] = 'Count'
-            count_mdefaults['value_num'] = count
-            count_mdefaults['value_raw'] = count
-            count_mdefaults['samples_count'] = count
-
-            log.debug(MetricValue.add('request.count', **count_mdefaults))
-
-            paths = srequests.distinct('request_path') \
-                .values_list('request_path', flat=True)
-            for path in paths:
-                count = srequests.filter(request_path=path).count()
-                count_mdefaults['value'] = count
-                count_mdefaults['label'] = path
-                count_mdefaults['value_num'] = count
-                count_mdefaults['value_raw'] = count
-                count_mdefaults['samples_count'] = count
-
-                log.debug(MetricValue.add('request.path', **count_mdefaults))
-
-            for mname, cname in (('request.ip', 'client_ip',),
-                                 ('request.users', 'user_identifier',),
-                                 ('request.country', 'client_country'),
-                                 ('request.city', 'client_city',),
-                                 ('request.region', 'client_region'),
-                                 ('request.ua', 'user_agent',),
-                                 ('request.ua.family', 'user_agent_family',),
-                                 ('response.time', 'response_time',),
-                                 ('response.size', 'response_size',),
-                                 ('response.status', 'response_status',),
-                                 ('request.method', 'request_method',),
-                                 ):
-                # calculate overall stats
-                self.set_metric_values(mname, cname, srequests, **mdefaults)
-
-            self.set_error_values(
-                srequests,
-                valid_from,
-                valid_to,
-                service=service,
-                resource=None)
+        def _key(v):
+            return v[1] or 0
 
-        push_metric_values(requests, **metric_defaults)
+        values = [r[column_name] for r in requests if r[column_name] is not None]
+        if metric.is_rate:
+            value = sum(values) / len(values) if values else None
+            return [(Metric.TYPE_RATE, value, len(requests),)]
+        elif metric.is_count:
+            counts = Counter(r[column_name] for r in requests)
+            q = [(v, v * cnt if v is not None else None, cnt if v is not None else 0,)
+                 for v, cnt in counts.items()]
+        elif metric.is_value:
+            counts = Counter(values)
+            if column_name == 'user_identifier':
+                usernames = dict((r[column_name], r['user_username'],) for r in requests)
+                q = [((v, usernames[v],), cnt, cnt,) for v, cnt in counts.items()]
+            else:
+                q = [(v, cnt, cnt,) for v, cnt in counts.items()]
+        elif metric.is_value_numeric:
+            return [(Metric.TYPE_VALUE_NUMERIC, max(values) if values else None, len(values),)]
+        else:
+            raise ValueError("Unsupported metric type: {}".format(metric.type))
+        q.sort(key=_key, reverse=True)
+        return q[:100]
 
-        # for each resource we should calculate another set of stats
-        for resource, _requests in [(None, requests,)] + resources:
+    def get_metric_labels(self, labels):
+        """
+        Returns a dict of MetricLabel by name for the given label names
+        or (name, user) tuples, creating the missing ones.
+        """
+        users = {}
+        for label in labels:
+            if isinstance(label, tuple):
+                users.setdefault(str(label[0] or 'count'), label[1])
+            else:
+                users.setdefault(str(label or 'count'), None)
+        out = {}
+        for label in MetricLabel.objects.filter(name__in=list(users)).order_by('id'):
+            out.setdefault(label.name, label)
+        missing = [name for name in users if name not in out]
+        if missing:
+            MetricLabel.objects.bulk_create(
+                [MetricLabel(name=name, user=users[name]) for name in missing], batch_size=1000)
+            for label in MetricLabel.objects.filter(name__in=missing).order_by('id'):
+                out.setdefault(label.name, label)
+        return out
 
-            metric_defaults['resource'] = resource
-            metric_defaults['event_type'] = event_all
-            push_metric_values(_requests, **metric_defaults)
+    def process_requests_batch(self, service, requests, valid_from, valid_to):
+        """
+        Processes requests information into metric values
 
-            # for each event type we need separate metrics set
-            event_types = self.extract_event_types(_requests)
-            for event_type in event_types:
-                event_type_requests = _requests.filter(event_type=event_type)
-                metric_defaults['event_type'] = event_type
-                push_metric_values(event_type_requests, **metric_defaults)
+        Requests of the interval are fetched once and aggregated in memory
+        for each (resource, event type) group. Metric values are then
+        stored with a single bulk insert.
+        """
+        requests = requests.filter(service=service)
+        rows = list(requests.values(
+            'id', 'request_path', 'event_type_id', 'user_username',
+            *[cname for mname, cname in self.REQUESTS_METRICS]))
+        log.debug("Processing batch of %s requests from %s to %s", len(rows), valid_from, valid_to)
+        if not rows:
+            return
 
-            # combined event types: ows and non-ows
-            for evt, rq in self.extract_special_event_types(_requests):
-                metric_defaults['event_type'] = evt
-                push_metric_values(rq, **metric_defaults)
+        event_all = EventType.objects.get(name=EventType.EVENT_ALL)
+        ows_all = EventType.get(EventType.EVENT_OWS)
+        nonows_all = EventType.get(EventType.EVENT_OTHER)
+        event_types = EventType.objects.in_bulk({r['event_type_id'] for r in rows if r['event_type_id']})
+        event_types.update({evt.id: evt for evt in (event_all, ows_all, nonows_all,) if evt})
+
+        request_resources = defaultdict(list)
+        for request_id, resource_id in RequestEvent.resources.through.objects.filter(
+                requestevent__in=requests).values_list('requestevent_id', 'monitoredresource_id').distinct():
+            request_resources[request_id].append(resource_id)
+        resources = MonitoredResource.objects.in_bulk(
+            set(chain.from_iterable(request_resources.values())))
+
+        # requests rows for each (resource, event type) group
+        groups = OrderedDict()
+        for resource_id in [None] + list(resources):
+            groups[(resource_id, event_all.id,)] = []
+            for evt in (ows_all, nonows_all,):
+                if evt:
+                    groups[(resource_id, evt.id,)] = []
+        for row in rows:
+            event_type = event_types.get(row['event_type_id'])
+            group_types = [event_all.id]
+            if event_type:
+                group_types.append(event_type.id)
+                if event_type.name.startswith('OWS:'):
+                    if event_type.name != EventType.EVENT_OWS and ows_all:
+                        group_types.append(ows_all.id)
+                elif event_type.name != EventType.EVENT_OTHER and nonows_all:
+                    group_types.append(nonows_all.id)
+            for resource_id in [None] + request_resources.get(row['id'], []):
+                for event_type_id in set(group_types):
+                    groups.setdefault((resource_id, event_type_id,), []).append(row)
+
+        metrics = dict((stm.metric.name, stm,) for stm in ServiceTypeMetric.objects.filter(
+            service_type=service.service_type).select_related('metric'))
+
+        # list of (metric name, resource id, event type id, label, value, samples count)
+        values = []
+        for (resource_id, event_type_id), grequests in groups.items():
+            count = len(grequests)
+            values.append(('request.count', resource_id, event_type_id, 'Count', count, count,))
+            for path, count in Counter(r['request_path'] for r in grequests).items():
+                values.append(('request.path', resource_id, event_type_id, path, count, count,))
+            for mname, cname in self.REQUESTS_METRICS:
+                if mname not in metrics:
+                    log.debug("Metric %s not available for %s", mname, service)
+                    continue
+                for label, value, samples in self.aggregate_requests(metrics[mname].metric, cname, grequests):
+                    values.append((mname, resource_id, event_type_id, label, value, samples,))
+
+        # errors are reported for the whole interval only
+        errors = ExceptionEvent.objects.filter(request__in=requests)
+        if errors.exists():
+            cnt = errors.values('request_id').distinct().count()
+            values.append(('response.error.count', None, None, 'count', cnt, len(rows),))
+            for row in errors.order_by().values('error_type').annotate(
+                    cnt=models.Count('request_id', distinct=True)):
+                values.append(('response.error.types', None, None, row['error_type'], row['cnt'], row['cnt'],))
+
+        labels = self.get_metric_labels([v[3] for v in values])
+        metric_values = OrderedDict()
+        for mname, resource_id, event_type_id, label, value, samples in values:
+            if mname not in metrics:
+                continue
+            label = labels[str((label[0] if isinstance(label, tuple) else label) or 'count')]
+            value_num = value if isinstance(value, integer_types + (float, Decimal,)) else None
+            value = value or 0
+            metric_values[(mname, resource_id, event_type_id, label.id,)] = MetricValue(
+                valid_from=valid_from,
+                valid_to=valid_to,
+                service=service,
+                service_metric=metrics[mname],
+                label=label,
+                resource_id=resource_id,
+                event_type_id=event_type_id,
+                value=value,
+                value_raw=value,
+                value_num=value_num,
+                samples_count=samples or 0,
+                data={})
+
+        with transaction.atomic():
+            MetricValue.objects.filter(
+                valid_from__gte=valid_from,
+                valid_to__lte=valid_to,
+                service=service).delete()
+            MetricValue.objects.bulk_create(list(metric_values.values()), batch_size=1000)
 
     def get_metrics_for(self, metric_name,
                         valid_from=None,
@@ -626,6 +725,8 @@ class CollectorAPI(object):
         if not isinstance(interval, timedelta):
             interval = timedelta(seconds=interval)
         metric = Metric.objects.get(name=metric_name)
+        # read from the coarsest pre-aggregated buckets fitting the interval
+        bucket = get_metric_bucket(interval, valid_from) if metric_name != 'uptime' else None
         out = {'metric': metric.name,
                'input_valid_from': valid_from.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
                'input_valid_to': valid_to.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
@@ -634,6 +735,8 @@ class CollectorAPI(object):
                'type': metric.type,
                'axis_label': metric.unit,
                'data': []}
+        if bucket:
+            valid_from = align_period_start(valid_from, bucket)
         periods = generate_periods(valid_from, interval, valid_to, align=False)
         for pstart, pend in periods:
             pdata = self.get_metrics_data(metric_name, pstart, pend,
@@ -645,7 +748,8 @@ class CollectorAPI(object):
                                           service_type=service_type,
                                           resource=resource,
                                           resource_type=resource_type,
-                                          group_by=group_by)
+                                          group_by=group_by,
+                                          bucket=bucket)
             out['data'].append({
                 'valid_from': pstart.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
                 'valid_to': pend.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
@@ -676,15 +780,26 @@ class CollectorAPI(object):
                          resource_type=None,
                          event_type=None,
                          service_type=None,
-                         group_by=None):
+                         group_by=None,
+                         bucket=None):
         """
         Returns metric values for metric within given time span
+
+        When ``bucket`` (timedelta) is given, values are read from the
+        pre-aggregated buckets of that size instead of the metric values.
         """
         utc = pytz.utc
         params = {}
         col = 'mv.value_num'
         agg_f = self.get_aggregate_function(col, metric_name, service)
         has_agg = agg_f != col
+        if bucket:
+            # each bucket row stands for metric_count metric values
+            count_col = 'sum(mv.metric_count) as metric_count'
+            stats_cols = 'sum(mv.value_sum), min(mv.value_min), max(mv.value_max)'
+        else:
+            count_col = 'count(1) as metric_count'
+            stats_cols = 'sum(mv.value_num), min(mv.value_num), max(mv.value_num)'
         group_by_map = {'resource': {'select': ['mr.id', 'mr.type', 'mr.name', 'mr.resource_id'],
                                      'from': ['join monitoring_monitoredresource mr on (mv.resource_id = mr.id)'],
                                      'where': ['and mv.resource_id is not NULL'],
@@ -694,10 +809,9 @@ class CollectorAPI(object):
                         # for each resource get the number of unique labels
                         'resource_on_label': {'select_only': ['mr.id', 'mr.type', 'mr.name', 'mr.resource_id',
                                                               'count(distinct(ml.name)) as val',
-                                                              'count(1) as metric_count',
+                                                              count_col,
                                                               'sum(samples_count) as samples_count',
-                                                              'sum(mv.value_num), min(mv.value_num)',
-                                                              'max(mv.value_num)', ],
+                                                              stats_cols, ],
                                               'from': [('join monitoring_monitoredresource mr '
                                                         'on (mv.resource_id = mr.id)')],
                                               'where': ['and mv.resource_id is not NULL'],
@@ -708,10 +822,9 @@ class CollectorAPI(object):
                         # for each resource get the number of unique users
                         'resource_on_user': {'select_only': ['mr.id', 'mr.type', 'mr.name', 'mr.resource_id',
                                                              'count(distinct(ml.user)) as val',
-                                                             'count(1) as metric_count',
+                                                             count_col,
                                                              'sum(samples_count) as samples_count',
-                                                             'sum(mv.value_num), min(mv.value_num)',
-                                                             'max(mv.value_num)', ],
+                                                             stats_cols, ],
                                              'from': [('join monitoring_monitoredresource mr '
                                                        'on (mv.resource_id = mr.id)')],
                                              'where': ['and mv.resource_id is not NULL'],
@@ -720,11 +833,10 @@ class CollectorAPI(object):
                                              'grouper': ['resource', 'name', 'type', 'id', 'resource_id'],
                                              },
                         # resource count
-                        'count_on_resource': {'select_only': [('count(distinct(mr.id)) as val, '
-                                                               'count(1) as metric_count, '
-                                                               'sum(samples_count) as samples_count, '
-                                                               'sum(mv.value_num), min(mv.value_num), '
-                                                               'max(mv.value_num)')],
+                        'count_on_resource': {'select_only': ['count(distinct(mr.id)) as val',
+                                                              count_col,
+                                                              'sum(samples_count) as samples_count',
+                                                              stats_cols, ],
                                               'from': [('join monitoring_monitoredresource mr '
                                                         'on (mv.resource_id = mr.id)')],
                                               'where': ['and mr.id is not NULL'],
@@ -733,10 +845,9 @@ class CollectorAPI(object):
                                               'grouper': [],
                                               },
                         'event_type': {'select_only': ['ev.name as event_type', 'sum(mv.value_num) as val',
-                                                       'count(1) as metric_count',
+                                                       count_col,
                                                        'sum(samples_count) as samples_count',
-                                                       'sum(mv.value_num), min(mv.value_num)',
-                                                       'max(mv.value_num)', ],
+                                                       stats_cols, ],
                                        'from': ['join monitoring_eventtype ev on (ev.id = mv.event_type_id)',
                                                 ('join monitoring_monitoredresource mr '
                                                  'on (mv.resource_id = mr.id)')],
@@ -748,10 +859,9 @@ class CollectorAPI(object):
                         # for each event the unique label count
                         'event_type_on_label': {'select_only': ['ev.name as event_type',
                                                                 'count(distinct(ml.name)) as val',
-                                                                'count(1) as metric_count',
+                                                                count_col,
                                                                 'sum(samples_count) as samples_count',
-                                                                'sum(mv.value_num), min(mv.value_num)',
-                                                                'max(mv.value_num)', ],
+                                                                stats_cols, ],
                                                 'from': ['join monitoring_eventtype ev on (ev.id = mv.event_type_id)',
                                                          ('join monitoring_monitoredresource mr '
                                                           'on (mv.resource_id = mr.id)')],
@@ -763,10 +873,9 @@ class CollectorAPI(object):
                         # for each event the unique user count
                         'event_type_on_user': {'select_only': ['ev.name as event_type',
                                                                'count(distinct(ml.user)) as val',
-                                                               'count(1) as metric_count',
+                                                               count_col,
                                                                'sum(samples_count) as samples_count',
-                                                               'sum(mv.value_num), min(mv.value_num)',
-                                                               'max(mv.value_num)', ],
+                                                               stats_cols, ],
                                                'from': ['join monitoring_eventtype ev on (ev.id = mv.event_type_id)',
                                                         ('join monitoring_monitoredresource mr '
                                                          'on (mv.resource_id = mr.id)')],
@@ -776,9 +885,8 @@ class CollectorAPI(object):
                                                'grouper': [],
                                                },
                         # group by user: number of unique user
-                        'user': {'select_only': [('count(distinct(ml.user)) as val, '
-                                                  'count(1) as metric_count, sum(samples_count) as samples_count, '
-                                                  'sum(mv.value_num), min(mv.value_num), max(mv.value_num)')],
+                        'user': {'select_only': ['count(distinct(ml.user)) as val', count_col,
+                                                 'sum(samples_count) as samples_count', stats_cols, ],
                                  'from': [('join monitoring_monitoredresource mr '
                                            'on (mv.resource_id = mr.id)')],
                                  # 'from': [], do we want to retrieve also events not related to a monitored resource?
@@ -788,11 +896,10 @@ class CollectorAPI(object):
                                  'grouper': [],
                                  },
                         # number of labels for each user
-                        'user_on_label': {'select_only': ['ml.user as user, count(distinct(ml.name)) as val, '
-                                                          'count(1) as metric_count',
+                        'user_on_label': {'select_only': ['ml.user as user', 'count(distinct(ml.name)) as val',
+                                                          count_col,
                                                           'sum(samples_count) as samples_count',
-                                                          'sum(mv.value_num), min(mv.value_num)',
-                                                          'max(mv.value_num)'],
+                                                          stats_cols],
                                           'from': [('join monitoring_monitoredresource mr '
                                                     'on (mv.resource_id = mr.id)')],
                                           'where': ['and ml.user is not NULL'],
@@ -801,9 +908,8 @@ class CollectorAPI(object):
                                           'grouper': [],
                                           },
                         # group by label
-                        'label': {'select_only': [('count(distinct(ml.name)) as val, '
-                                                   'count(1) as metric_count, sum(samples_count) as samples_count, '
-                                                   'sum(mv.value_num), min(mv.value_num), max(mv.value_num)')],
+                        'label': {'select_only': ['count(distinct(ml.name)) as val', count_col,
+                                                  'sum(samples_count) as samples_count', stats_cols, ],
                                   'from': [('join monitoring_monitoredresource mr '
                                             'on (mv.resource_id = mr.id)')],
                                   'where': [],  # ["and mv.resource_id is NULL or (mr.type = '')"],
@@ -824,6 +930,13 @@ class CollectorAPI(object):
                    'and m.name = %(metric_name)s']
         if metric_name == 'uptime':
             q_where = ['where', 'm.name = %(metric_name)s']
+        elif bucket:
+            q_from[0] = 'from monitoring_metricvaluebucket mv'
+            q_where = ['where', " mv.valid_from >= TIMESTAMP %(valid_from)s AT TIME ZONE 'UTC' ",
+                       "and mv.valid_from < TIMESTAMP %(valid_to)s AT TIME ZONE 'UTC' ",
+                       'and mv.bucket = %(bucket)s',
+                       'and m.name = %(metric_name)s']
+            params['bucket'] = int(bucket.total_seconds())
         q_group = ['ml.name']
 
         params.update({'metric_name': metric_name,
@@ -832,9 +945,8 @@ class CollectorAPI(object):
 
         q_order_by = ['val desc']
 
-        q_select = [('select ml.name as label, {} as val, '
-                     'count(1) as metric_count, sum(samples_count) as samples_count, '
-                     'sum(mv.value_num), min(mv.value_num), max(mv.value_num)').format(agg_f)]
+        q_select = ['select ml.name as label, {} as val, {}, sum(samples_count) as samples_count, {}'
+                    .format(agg_f, count_col, stats_cols)]
         if service and service_type:
             raise ValueError(
                 "Cannot use service and service type in the same query")
@@ -974,6 +1086,7 @@ class CollectorAPI(object):
         ExceptionEvent.objects.filter(created__lte=cutoff).delete()
         RequestEvent.objects.filter(created__lte=cutoff).delete()
         MetricValue.objects.filter(valid_to__lte=cutoff).delete()
+        MetricValueBucket.objects.filter(valid_to__lte=cutoff).delete()
 
     def compose_notifications(self, ndata, when=None):
         utc = pytz.utc
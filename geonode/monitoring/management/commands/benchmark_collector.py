@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2020 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+import random
+
+from datetime import datetime, timedelta
+
+import pytz
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import BaseCommand, CommandError
+
+from geonode.monitoring.collector import CollectorAPI
+from geonode.monitoring.models import (Service, RequestEvent, MonitoredResource,
+                                       EventType, MetricValue)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+
+    help = """
+    Measures the time and the number of queries needed by the collector
+    to aggregate an interval of synthetic requests.
+    Synthetic requests are created inside a transaction which is rolled
+    back at the end of the run, so the database is left untouched.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s',
+            '--sizes',
+            dest='sizes',
+            nargs='*',
+            type=int,
+            default=[1000, 10000, 100000],
+            help='Number of synthetic requests for each run. Default: 1000 10000 100000'
+        )
+        parser.add_argument(
+            '-r',
+            '--resources',
+            dest='resources',
+            type=int,
+            default=50,
+            help='Number of synthetic monitored resources. Default: 50'
+        )
+
+    def handle(self, *args, **options):
+        service = Service.objects.filter(service_type__name='geonode').first()
+        if service is None:
+            raise CommandError("No GeoNode monitoring service found, run autoconfigure first.")
+        for size in options.get('sizes'):
+            try:
+                with transaction.atomic():
+                    self._run(service, size, options.get('resources'))
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def _run(self, service, size, resources_count):
+        valid_to = datetime.utcnow().replace(tzinfo=pytz.utc)
+        valid_from = valid_to - service.check_interval
+        event_types = list(EventType.objects.all())
+        resources = [
+            MonitoredResource.objects.get_or_create(type='layer', name='geonode:benchmark_{}'.format(index))[0]
+            for index in range(resources_count)]
+
+        events = RequestEvent.objects.bulk_create([
+            RequestEvent(
+                service=service,
+                created=valid_from + timedelta(seconds=random.random() * service.check_interval.total_seconds()),
+                received=valid_to,
+                event_type=random.choice(event_types),
+                request_path='/layers/benchmark_{}'.format(random.randint(0, 500)),
+                request_method=random.choice(['GET', 'POST']),
+                response_status=random.choice([200, 200, 200, 404, 500]),
+                response_size=random.randint(0, 100000),
+                response_time=random.randint(1, 2000),
+                user_agent='benchmark/{}'.format(random.randint(0, 20)),
+                user_agent_family='benchmark',
+                client_ip='10.0.{}.{}'.format(random.randint(0, 255), random.randint(1, 254)),
+                client_country=random.choice(['ITA', 'FRA', 'USA']),
+                user_identifier='user_{}'.format(random.randint(0, 100)),
+                user_username='user_{}'.format(random.randint(0, 100)))
+            for index in range(size)], batch_size=1000)
+        ids = RequestEvent.objects.filter(
+            service=service, request_path__startswith='/layers/benchmark_').values_list('id', flat=True)
+        through = RequestEvent.resources.through
+        through.objects.bulk_create([
+            through(requestevent_id=_id, monitoredresource_id=random.choice(resources).id)
+            for _id in ids], batch_size=1000)
+
+        requests = RequestEvent.objects.filter(created__gte=valid_from, created__lt=valid_to)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            CollectorAPI().process_requests_batch(service, requests, valid_from, valid_to)
+            elapsed = time.time() - start
+        print("[%s requests] %s metric values in %.3fs with %s queries" % (
+            len(events),
+            MetricValue.objects.filter(valid_from__gte=valid_from, valid_to__lte=valid_to).count(),
+            elapsed,
+            len(queries)))
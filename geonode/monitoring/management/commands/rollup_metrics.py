@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext_noop as _
+
+from geonode.utils import parse_datetime
+from geonode.monitoring.models import Service, MetricValue
+from geonode.monitoring.collector import CollectorAPI
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    (Re)build the pre-aggregated metric buckets from the stored metric values
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--since', dest='since', default=None, type=parse_datetime,
+                            help=_("Process data since specific timestamp (YYYY-MM-DD HH:MM:SS format). "
+                                   "If not provided, the oldest metric value will be used."))
+        parser.add_argument('-u', '--until', dest='until', default=None, type=parse_datetime,
+                            help=_("Process data until specific timestamp (YYYY-MM-DD HH:MM:SS format). "
+                                   "If not provided, now will be used."))
+
+    def handle(self, *args, **options):
+        utc = pytz.utc
+        until = options['until'] or datetime.utcnow()
+        until = until.replace(tzinfo=utc)
+        since = options['since']
+        if since is None:
+            since = MetricValue.objects.order_by('valid_from').values_list('valid_from', flat=True).first()
+            if since is None:
+                return
+            since = max(since, until - settings.MONITORING_DATA_TTL)
+        since = since.replace(tzinfo=utc)
+        capi = CollectorAPI()
+        # one day at a time, to keep the transactions short
+        step = timedelta(days=1)
+        for service in Service.objects.all():
+            start = since
+            while start < until:
+                end = min(start + step, until)
+                log.debug("Updating metric buckets of %s from %s to %s", service, start, end)
+                capi.update_metric_buckets(service, start, end)
+                start = end
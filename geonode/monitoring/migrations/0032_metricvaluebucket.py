@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2020-10-20 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0031_auto_20201012_0931'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricValueBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveIntegerField(db_index=True, help_text='Bucket size, in seconds')),
+                ('valid_from', models.DateTimeField(db_index=True)),
+                ('valid_to', models.DateTimeField(db_index=True)),
+                ('value_num', models.DecimalField(blank=True, decimal_places=4, default=None, max_digits=20, null=True)),
+                ('value_sum', models.DecimalField(blank=True, decimal_places=4, default=None, max_digits=20, null=True)),
+                ('value_min', models.DecimalField(blank=True, decimal_places=4, default=None, max_digits=20, null=True)),
+                ('value_max', models.DecimalField(blank=True, decimal_places=4, default=None, max_digits=20, null=True)),
+                ('samples_count', models.PositiveIntegerField(default=0)),
+                ('metric_count', models.PositiveIntegerField(default=0)),
+                ('event_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='metric_buckets', to='monitoring.EventType')),
+                ('label', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_buckets', to='monitoring.MetricLabel')),
+                ('resource', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='metric_buckets', to='monitoring.MonitoredResource')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitoring.Service')),
+                ('service_metric', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitoring.ServiceTypeMetric')),
+            ],
+            options={
+                'unique_together': {('bucket', 'valid_from', 'service', 'service_metric', 'resource', 'label', 'event_type')},
+            },
+        ),
+    ]
@@ -512,29 +512,11 @@ class RequestEvent(models.Model):
         return out
 
     @classmethod
-    def _get_geonode_resources(cls, request):
+    def _get_events_type(cls, events, default_event_type='view'):
         """
-        Return serialized resources affected by request
+        Returns event type based on the list of registered events
         """
-        rqmeta = getattr(request, '_monitoring', {})
-        events = rqmeta['events']
-        resources = []
-        # for type_name in 'layer map document style'.split():
-        #     res = rqmeta['resources'].get(type_name) or []
-        #     resources.extend(cls._get_resources(type_name, res))
-
-        for evt_type, res_type, res_name, res_id in events:
-            resources.extend(cls._get_or_create_resources(res_name, res_type, res_id))
-
-        return resources
-
-    @classmethod
-    def _get_event_type(cls, request, default_event_type='view'):
-        """
-        Returns event type based on events
-        """
-        rqmeta = getattr(request, '_monitoring', {})
-        events = set(e[0] for e in rqmeta['events'])
+        events = set(e[0] for e in events)
         event_name = default_event_type
         if len(events) == 1:
             event_name = events.pop()
@@ -593,29 +575,6 @@ class RequestEvent(models.Model):
                             'client_city': city})
         return out
 
-    @classmethod
-    def _get_user_data_gn(cls, request):
-        out = {}
-        # check consent
-        if not cls._get_user_consent(request):
-            return out
-
-        rqmeta = getattr(request, '_monitoring', {})
-        if rqmeta.get('user_identifier'):
-            out['user_identifier'] = rqmeta.get('user_identifier')
-        if rqmeta.get('user_username'):
-            out['user_username'] = rqmeta.get('user_username')
-
-        ua = request.META.get('HTTP_USER_AGENT') or ''
-        ua_data = cls._get_user_agent(ua)
-        out.update(ua_data)
-
-        request_ip, is_routable = get_client_ip(request)
-        if request_ip and is_routable:
-            location_data = cls._get_user_location(request_ip)
-            out.update(location_data)
-        return out
-
     @classmethod
     def _get_user_data_gs(cls, request):
         out = {}
@@ -634,8 +593,26 @@ class RequestEvent(models.Model):
             out.update(location_data)
         return out
 
+    @staticmethod
+    def _get_response_size(response):
+        """
+        Returns the size of the response body. Streamed bodies are sent after
+        the event is built, their size is known only from the Content-Length.
+        """
+        size = response.get('Content-length')
+        if size:
+            return size
+        if response.streaming:
+            return 0
+        return len(response.content)
+
     @classmethod
-    def from_geonode(cls, service, request, response):
+    def get_request_data(cls, request, response):
+        """
+        Returns a plain snapshot of the request/response data needed to
+        build the event, so that the (slower) user agent parsing, GeoIP
+        lookup and database writes can happen outside of the request.
+        """
         from geonode.utils import parse_datetime
 
         received = datetime.utcnow().replace(tzinfo=pytz.utc)
@@ -649,65 +626,65 @@ class RequestEvent(models.Model):
                 tzinfo=pytz.utc))
         duration = (_ended - created).microseconds / 1000.0
 
-        sensitive_data = cls._get_user_data_gn(request)
-        event_type = cls._get_event_type(request)
-
-        # ua = request.META.get('HTTP_USER_AGENT') or ''
-        # ua_family = cls._get_ua_family(ua)
-        #
-        # ip, is_routable = get_client_ip(request)
-        # lat = lon = None
-        # country = region = city = None
-        # if ip and is_routable:
-        #     ip = ip.split(':')[0]
-        #     if settings.TEST and ip == 'testserver':
-        #         ip = '127.0.0.1'
-        #     try:
-        #         ip = gethostbyname(ip)
-        #     except Exception as err:
-        #         pass
-        #
-        #     geoip = get_geoip()
-        #     try:
-        #         client_loc = geoip.city(ip)
-        #     except Exception as err:
-        #         log.warning("Cannot resolve %s: %s", ip, err)
-        #         client_loc = None
-        #
-        #     if client_loc:
-        #         lat, lon = client_loc['latitude'], client_loc['longitude'],
-        #         country = client_loc.get(
-        #             'country_code3') or client_loc['country_code']
-        #         if len(country) == 2:
-        #             _c = pycountry.countries.get(alpha_2=country)
-        #             country = _c.alpha_3
-        #
-        #         region = client_loc['region']
-        #         city = client_loc['city']
-
         data = {'received': received,
                 'created': created,
                 'host': request.get_host(),
-                'service': service,
-                'user_identifier': None,
-                'user_username': None,
-                'event_type': event_type,
                 'request_path': request.get_full_path(),
                 'request_method': request.method,
                 'response_status': response.status_code,
-                'response_size':
-                    response.get('Content-length') or len(response.getvalue()),
+                'response_size': cls._get_response_size(response),
                 'response_type': response.get('Content-type'),
-                'response_time': duration}
+                'response_time': duration,
+                'events': list(rqmeta.get('events') or []),
+                'user_data': None}
 
-        data.update(sensitive_data)
+        # check consent
+        if cls._get_user_consent(request):
+            request_ip, is_routable = get_client_ip(request)
+            data['user_data'] = {
+                'user_identifier': rqmeta.get('user_identifier'),
+                'user_username': rqmeta.get('user_username'),
+                'user_agent': request.META.get('HTTP_USER_AGENT') or '',
+                'client_ip': request_ip if is_routable else None,
+            }
+        return data
 
+    @classmethod
+    def from_request_data(cls, service, request_data):
+        """
+        Builds an unsaved event from a ``get_request_data`` snapshot.
+        Returns the event and the list of affected resources.
+        """
+        data = dict(request_data)
+        events = data.pop('events')
+        user_data = data.pop('user_data')
+        data.update({
+            'service': service,
+            'user_identifier': None,
+            'user_username': None,
+            'event_type': cls._get_events_type(events)})
+
+        if user_data:
+            for key in ('user_identifier', 'user_username'):
+                if user_data.get(key):
+                    data[key] = user_data[key]
+            data.update(cls._get_user_agent(user_data['user_agent']))
+            if user_data['client_ip']:
+                data.update(cls._get_user_location(user_data['client_ip']))
+
+        resources = []
+        for evt_type, res_type, res_name, res_id in events:
+            resources.extend(cls._get_or_create_resources(res_name, res_type, res_id))
+        return cls(**data), resources
+
+    @classmethod
+    def from_geonode(cls, service, request, response):
         try:
-            inst = cls.objects.create(**data)
-            resources = cls._get_geonode_resources(request)
+            inst, resources = cls.from_request_data(
+                service, cls.get_request_data(request, response))
+            inst.save()
             if resources:
                 inst.resources.add(*resources)
-                inst.save()
             return inst
         except Exception:
             return None
@@ -1062,6 +1039,78 @@ class MetricValue(models.Model):
         return q
 
 
+class MetricValueBucket(models.Model):
+    """
+    Metric values pre-aggregated over a fixed time bucket (one minute,
+    one hour, one day, see MONITORING_METRIC_BUCKETS).
+    Buckets are refreshed by the collector as soon as new metric values
+    are stored and used to answer the queries over long time spans.
+    """
+    bucket = models.PositiveIntegerField(db_index=True, help_text=_("Bucket size, in seconds"))
+    valid_from = models.DateTimeField(db_index=True, null=False)
+    valid_to = models.DateTimeField(db_index=True, null=False)
+    service_metric = models.ForeignKey(ServiceTypeMetric, on_delete=models.CASCADE)
+    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    event_type = models.ForeignKey(
+        EventType,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='metric_buckets')
+    resource = models.ForeignKey(
+        MonitoredResource,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='metric_buckets')
+    label = models.ForeignKey(MetricLabel, related_name='metric_buckets', on_delete=models.CASCADE)
+    # value aggregated according to the metric type
+    value_num = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        null=True,
+        default=None,
+        blank=True)
+    value_sum = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        null=True,
+        default=None,
+        blank=True)
+    value_min = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        null=True,
+        default=None,
+        blank=True)
+    value_max = models.DecimalField(
+        max_digits=20,
+        decimal_places=4,
+        null=True,
+        default=None,
+        blank=True)
+    samples_count = models.PositiveIntegerField(
+        null=False, default=0, blank=False)
+    # number of metric values rolled up in the bucket
+    metric_count = models.PositiveIntegerField(
+        null=False, default=0, blank=False)
+
+    class Meta:
+        unique_together = (
+            ('bucket',
+             'valid_from',
+             'service',
+             'service_metric',
+             'resource',
+             'label',
+             'event_type',
+             ))
+
+    def __str__(self):
+        return 'Metric Bucket: {}: [{}] ({}s since {})'.format(
+            self.service_metric.metric.name, self.value_num, self.bucket, self.valid_from)
+
+
 class NotificationCheck(models.Model):
 
     GRACE_PERIOD_1M = timedelta(seconds=60)
@@ -24,6 +24,7 @@ from datetime import datetime, timedelta
 
 import os
 import time
+import queue
 import json
 import pytz
 import logging
@@ -47,12 +48,13 @@ from geonode.monitoring.models import (
     RequestEvent, Host, Service, ServiceType,
     populate, ExceptionEvent, MetricNotificationCheck,
     MetricValue, NotificationCheck, Metric, EventType,
-    MonitoredResource, MetricLabel,
+    MonitoredResource, MetricLabel, MetricValueBucket,
     NotificationMetricDefinition,)
 from geonode.monitoring.models import do_autoconfigure
 from geonode.compat import ensure_string
 from geonode.monitoring.collector import CollectorAPI
-from geonode.monitoring.utils import generate_periods, align_period_start
+from geonode.monitoring.aggregation import get_metric_bucket
+from geonode.monitoring.utils import generate_periods, align_period_start, RequestEventsWriter
 from geonode.maps.models import Map
 from geonode.layers.models import Layer
 from geonode.documents.models import Document
@@ -337,6 +339,68 @@ class RequestsTestCase(MonitoringTestBase):
         if eq:
             self.assertEqual('django.http.response.Http404', eq.error_type)
 
+    def test_gn_request_async_writer(self):
+        """
+        Test that the background writer stores the queued geonode requests
+        """
+        from django.http import HttpResponse
+        from django.test.client import RequestFactory
+
+        request = RequestFactory().get('/layers/', **{"HTTP_USER_AGENT": self.ua})
+        request._monitoring = {
+            'started': datetime.utcnow().replace(tzinfo=pytz.utc),
+            'finished': datetime.utcnow().replace(tzinfo=pytz.utc),
+            'events': [('view', 'layer', 'geonode:foo', None,)],
+            'resources': {}
+        }
+        data = RequestEvent.get_request_data(request, HttpResponse('ok'))
+
+        writer = RequestEventsWriter()
+        writer.queue_size = 2
+        writer.q = queue.Queue(maxsize=writer.queue_size)
+        for _ in range(3):
+            writer.add(self.service, data)
+        self.assertEqual(writer.dropped, 1)
+
+        count = RequestEvent.objects.count()
+        writer.write([writer.q.get(), writer.q.get()])
+        self.assertEqual(RequestEvent.objects.count(), count + 2)
+        rq = RequestEvent.objects.order_by('id').last()
+        self.assertEqual(rq.request_path, '/layers/')
+        self.assertEqual(
+            list(rq.resources.all().values_list('name', 'type')), [('geonode:foo', 'layer',)])
+
+    def test_gn_streamed_download(self):
+        """
+        Test that streamed downloads, of unknown size, are logged
+        """
+        from django.http import StreamingHttpResponse
+        from django.test.client import RequestFactory
+
+        request = RequestFactory().get('/download/1', **{"HTTP_USER_AGENT": self.ua})
+        request._monitoring = {
+            'started': datetime.utcnow().replace(tzinfo=pytz.utc),
+            'finished': datetime.utcnow().replace(tzinfo=pytz.utc),
+            'events': [('download', 'layer', 'geonode:foo', None,)],
+            'resources': {}
+        }
+        response = StreamingHttpResponse(
+            streaming_content=iter([b'PK', b'archive']),
+            content_type='application/zip')
+
+        rq = RequestEvent.from_geonode(self.service, request, response)
+        self.assertIsNotNone(rq)
+        self.assertEqual(rq.response_size, 0)
+        self.assertEqual(rq.event_type.name, 'download')
+        self.assertEqual(
+            list(rq.resources.all().values_list('name', 'type')), [('geonode:foo', 'layer',)])
+        # the content has not been consumed
+        self.assertEqual(b''.join(response.streaming_content), b'PKarchive')
+
+        response['Content-Length'] = '9'
+        data = RequestEvent.get_request_data(request, response)
+        self.assertEqual(int(data['response_size']), 9)
+
     def test_service_handlers(self):
         """
         Test if we can calculate metrics
@@ -389,6 +453,48 @@ class RequestsTestCase(MonitoringTestBase):
                                         interval=interval)
             self.assertIsNotNone(metrics)
 
+    def test_requests_aggregation(self):
+        """
+        Test the in-memory aggregation of requests rows
+        """
+        capi = CollectorAPI()
+        rows = [{'response_time': 10, 'response_status': 200, 'user_identifier': 'a', 'user_username': 'alice'},
+                {'response_time': 30, 'response_status': 200, 'user_identifier': 'a', 'user_username': 'alice'},
+                {'response_time': None, 'response_status': 404, 'user_identifier': None, 'user_username': None}]
+        self.assertEqual(
+            capi.aggregate_requests(Metric(type=Metric.TYPE_RATE), 'response_time', rows),
+            [(Metric.TYPE_RATE, 20, 3,)])
+        self.assertEqual(
+            capi.aggregate_requests(Metric(type=Metric.TYPE_VALUE), 'response_status', rows),
+            [(200, 2, 2,), (404, 1, 1,)])
+        self.assertEqual(
+            capi.aggregate_requests(Metric(type=Metric.TYPE_VALUE), 'user_identifier', rows),
+            [(('a', 'alice',), 2, 2,)])
+        self.assertEqual(
+            capi.aggregate_requests(Metric(type=Metric.TYPE_VALUE_NUMERIC), 'response_time', rows),
+            [(Metric.TYPE_VALUE_NUMERIC, 30, 2,)])
+
+    def test_metric_buckets(self):
+        """
+        Test that metric values are rolled up into buckets
+        """
+        capi = CollectorAPI()
+        start = align_period_start(datetime.utcnow().replace(tzinfo=pytz.utc), timedelta(hours=1))
+        for minute, value in ((0, 2,), (1, 3,), (61, 5,)):
+            valid_from = start + timedelta(minutes=minute)
+            MetricValue.add('request.count', valid_from, valid_from + timedelta(minutes=1), self.service, 'Count',
+                            value=value, value_num=value, value_raw=value, samples_count=value,
+                            event_type=EventType.get(EventType.EVENT_ALL))
+        capi.update_metric_buckets(self.service, start, start + timedelta(hours=2))
+
+        buckets = MetricValueBucket.objects.filter(service=self.service, service_metric__metric__name='request.count')
+        self.assertEqual(buckets.filter(bucket=60).count(), 3)
+        self.assertEqual(
+            list(buckets.filter(bucket=3600).order_by('valid_from').values_list('value_num', 'metric_count')),
+            [(Decimal(5), 2,), (Decimal(5), 1,)])
+        self.assertEqual(get_metric_bucket(timedelta(hours=2), start), timedelta(hours=1))
+        self.assertEqual(get_metric_bucket(timedelta(minutes=90), start), timedelta(minutes=1))
+
     def test_collect_metrics_command(self):
         """
         Test that collect metrics command is executed sequentially
@@ -19,8 +19,10 @@
 #########################################################################
 
 import os
+import time
 import pytz
 import queue
+import atexit
 import logging
 import xmljson
 import requests
@@ -37,6 +39,7 @@ from datetime import datetime, timedelta
 from defusedxml import lxml as dlxml
 
 from django.conf import settings
+from django.db import connection, transaction, close_old_connections
 from django.db.models.fields.related import RelatedField
 
 from geonode.settings import DATETIME_INPUT_FORMATS
@@ -59,6 +62,20 @@ class MonitoringHandler(logging.Handler):
         exc_info = record.exc_info
         req = record.request
         resp = record.response
+        if getattr(settings, 'MONITORING_ASYNC_WRITES', False):
+            if not req._monitoring.get('processed'):
+                req._monitoring['processed'] = True
+                try:
+                    data = RequestEvent.get_request_data(req, resp)
+                except Exception:
+                    log.debug(traceback.format_exc())
+                    return
+                error = None
+                if exc_info:
+                    error = (exc_info[1], traceback.format_exception(*exc_info))
+                RequestEventsWriter.get_writer().add(self.service, data, error)
+            return
+
         if not req._monitoring.get('processed'):
             try:
                 re = RequestEvent.from_geonode(self.service, req, resp)
@@ -72,26 +89,108 @@ class MonitoringHandler(logging.Handler):
             ExceptionEvent.add_error(self.service, exc_info[1], tb, request=re)
 
 
-class RequestToMonitoringThread(threading.Thread):
-    q = queue.Queue()
+class RequestEventsWriter(threading.Thread):
+    """
+    Background writer of the RequestEvents collected by the
+    MonitoringMiddleware.
+
+    Requests snapshots are put on a bounded queue and written in batches
+    with ``bulk_create``. When the queue is full new events are dropped,
+    while with the ``sample`` MONITORING_OVERLOAD_POLICY only one event
+    every MONITORING_OVERLOAD_SAMPLE_RATE is queued as soon as the queue is
+    more than 80% full. Pending events are flushed when the process exits.
+    """
 
-    def __init__(self, service, *args, **kwargs):
-        super(RequestToMonitoringThread, self).__init__(*args, **kwargs)
-        self.service = service
+    _writer = None
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        super(RequestEventsWriter, self).__init__(*args, **kwargs)
+        self.daemon = True
+        self.queue_size = getattr(settings, 'MONITORING_QUEUE_SIZE', 10000)
+        self.batch_size = getattr(settings, 'MONITORING_BATCH_SIZE', 200)
+        self.flush_interval = getattr(settings, 'MONITORING_FLUSH_INTERVAL', 2)
+        self.overload_policy = getattr(settings, 'MONITORING_OVERLOAD_POLICY', 'drop')
+        self.sample_rate = getattr(settings, 'MONITORING_OVERLOAD_SAMPLE_RATE', 10)
+        self.q = queue.Queue(maxsize=self.queue_size)
+        self.pid = os.getpid()
+        self.received = 0
+        self.dropped = 0
+        self.written = 0
+        self._stopped = threading.Event()
+
+    @classmethod
+    def get_writer(cls):
+        """
+        Returns the writer of the current process, starting it if needed.
+        """
+        with cls._lock:
+            if cls._writer is None or cls._writer.pid != os.getpid():
+                cls._writer = cls()
+                cls._writer.start()
+                atexit.register(cls._writer.stop)
+            return cls._writer
+
+    def add(self, service, data, error=None):
+        self.received += 1
+        if self.overload_policy == 'sample' and \
+                self.q.qsize() > self.queue_size * 0.8 and \
+                self.received % self.sample_rate:
+            self.dropped += 1
+            return
+        try:
+            self.q.put_nowait((service, data, error,))
+        except queue.Full:
+            self.dropped += 1
 
-    def add(self, req, resp):
-        item = (req, resp,)
-        RequestToMonitoringThread.q.put(item)
+    def stop(self, timeout=10):
+        self._stopped.set()
+        self.join(timeout)
 
     def run(self):
-        from geonode.monitoring.models import RequestEvent
-
-        q = RequestToMonitoringThread.q
-        while True:
-            if not q.empty():
-                item = q.get()
-                req, resp = item
-                RequestEvent.from_geonode(self.service, req, resp)
+        while not self._stopped.is_set() or not self.q.empty():
+            batch = []
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.q.get(timeout=max(0.01, deadline - time.time())))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    close_old_connections()
+                    self.write(batch)
+                except Exception:
+                    log.error(traceback.format_exc())
+        connection.close()
+
+    def write(self, batch):
+        from geonode.monitoring.models import RequestEvent, ExceptionEvent
+
+        events = []
+        for service, data, error in batch:
+            try:
+                inst, resources = RequestEvent.from_request_data(service, data)
+                events.append((inst, resources, error,))
+            except Exception:
+                log.debug(traceback.format_exc())
+
+        with transaction.atomic():
+            instances = [e[0] for e in events]
+            if connection.features.can_return_ids_from_bulk_insert:
+                RequestEvent.objects.bulk_create(instances)
+            else:
+                for inst in instances:
+                    inst.save()
+            through = RequestEvent.resources.through
+            through.objects.bulk_create([
+                through(requestevent_id=inst.id, monitoredresource_id=resource.id)
+                for inst, resources, error in events
+                for resource in set(resources)])
+            for inst, resources, error in events:
+                if error:
+                    ExceptionEvent.add_error(inst.service, error[0], error[1], request=inst)
+        self.written += len(events)
 
 
 class GeoServerMonitorClient(object):
@@ -24,12 +24,15 @@ unittest). These will both pass when you run "manage.py test".
 
 Replace these with more appropriate tests for your application.
 """
+import os
 import json
+import shutil
+import tempfile
 
 try:
-    from unittest.mock import MagicMock
+    from unittest.mock import MagicMock, patch
 except ImportError:
-    from mock import MagicMock
+    from mock import MagicMock, patch
 
 from django.urls import reverse
 from django.contrib.auth import get_user_model
@@ -122,6 +125,77 @@ class ProxyTest(GeoNodeBaseTestSupport):
         self.client.get('%s?url=%s' % (self.proxy_url, url))
         assert request_mock.call_args[0][0] == 'http://example.org/index.html'
 
+    @override_settings(DEBUG=False, PROXY_ALLOWED_HOSTS=('.example.org',), PROXY_STREAMING_MIN_SIZE=10)
+    def test_streamed_ranged_response(self):
+        """Large upstream responses are streamed, ranged requests are passed through."""
+        import geonode.proxy.views
+
+        class Response(object):
+            status_code = 206
+            headers = {'Content-Type': 'image/tiff',
+                       'Content-Length': '20',
+                       'Content-Range': 'bytes 0-19/100',
+                       'ETag': '"abc"'}
+            closed = False
+
+            def iter_content(self, chunk_size=None):
+                return iter([b'0123456789', b'0123456789'])
+
+            def close(self):
+                self.closed = True
+
+        upstream = Response()
+        request_mock = MagicMock()
+        request_mock.return_value = (upstream, None)
+
+        with patch.object(geonode.proxy.views.http_client, 'request', request_mock):
+            response = self.client.get(
+                '%s?url=%s' % (self.proxy_url, 'http://example.org/coverage.tif'), HTTP_RANGE='bytes=0-19')
+            self.assertTrue(response.streaming)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), b'01234567890123456789')
+        self.assertTrue(upstream.closed)
+        self.assertEqual(response['Content-Range'], 'bytes 0-19/100')
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(request_mock.call_args[1]['headers']['Range'], 'bytes=0-19')
+        self.assertTrue(request_mock.call_args[1]['stream'])
+
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    @override_settings(DEBUG=False, PROXY_STREAMING_MIN_SIZE=10)
+    def test_streamed_geoserver_response_monitoring(self):
+        """Streamed GeoServer responses keep their size when known and can be monitored."""
+        import geonode.proxy.views
+        from geonode.monitoring.models import RequestEvent
+
+        class Response(object):
+            status_code = 200
+
+            def __init__(self, headers, chunks):
+                self.headers = headers
+                self.chunks = chunks
+
+            def iter_content(self, chunk_size=None):
+                return iter(self.chunks)
+
+            def close(self):
+                pass
+
+        for headers, chunks, size in (
+                ({'Content-Type': 'image/png', 'Content-Length': '20'},
+                 [b'0123456789', b'0123456789'], 20),
+                ({'Content-Type': 'application/xml', 'Content-Encoding': 'gzip'},
+                 [b'<WMS_Capabilities/>'], 0),
+                ({'Content-Type': 'application/xml'},
+                 [b'<WMS_Capabilities/>'], 0)):
+            request_mock = MagicMock()
+            request_mock.return_value = (Response(headers, chunks), None)
+            with patch.object(geonode.proxy.views.http_client, 'request', request_mock):
+                response = self.client.get('/gs/ows?service=WMS&request=GetCapabilities')
+                self.assertTrue(response.streaming)
+                data = RequestEvent.get_request_data(response.wsgi_request, response)
+                self.assertEqual(int(data['response_size']), size)
+                self.assertEqual(b''.join(response.streaming_content), b''.join(chunks))
+
 
 class DownloadResourceTestCase(GeoNodeBaseTestSupport):
 
@@ -144,6 +218,34 @@ class DownloadResourceTestCase(GeoNodeBaseTestSupport):
         self.assertTrue(
             "No files have been found for this resource. Please, contact a system administrator." in data)
 
+    def test_download_archive_cache_path(self):
+        from django.conf import settings
+        from django.contrib.auth.models import AnonymousUser
+        from geonode.proxy.views import _get_archive_cache_path, _cache_archive
+
+        layer = Layer.objects.all().first()
+        cache_dir = tempfile.mkdtemp()
+        try:
+            with override_settings(DOWNLOAD_ARCHIVES_CACHE=True, DOWNLOAD_ARCHIVES_CACHE_DIR=cache_dir):
+                admin_path = _get_archive_cache_path(layer, get_user_model().objects.get(username='admin'))
+                anonymous_path = _get_archive_cache_path(layer, AnonymousUser())
+            # each user gets its own archive, out of the public media
+            self.assertNotEqual(admin_path, anonymous_path)
+            for path in (admin_path, anonymous_path):
+                self.assertTrue(path.startswith(cache_dir))
+                self.assertFalse(path.startswith(settings.MEDIA_ROOT))
+
+            self.assertEqual(b''.join(_cache_archive(admin_path, iter([b'PK', b'zip']))), b'PKzip')
+            self.assertTrue(os.path.exists(admin_path))
+        finally:
+            shutil.rmtree(cache_dir)
+        with override_settings(DOWNLOAD_ARCHIVES_CACHE=False):
+            self.assertIsNone(_get_archive_cache_path(layer, AnonymousUser()))
+
+        # the download goes on when the archive cannot be cached
+        with patch('geonode.proxy.views.os.makedirs', side_effect=OSError('read-only')):
+            self.assertEqual(b''.join(_cache_archive(admin_path, iter([b'PK', b'zip']))), b'PKzip')
+
 
 class OWSApiTestCase(GeoNodeBaseTestSupport):
 
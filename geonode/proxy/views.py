@@ -24,18 +24,20 @@ import re
 import six
 import gzip
 import json
-import shutil
+import uuid
 import logging
-import tempfile
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
+
 from hyperlink import URL
 from slugify import slugify
 from urllib.parse import urlparse, urlsplit, urljoin
 
 from django.conf import settings
+from django.db import connection
 from django.template import loader
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
 from django.views.generic import View
 from distutils.version import StrictVersion
 from django.http.request import validate_host
@@ -45,12 +47,12 @@ from django.core.files.storage import FileSystemStorage
 from django.views.decorators.csrf import requires_csrf_token
 
 from geonode.base.models import Link
+from geonode.compat import ensure_string
 from geonode.layers.models import Layer, LayerFile
 from geonode.utils import (
     resolve_object,
     check_ogc_backend,
-    get_dir_time_suffix,
-    zip_dir,
+    zip_stream,
     get_headers,
     http_client,
     json_response,
@@ -62,6 +64,29 @@ from geonode.monitoring import register_event
 
 TIMEOUT = 300
 
+# number of remote styles and links downloaded concurrently for a layer archive
+DOWNLOAD_WORKERS = 4
+
+# size of the chunks read from the upstream responses when streaming them
+STREAMING_CHUNK_SIZE = 64 * 1024
+
+# ranged and conditional request headers forwarded to the upstream server
+PROXY_REQUEST_HEADERS = {
+    'HTTP_RANGE': 'Range',
+    'HTTP_IF_RANGE': 'If-Range',
+    'HTTP_IF_NONE_MATCH': 'If-None-Match',
+    'HTTP_IF_MODIFIED_SINCE': 'If-Modified-Since',
+}
+
+# upstream response headers sent back to the client
+PROXY_RESPONSE_HEADERS = (
+    'ETag',
+    'Last-Modified',
+    'Accept-Ranges',
+    'Content-Range',
+    'Content-Disposition',
+)
+
 LINK_TYPES = [L for L in _LT if L.startswith("OGC:")]
 
 logger = logging.getLogger(__name__)
@@ -72,6 +97,51 @@ ows_regexp = re.compile(
     r"^(?i)(version)=(\d\.\d\.\d)(?i)&(?i)request=(?i)(GetCapabilities)&(?i)service=(?i)(\w\w\w)$")
 
 
+def _stream_content(response, chunk_size=STREAMING_CHUNK_SIZE):
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        response.close()
+
+
+def _is_streamable(response, status):
+    """
+    Large or unsized successful responses are streamed to the client,
+    the others are read in memory.
+    """
+    if status not in (200, 206):
+        return False
+    content_length = response.headers.get('Content-Length')
+    if not content_length or 'Content-Encoding' in response.headers:
+        return True
+    try:
+        return int(content_length) > getattr(settings, 'PROXY_STREAMING_MIN_SIZE', 1024 * 1024)
+    except ValueError:
+        return True
+
+
+def _copy_response_headers(response, _response, rewritten=False):
+    for header in PROXY_RESPONSE_HEADERS:
+        value = response.headers.get(header)
+        if value and header not in _response:
+            if header == 'ETag' and rewritten and not value.startswith('W/'):
+                # the content has been modified, it is not byte-for-byte the upstream one
+                value = 'W/%s' % value
+            _response[header] = value
+    return _response
+
+
+def _copy_content_length(response, _response):
+    """
+    Streamed contents keep the upstream size, unless they are sent decoded.
+    """
+    if response.headers.get('Content-Length') and 'Content-Encoding' not in response.headers \
+            and 'Content-Length' not in _response:
+        _response['Content-Length'] = response.headers['Content-Length']
+
+
 @requires_csrf_token
 def proxy(request, url=None, response_callback=None,
           sec_chk_hosts=True, sec_chk_rules=True, timeout=None,
@@ -183,17 +253,51 @@ def proxy(request, url=None, response_callback=None,
             '%s%s' % (settings.SITEURL, 'geoserver'),
             ogc_server_settings.LOCATION.rstrip('/'))
 
+    for meta_key, header in PROXY_REQUEST_HEADERS.items():
+        if meta_key in request.META:
+            headers[header] = request.META[meta_key]
+
     response, content = http_client.request(
         _url,
         method=request.method,
         data=_data,
         headers=headers,
+        stream=True,
         timeout=timeout,
         user=request.user)
-    content = response.content or response.reason
     status = response.status_code
     content_type = response.headers.get('Content-Type')
 
+    # partial contents are sent as they are, offsets would not match a rewritten content
+    if status == 206:
+        response_callback = None
+    # text contents may be modified by the callback
+    rewritten = bool(response_callback and content_type and re.search(
+        'text|plain|html|json|xml|gml', content_type))
+
+    if request.method != 'HEAD' and _is_streamable(response, status):
+        if response_callback:
+            kwargs = {} if not kwargs else kwargs
+            kwargs.update({
+                'response': response,
+                'content': _stream_content(response),
+                'status': status,
+                'content_type': content_type,
+                'streaming': True
+            })
+            _response = response_callback(**kwargs)
+            if not rewritten:
+                _copy_content_length(response, _response)
+            return _copy_response_headers(response, _response, rewritten=rewritten)
+        _response = StreamingHttpResponse(
+            streaming_content=_stream_content(response),
+            status=status,
+            content_type=content_type)
+        _copy_content_length(response, _response)
+        return _copy_response_headers(response, _response)
+
+    content = response.content or response.reason
+
     if status >= 400:
         return HttpResponse(
             content=content,
@@ -232,7 +336,7 @@ def proxy(request, url=None, response_callback=None,
             'status': status,
             'content_type': content_type
         })
-        return response_callback(**kwargs)
+        return _copy_response_headers(response, response_callback(**kwargs), rewritten=rewritten)
     else:
         # If we get a redirect, let's add a useful message.
         if status and status in (301, 302, 303, 307):
@@ -254,11 +358,144 @@ def proxy(request, url=None, response_callback=None,
                     found = _s
                 return found
 
-            return HttpResponse(
+            return _copy_response_headers(response, HttpResponse(
                 content=content,
                 reason=_get_message(content) if status not in (200, 201) else None,
                 status=status,
-                content_type=content_type)
+                content_type=content_type))
+
+
+def _fetch_link(request, url):
+    """
+    Returns a callable downloading ``url`` on behalf of the requesting user.
+    """
+    # Collecting headers and cookies
+    headers, access_token = get_headers(request, urlsplit(url), url)
+    user = request.user
+
+    def _fetch():
+        try:
+            response, content = http_client.get(
+                url,
+                headers=headers,
+                timeout=TIMEOUT,
+                user=user)
+            return response.content
+        finally:
+            connection.close()
+    return _fetch
+
+
+def _get_archive_entries(request, instance, layer_files):
+    """
+    Generator of the ``(arcname, content)`` entries of the archive of a layer:
+    its original files, styles, metadata dump and links.
+    Remote styles and links are downloaded concurrently while the local files
+    are being archived.
+    """
+    remote_styles = []
+    remote_links = []
+    executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+    try:
+        for s in instance.styles.all():
+            if s.sld_url:
+                remote_styles.append(
+                    ("".join([s.name, "_remote.sld"]), executor.submit(_fetch_link(request, s.sld_url))))
+        for link in Link.objects.filter(resource=instance.resourcebase_ptr):
+            if link.link_type in ('metadata', 'image'):
+                link_name = "".join([slugify(link.name), ".%s" % link.extension])
+                remote_links.append((link_name, executor.submit(_fetch_link(request, link.url))))
+
+        # Copy all Layer related files
+        for lyr in layer_files:
+            yield os.path.basename(str(lyr.file)), storage.open(str(lyr.file), 'rb')
+
+        # Let's check for associated SLD files (if any)
+        try:
+            for s in instance.styles.all():
+                yield "".join([s.name, ".sld"]), s.sld_body.strip()
+        except Exception:
+            tb = traceback.format_exc()
+            logger.debug(tb)
+        for name, future in remote_styles:
+            try:
+                yield name, ensure_string(future.result()).strip()
+            except Exception:
+                tb = traceback.format_exc()
+                logger.debug(tb)
+
+        # Let's dump metadata
+        try:
+            serialized_obj = json_serializer_producer(model_to_dict(instance))
+            yield os.path.join(".metadata", "".join([instance.name, ".dump"])), json.dumps(serialized_obj)
+
+            for link in Link.objects.filter(resource=instance.resourcebase_ptr):
+                # Dumping OGC/OWS links, 'data' download links are skipped
+                if link.link_type.startswith('OGC'):
+                    link_name = "".join([slugify(link.name), ".%s" % link.extension])
+                    yield os.path.join(".metadata", link_name), link.url.strip()
+        except Exception:
+            tb = traceback.format_exc()
+            logger.debug(tb)
+        # Dumping metadata files and images
+        for name, future in remote_links:
+            try:
+                content = future.result()
+            except Exception:
+                tb = traceback.format_exc()
+                logger.debug(tb)
+                content = b''
+            yield os.path.join(".metadata", name), content
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _get_archive_cache_path(instance, user):
+    """
+    Returns the path of the cached archive of the current version of the layer,
+    None if the archives are not cached.
+    The remote styles and links of the archive are fetched on behalf of the user,
+    each user gets its own archive.
+    """
+    cache_dir = getattr(settings, 'DOWNLOAD_ARCHIVES_CACHE_DIR', None)
+    if not getattr(settings, 'DOWNLOAD_ARCHIVES_CACHE', False) or not cache_dir or not instance.last_updated:
+        return None
+    user_key = user.pk if user and user.is_authenticated else 'anonymous'
+    return os.path.join(
+        cache_dir,
+        str(instance.id),
+        '%s_%s.zip' % (user_key, instance.last_updated.strftime('%Y%m%d%H%M%S%f')))
+
+
+def _cache_archive(cache_path, content):
+    """
+    Passes the archive chunks through, saving them in ``cache_path`` as well.
+    The archive is cached only once it has been entirely sent.
+    """
+    cache_dir = os.path.dirname(cache_path)
+    tmp_path = '%s.%s.tmp' % (cache_path, uuid.uuid4().hex)
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        cache_file = open(tmp_path, 'wb')
+    except OSError as e:
+        # the download does not depend on the cache
+        logger.warning("Cannot cache the archive in %s: %s" % (cache_dir, e))
+        yield from content
+        return
+    try:
+        with cache_file:
+            for chunk in content:
+                cache_file.write(chunk)
+                yield chunk
+        os.replace(tmp_path, cache_path)
+        # drop the archives of the previous versions of the layer for the same user
+        prefix = '%s_' % os.path.basename(cache_path).split('_')[0]
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and name.endswith('.zip') and name != os.path.basename(cache_path):
+                os.remove(os.path.join(cache_dir, name))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
 def download(request, resourceid, sender=Layer):
@@ -274,38 +511,14 @@ def download(request, resourceid, sender=Layer):
                               permission_msg=_not_permitted)
 
     if isinstance(instance, Layer):
-        # Create Target Folder
-        dirpath = tempfile.mkdtemp()
-        dir_time_suffix = get_dir_time_suffix()
-        target_folder = os.path.join(dirpath, dir_time_suffix)
-        if not os.path.exists(target_folder):
-            os.makedirs(target_folder)
-
-        layer_files = []
         try:
             upload_session = instance.get_upload_session()
+            layer_files = []
             if upload_session:
-                layer_files = [
-                    item for idx, item in enumerate(LayerFile.objects.filter(upload_session=upload_session))]
-                if layer_files:
-                    # Copy all Layer related files into a temporary folder
-                    for lyr in layer_files:
-                        if storage.exists(str(lyr.file)):
-                            geonode_layer_path = storage.path(str(lyr.file))
-                            base_filename, original_ext = os.path.splitext(geonode_layer_path)
-                            shutil.copy2(geonode_layer_path, target_folder)
-                        else:
-                            return HttpResponse(
-                                loader.render_to_string(
-                                    '401.html',
-                                    context={
-                                        'error_title': _("No files found."),
-                                        'error_message': _no_files_found
-                                    },
-                                    request=request), status=404)
+                layer_files = list(LayerFile.objects.filter(upload_session=upload_session))
 
             # Check we can access the original files
-            if not layer_files:
+            if not layer_files or not all(storage.exists(str(lyr.file)) for lyr in layer_files):
                 return HttpResponse(
                     loader.render_to_string(
                         '401.html',
@@ -315,94 +528,23 @@ def download(request, resourceid, sender=Layer):
                         },
                         request=request), status=404)
 
-            # Let's check for associated SLD files (if any)
-            try:
-                for s in instance.styles.all():
-                    sld_file_path = os.path.join(target_folder, "".join([s.name, ".sld"]))
-                    sld_file = open(sld_file_path, "w")
-                    sld_file.write(s.sld_body.strip())
-                    sld_file.close()
-                    try:
-                        # Collecting headers and cookies
-                        headers, access_token = get_headers(request, urlsplit(s.sld_url), s.sld_url)
-
-                        response, content = http_client.get(
-                            s.sld_url,
-                            headers=headers,
-                            timeout=TIMEOUT,
-                            user=request.user)
-                        sld_remote_content = response.text
-                        sld_file_path = os.path.join(target_folder, "".join([s.name, "_remote.sld"]))
-                        sld_file = open(sld_file_path, "w")
-                        sld_file.write(sld_remote_content.strip())
-                        sld_file.close()
-                    except Exception:
-                        traceback.print_exc()
-                        tb = traceback.format_exc()
-                        logger.debug(tb)
-            except Exception:
-                traceback.print_exc()
-                tb = traceback.format_exc()
-                logger.debug(tb)
-
-            # Let's dump metadata
-            target_md_folder = os.path.join(target_folder, ".metadata")
-            if not os.path.exists(target_md_folder):
-                os.makedirs(target_md_folder)
-
-            try:
-                dump_file = os.path.join(target_md_folder, "".join([instance.name, ".dump"]))
-                with open(dump_file, 'w') as outfile:
-                    serialized_obj = json_serializer_producer(model_to_dict(instance))
-                    json.dump(serialized_obj, outfile)
-
-                links = Link.objects.filter(resource=instance.resourcebase_ptr)
-                for link in links:
-                    link_name = slugify(link.name)
-                    link_file = os.path.join(target_md_folder, "".join([link_name, ".%s" % link.extension]))
-                    if link.link_type in ('data'):
-                        # Skipping 'data' download links
-                        continue
-                    elif link.link_type in ('metadata', 'image'):
-                        # Dumping metadata files and images
-                        link_file = open(link_file, "wb")
-                        try:
-                            # Collecting headers and cookies
-                            headers, access_token = get_headers(request, urlsplit(link.url), link.url)
-
-                            response, raw = http_client.get(
-                                link.url,
-                                stream=True,
-                                headers=headers,
-                                timeout=TIMEOUT,
-                                user=request.user)
-                            raw.decode_content = True
-                            shutil.copyfileobj(raw, link_file)
-                        except Exception:
-                            traceback.print_exc()
-                            tb = traceback.format_exc()
-                            logger.debug(tb)
-                        finally:
-                            link_file.close()
-                    elif link.link_type.startswith('OGC'):
-                        # Dumping OGC/OWS links
-                        link_file = open(link_file, "w")
-                        link_file.write(link.url.strip())
-                        link_file.close()
-            except Exception:
-                traceback.print_exc()
-                tb = traceback.format_exc()
-                logger.debug(tb)
-
             # ZIP everything and return
             target_file_name = "".join([instance.name, ".zip"])
-            target_file = os.path.join(dirpath, target_file_name)
-            zip_dir(target_folder, target_file)
             register_event(request, 'download', instance)
-            response = HttpResponse(
-                content=open(target_file, mode='rb'),
-                status=200,
-                content_type="application/zip")
+            cache_path = _get_archive_cache_path(instance, request.user)
+            if cache_path and os.path.exists(cache_path):
+                response = FileResponse(
+                    open(cache_path, mode='rb'),
+                    status=200,
+                    content_type="application/zip")
+            else:
+                content = zip_stream(_get_archive_entries(request, instance, layer_files))
+                if cache_path:
+                    content = _cache_archive(cache_path, content)
+                response = StreamingHttpResponse(
+                    streaming_content=content,
+                    status=200,
+                    content_type="application/zip")
             response['Content-Disposition'] = 'attachment; filename="%s"' % target_file_name
             return response
         except NotImplementedError:
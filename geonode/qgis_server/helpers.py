@@ -194,12 +194,15 @@ def tile_url_format(layer_name, style=None):
     return url
 
 
-def tile_url(layer, z, x, y, style=None, internal=True):
+def tile_url(layer, z, x, y, style=None, internal=True, x_size=1, y_size=1):
     """Construct actual tile request to QGIS Server.
 
     Different than tile_url_format, this method will return url for requesting
     a tile, with all parameters filled out.
 
+    A block of x_size * y_size tiles (a metatile) having the tile x, y as
+    top left corner can be requested at once.
+
     :param layer: Layer to use
     :type layer: Layer
 
@@ -219,6 +222,12 @@ def tile_url(layer, z, x, y, style=None, internal=True):
         Public url will be served by Django Geonode (proxified).
     :type internal: bool
 
+    :param x_size: Number of tiles along the longitude axis
+    :type x_size: int
+
+    :param y_size: Number of tiles along the latitude axis
+    :type y_size: int
+
     :return: Tile url
     :rtype: str
     """
@@ -236,7 +245,7 @@ def tile_url(layer, z, x, y, style=None, internal=True):
 
     # Call the WMS
     top, left = num2deg(x, y, z)
-    bottom, right = num2deg(x + 1, y + 1, z)
+    bottom, right = num2deg(x + x_size, y + y_size, z)
 
     transform = CoordTransform(SpatialReference(4326), SpatialReference(3857))
     top_left_corner = Point(left, top, srid=4326)
@@ -264,8 +273,8 @@ def tile_url(layer, z, x, y, style=None, internal=True):
         'REQUEST': 'GetMap',
         'BBOX': bbox,
         'CRS': 'EPSG:3857',
-        'WIDTH': '256',
-        'HEIGHT': '256',
+        'WIDTH': str(256 * x_size),
+        'HEIGHT': str(256 * y_size),
         'MAP': qgis_layer.qgis_project_path,
         'LAYERS': layer.name,
         'STYLE': style,
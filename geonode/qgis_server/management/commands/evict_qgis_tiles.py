@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.core.management.base import BaseCommand
+
+from geonode.qgis_server.tile_cache import evict_tiles
+
+
+class Command(BaseCommand):
+    help = ("Remove the oldest QGIS Server cached tiles.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age',
+            dest='max_age',
+            type=float,
+            default=None,
+            help='Remove the tiles rendered more than the given number of hours ago.')
+        parser.add_argument(
+            '--max-size',
+            dest='max_size',
+            type=float,
+            default=None,
+            help='Remove the oldest tiles until the cache is smaller than the given size in MB.')
+
+    def handle(self, *args, **options):
+        max_age = options.get('max_age')
+        max_size = options.get('max_size')
+        removed, removed_bytes = evict_tiles(
+            max_age=max_age * 3600 if max_age is not None else None,
+            max_size=int(max_size * 1024 * 1024) if max_size is not None else None)
+        self.stdout.write("Removed {} tiles ({:.1f} MB)".format(removed, removed_bytes / 1024.0 / 1024.0))
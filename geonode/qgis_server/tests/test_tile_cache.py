@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2016 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from geonode.qgis_server import tile_cache
+
+
+class _Layer(object):
+    qgis_layer_name = 'layer'
+
+
+class TileCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tiles_directory = tempfile.mkdtemp()
+        self.settings = override_settings(QGIS_SERVER_CONFIG={
+            'tiles_directory': self.tiles_directory,
+            'tile_path': self.tiles_directory + '/%s/%s/%d/%d/%d.png',
+            'metatile_size': 2,
+            'tile_timeout': 5,
+        })
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.tiles_directory)
+
+    def test_metatile_bounds(self):
+        self.assertEqual(tile_cache.metatile_bounds(11, 1577, 1054, 4), (1576, 1052, 4, 4))
+        # blocks are clipped to the tiles grid
+        self.assertEqual(tile_cache.metatile_bounds(0, 0, 0, 4), (0, 0, 1, 1))
+        self.assertEqual(tile_cache.metatile_bounds(2, 3, 3, 3), (3, 3, 1, 1))
+
+    def test_concurrent_requests_render_once(self):
+        calls = []
+
+        def render(layer, qgis_layer, style, z, x, y, x_size, y_size):
+            calls.append((z, x, y, x_size, y_size))
+            time.sleep(0.2)
+            for col in range(x_size):
+                for row in range(y_size):
+                    tile_cache._write(tile_cache.tile_filename(qgis_layer, style, z, x + col, y + row), b'png')
+
+        results = []
+        with patch.object(tile_cache, 'render_metatile', side_effect=render):
+            threads = [
+                threading.Thread(target=lambda x=x, y=y: results.append(
+                    tile_cache.get_tile(None, _Layer(), 'default', 3, x, y)))
+                for x, y in ((2, 2), (3, 2), (2, 3), (3, 3))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(calls, [(3, 2, 2, 2, 2)])
+        self.assertEqual(len([_r for _r in results if _r and os.path.exists(_r)]), 4)
+
+    def test_concurrent_requests_render_failure(self):
+        calls = []
+
+        def render(layer, qgis_layer, style, z, x, y, x_size, y_size):
+            calls.append((z, x, y, x_size, y_size))
+            time.sleep(0.2)
+            raise Exception('QGIS Server is down')
+
+        results = []
+        with patch.object(tile_cache, 'render_metatile', side_effect=render):
+            threads = [
+                threading.Thread(target=lambda x=x, y=y: results.append(
+                    tile_cache.get_tile(None, _Layer(), 'default', 3, x, y)))
+                for x, y in ((2, 2), (3, 2), (2, 3), (3, 3))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # the failure is remembered for a while
+            self.assertIsNone(tile_cache.get_tile(None, _Layer(), 'default', 3, 2, 2))
+        # the waiting requests do not render the block again
+        self.assertEqual(calls, [(3, 2, 2, 2, 2)])
+        self.assertEqual(results, [None] * 4)
+
+    def test_evict_tiles(self):
+        now = time.time()
+        for index in range(4):
+            filename = tile_cache.tile_filename(_Layer(), 'default', 1, 0, index)
+            tile_cache._write(filename, b'x' * 100)
+            os.utime(filename, (now - index * 3600, now - index * 3600))
+
+        self.assertEqual(tile_cache.evict_tiles(max_age=2.5 * 3600), (1, 100))
+        self.assertEqual(tile_cache.evict_tiles(max_size=150), (2, 200))
+        self.assertTrue(os.path.exists(tile_cache.tile_filename(_Layer(), 'default', 1, 0, 0)))
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2020 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+"""On disk cache of the tiles rendered by QGIS Server.
+
+Tiles are rendered by blocks of metatile_size x metatile_size tiles with a
+single QGIS Server request. While a block is being rendered, a lock file
+prevents other requests (from any process sharing the tiles directory) to
+render it again: they wait for the tiles to be written instead. A block which
+failed to render is marked as such, the requests waiting for it give up and
+it is not rendered again for tile_failure_ttl seconds.
+"""
+import io
+import os
+import time
+import logging
+
+import requests
+from django.conf import settings
+
+from geonode.qgis_server.helpers import tile_url
+
+logger = logging.getLogger(__name__)
+
+
+def _config(key, default=None):
+    return getattr(settings, 'QGIS_SERVER_CONFIG', {}).get(key, default)
+
+
+def tile_filename(qgis_layer, style, z, x, y):
+    """Path of the cached tile.
+
+    :return: The tile file path
+    :rtype: str
+    """
+    return _config('tile_path') % (qgis_layer.qgis_layer_name, style, z, x, y)
+
+
+def tile_etag(filename):
+    """Entity tag of a cached tile, derived from its size and mtime.
+
+    :return: The quoted entity tag
+    :rtype: str
+    """
+    stat = os.stat(filename)
+    return '"%x-%x"' % (int(stat.st_mtime * 1000000), stat.st_size)
+
+
+def metatile_bounds(z, x, y, size):
+    """The block of tiles the tile x, y belongs to.
+
+    :param size: Number of tiles along each axis of a full block
+    :type size: int
+
+    :return: Tuple (x, y, x_size, y_size) of the top left tile of the block
+        and of the number of tiles of the block along each axis, clipped to
+        the tiles grid of the zoom level.
+    :rtype: tuple
+    """
+    tiles = 2 ** z
+    size = max(1, min(size, tiles))
+    meta_x = x - x % size
+    meta_y = y - y % size
+    return meta_x, meta_y, min(size, tiles - meta_x), min(size, tiles - meta_y)
+
+
+def _write(filename, content):
+    """Atomically writes a tile, readers never get a partial file."""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_filename, filename)
+
+
+def _failed_since(failure_filename, since):
+    """Whether the rendering of a block failed after the given time.
+
+    :rtype: bool
+    """
+    try:
+        return os.path.getmtime(failure_filename) >= since
+    except OSError:
+        return False
+
+
+def _acquire(lock_filename, timeout):
+    """Takes the lock of a block, breaking it if it is older than timeout.
+
+    :return: True if the lock has been acquired
+    :rtype: bool
+    """
+    try:
+        os.close(os.open(lock_filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_filename) > timeout:
+                # the process rendering the block died
+                os.remove(lock_filename)
+        except OSError:
+            pass
+        return False
+
+
+def render_metatile(layer, qgis_layer, style, z, x, y, x_size, y_size):
+    """Renders a block of tiles with a single QGIS Server request and stores
+    each tile in the cache.
+    """
+    url = tile_url(layer, z, x, y, style=style, internal=True, x_size=x_size, y_size=y_size)
+    response = requests.get(url, timeout=_config('tile_timeout', 60))
+    if response.status_code != 200 or \
+            not response.headers.get('Content-Type', '').startswith('image/png'):
+        raise requests.HTTPError(
+            'Failed to fetch requested url: {url}\nWith HTTP status code: {status_code}'.format(
+                url=url, status_code=response.status_code))
+
+    if x_size == 1 and y_size == 1:
+        _write(tile_filename(qgis_layer, style, z, x, y), response.content)
+        return
+
+    from PIL import Image
+    image = Image.open(io.BytesIO(response.content))
+    for col in range(x_size):
+        for row in range(y_size):
+            tile = image.crop((col * 256, row * 256, (col + 1) * 256, (row + 1) * 256))
+            content = io.BytesIO()
+            tile.save(content, format='PNG')
+            _write(tile_filename(qgis_layer, style, z, x + col, y + row), content.getvalue())
+
+
+def get_tile(layer, qgis_layer, style, z, x, y):
+    """Returns the path of the cached tile, rendering it if needed.
+
+    Concurrent requests of the tiles of a same block trigger a single
+    rendering of the block.
+
+    :return: The tile file path or None if it could not be rendered
+    :rtype: str
+    """
+    filename = tile_filename(qgis_layer, style, z, x, y)
+    if os.path.exists(filename):
+        return filename
+
+    meta_x, meta_y, x_size, y_size = metatile_bounds(z, x, y, _config('metatile_size', 1))
+    meta_filename = tile_filename(qgis_layer, style, z, meta_x, meta_y)
+    lock_filename = '%s.lock' % meta_filename
+    failure_filename = '%s.failed' % meta_filename
+    timeout = _config('tile_timeout', 60)
+    # a lock older than this is left by a dead process, it must outlive the slowest rendering
+    lock_timeout = _config('tile_lock_timeout', 300)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    start = time.time()
+    failed_since = start - _config('tile_failure_ttl', 30)
+    while not os.path.exists(filename):
+        if _failed_since(failure_filename, failed_since):
+            return None
+        if _acquire(lock_filename, lock_timeout):
+            try:
+                # the tile could have been written, or failed, while acquiring the lock
+                if _failed_since(failure_filename, failed_since):
+                    return None
+                if not os.path.exists(filename):
+                    render_metatile(layer, qgis_layer, style, z, meta_x, meta_y, x_size, y_size)
+                if os.path.exists(failure_filename):
+                    os.remove(failure_filename)
+            except Exception as e:
+                logger.error('Failed to render tile %s: %s' % (filename, e))
+                # the requests waiting for the block give up instead of rendering it in turn
+                _write(failure_filename, b'')
+                return None
+            finally:
+                try:
+                    os.remove(lock_filename)
+                except OSError:
+                    pass
+        elif time.time() - start > timeout:
+            return None
+        else:
+            time.sleep(0.05)
+    return filename
+
+
+def evict_tiles(max_age=None, max_size=None):
+    """Removes the cached tiles older than max_age, then the least recently
+    written ones until the whole cache fits in max_size.
+
+    :param max_age: Max age of the tiles in seconds
+    :type max_age: int
+
+    :param max_size: Max size of the tiles cache in bytes
+    :type max_size: int
+
+    :return: Tuple (removed tiles count, removed bytes)
+    :rtype: tuple
+    """
+    tiles_directory = _config('tiles_directory')
+    if not tiles_directory or not os.path.exists(tiles_directory):
+        return 0, 0
+
+    now = time.time()
+    tiles = []
+    removed = []
+    for root, dirs, files in os.walk(tiles_directory):
+        for name in files:
+            if not name.endswith('.png') or name in ('legend.png', 'thumbnail.png'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if max_age is not None and now - stat.st_mtime > max_age:
+                removed.append((path, stat.st_size))
+            else:
+                tiles.append((stat.st_mtime, stat.st_size, path))
+
+    if max_size is not None:
+        total = sum(size for _, size, _ in tiles)
+        for mtime, size, path in sorted(tiles):
+            if total <= max_size:
+                break
+            removed.append((path, size))
+            total -= size
+
+    removed_bytes = 0
+    for path, size in removed:
+        try:
+            os.remove(path)
+            removed_bytes += size
+        except OSError:
+            pass
+    return len(removed), removed_bytes
@@ -36,9 +36,12 @@ from django.forms.models import model_to_dict
 from django.http import HttpResponse, Http404
 from django.http.response import (
     HttpResponseBadRequest,
+    HttpResponseNotModified,
     HttpResponseServerError)
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.utils.translation import ugettext as _
 
 from geonode.compat import ensure_string
@@ -48,12 +51,12 @@ from geonode.qgis_server.forms import QGISLayerStyleUploadForm
 from geonode.qgis_server.helpers import (
     tile_url_format,
     legend_url,
-    tile_url,
     qgs_url,
     qlr_url,
     qgis_server_endpoint, style_get_url, style_list, style_add_url,
     style_remove_url, style_set_default_url)
 from geonode.qgis_server.models import QGISServerLayer
+from geonode.qgis_server.tile_cache import get_tile, tile_etag
 from geonode.qgis_server.tasks.update import (
     create_qgis_server_thumbnail,
     cache_request)
@@ -312,21 +315,10 @@ def tile(request, layername, z, x, y, style=None):
         if qgis_layer.default_style:
             style = qgis_layer.default_style.name
 
-    tile_path = QGIS_SERVER_CONFIG['tile_path']
-    tile_filename = tile_path % (qgis_layer.qgis_layer_name, style, z, x, y)
-
-    if not os.path.exists(tile_filename):
-
-        if not os.path.exists(os.path.dirname(tile_filename)):
-            os.makedirs(os.path.dirname(tile_filename))
-        # Use internal url
-        url = tile_url(layer, z, x, y, style=style, internal=True)
-        result = cache_request.apply_async((url, tile_filename))
-
-        # Attempt to run task synchronously
-        if not result.get():
-            # If not succeded, provides error message.
-            return HttpResponseServerError('Failed to fetch tile.')
+    tile_filename = get_tile(layer, qgis_layer, style, z, x, y)
+    if not tile_filename:
+        # If not succeded, provides error message.
+        return HttpResponseServerError('Failed to fetch tile.')
 
     if image_format(tile_filename) != 'png':
         logger.error('%s is not valid PNG.' % tile_filename)
@@ -335,8 +327,16 @@ def tile(request, layername, z, x, y, style=None):
     if not os.path.exists(tile_filename):
         return HttpResponse('The tile could not be found.', status=409)
 
-    with open(tile_filename, 'rb') as f:
-        return HttpResponse(f.read(), content_type='image/png')
+    etag = tile_etag(tile_filename)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        with open(tile_filename, 'rb') as f:
+            response = HttpResponse(f.read(), content_type='image/png')
+    response['ETag'] = etag
+    if QGIS_SERVER_CONFIG.get('tile_max_age'):
+        patch_cache_control(response, max_age=QGIS_SERVER_CONFIG['tile_max_age'])
+    return response
 
 
 def layer_ogc_request(request, layername):
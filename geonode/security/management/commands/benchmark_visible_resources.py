@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2020 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+import time
+import uuid
+
+from django.db import transaction
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+
+from guardian.models import GroupObjectPermission
+
+from geonode.base.models import ResourceBase
+from geonode.security.utils import get_visible_resources
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+
+    help = """
+    Compares the per-object "has_perm" visibility check against the
+    sub-query based one used by "get_visible_resources".
+    Synthetic resources are created inside a transaction which is rolled
+    back at the end of the run, so the database is left untouched.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s',
+            '--sizes',
+            dest='sizes',
+            nargs='*',
+            type=int,
+            default=[1000, 10000, 100000],
+            help='Number of synthetic resources for each run. Default: 1000 10000 100000'
+        )
+        parser.add_argument(
+            '--skip-legacy',
+            dest='skip_legacy',
+            action='store_true',
+            default=False,
+            help='Do not run the per-object "has_perm" loop.'
+        )
+
+    def handle(self, *args, **options):
+        for size in options.get('sizes'):
+            try:
+                with transaction.atomic():
+                    self._run(size, options.get('skip_legacy'))
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def _run(self, size, skip_legacy):
+        owner = get_user_model().objects.filter(is_superuser=True).first()
+        anonymous_group, _ = Group.objects.get_or_create(name='anonymous')
+        ctype = ContentType.objects.get_for_model(ResourceBase)
+        view_perm = Permission.objects.get(content_type=ctype, codename='view_resourcebase')
+
+        resources = ResourceBase.objects.bulk_create([
+            ResourceBase(
+                uuid=str(uuid.uuid1()),
+                title='benchmark {}'.format(index),
+                owner=owner,
+                polymorphic_ctype=ctype,
+                is_published=True,
+                is_approved=True)
+            for index in range(size)], batch_size=1000)
+        # Only half of the resources are visible to anonymous users
+        ids = ResourceBase.objects.filter(title__startswith='benchmark ').values_list('id', flat=True)
+        GroupObjectPermission.objects.bulk_create([
+            GroupObjectPermission(
+                group=anonymous_group,
+                permission=view_perm,
+                content_type=ctype,
+                object_pk=str(_id))
+            for _id in ids[::2]], batch_size=1000)
+
+        user = get_user_model().objects.get(username='AnonymousUser')
+        queryset = ResourceBase.objects.filter(title__startswith='benchmark ')
+
+        start = time.time()
+        visible = get_visible_resources(queryset, user, admin_approval_required=True).count()
+        elapsed = time.time() - start
+        print("[%s resources] sub-query: %s visible in %.3fs" % (len(resources), visible, elapsed))
+
+        if not skip_legacy:
+            start = time.time()
+            visible = len([_r for _r in queryset.all() if user.has_perm('view_resourcebase', _r)])
+            elapsed = time.time() - start
+            print("[%s resources] has_perm loop: %s visible in %.3fs" % (len(resources), visible, elapsed))
@@ -32,6 +32,8 @@ from guardian.shortcuts import (
     get_groups_with_perms
 )
 
+from geonode import geoserver
+from geonode.utils import check_ogc_backend
 from geonode.groups.models import GroupProfile
 
 from .utils import (
@@ -39,7 +41,8 @@ from .utils import (
     set_owner_permissions,
     remove_object_permissions,
     purge_geofence_layer_rules,
-    sync_geofence_with_guardian
+    sync_geofence_with_guardian,
+    sync_geofence_layers_with_guardian
 )
 
 logger = logging.getLogger("geonode.security.models")
@@ -255,7 +258,7 @@ class PermissionLevelMixin(object):
         }
         """
         if not created:
-            remove_object_permissions(self)
+            remove_object_permissions(self, purge_geofence=False)
 
             # default permissions for resource owner
             set_owner_permissions(self)
@@ -270,20 +273,6 @@ class PermissionLevelMixin(object):
                 else:
                     assign_perm(perm, anonymous_group, self.get_self_resource())
 
-        # Owner
-        if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-            if self.polymorphic_ctype.name == 'layer':
-                if not created:
-                    purge_geofence_layer_rules(self.get_self_resource())
-                perms = [
-                    "view_resourcebase",
-                    "change_layer_data",
-                    "change_layer_style",
-                    "change_resourcebase",
-                    "change_resourcebase_permissions",
-                    "download_resourcebase"]
-                sync_geofence_with_guardian(self.layer, perms, user=self.owner)
-
         # All the other users
         if 'users' in perm_spec and len(perm_spec['users']) > 0:
             for user, perms in perm_spec['users'].items():
@@ -297,14 +286,6 @@ class PermissionLevelMixin(object):
                         else:
                             assign_perm(perm, _user, self.get_self_resource())
 
-                    # Set the GeoFence Rules
-                    if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-                        if self.polymorphic_ctype.name == 'layer':
-                            group_perms = None
-                            if 'groups' in perm_spec and len(perm_spec['groups']) > 0:
-                                group_perms = perm_spec['groups']
-                            sync_geofence_with_guardian(self.layer, perms, user=_user, group_perms=group_perms)
-
         # All the other groups
         if 'groups' in perm_spec and len(perm_spec['groups']) > 0:
             for group, perms in perm_spec['groups'].items():
@@ -317,13 +298,6 @@ class PermissionLevelMixin(object):
                     else:
                         assign_perm(perm, _group, self.get_self_resource())
 
-                # Set the GeoFence Rules
-                if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-                    if self.polymorphic_ctype.name == 'layer':
-                        if _group and _group.name and _group.name == 'anonymous':
-                            _group = None
-                        sync_geofence_with_guardian(self.layer, perms, group=_group)
-
         # AnonymousUser
         if 'users' in perm_spec and len(perm_spec['users']) > 0:
             if "AnonymousUser" in perm_spec['users']:
@@ -336,10 +310,19 @@ class PermissionLevelMixin(object):
                     else:
                         assign_perm(perm, _user, self.get_self_resource())
 
-                # Set the GeoFence Rules (user = None)
-                if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
-                    if self.polymorphic_ctype.name == 'layer':
-                        sync_geofence_with_guardian(self.layer, perms)
+        # Set the GeoFence Rules: only the rules which changed are updated
+        if settings.OGC_SERVER['default'].get("GEOFENCE_SECURITY_ENABLED", False):
+            if self.polymorphic_ctype.name == 'layer':
+                # the rules of a new layer are added to its default ones
+                if sync_geofence_layers_with_guardian(
+                        [(self.layer, perm_spec, self.owner)], purge=not created):
+                    raise RuntimeError(
+                        "Could not sync the GeoFence Rules of Layer {}".format(self.layer))
+
+        # Drop the layer ACLs cached for the GeoServer auth callbacks
+        if check_ogc_backend(geoserver.BACKEND_PACKAGE):
+            from geonode.geoserver.acl import invalidate_acls_cache
+            invalidate_acls_cache()
 
     def set_workflow_perms(self, approved=False, published=False):
         """
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+"""
+Permission fields of the resources search documents.
+
+The documents carry the ids of the users and groups allowed to view the
+resource, so that the search API filters the results with a few terms on
+the principals of the request user instead of the ids of all the resources
+the user can see. The update of the documents is queued whenever the view
+permissions of their resource change.
+"""
+from django.contrib.contenttypes.models import ContentType
+from guardian.conf import settings as guardian_settings
+from haystack import indexes
+
+from geonode.base.search import queue_search_index_updates
+
+
+class ResourceBaseACLIndex(indexes.SearchIndex):
+    """
+    Search index fields required by the permission filters of the search
+    API. To be inherited by the indexes of the ResourceBase subclasses.
+    """
+    acl_users = indexes.MultiValueField(null=True, stored=False)
+    acl_groups = indexes.MultiValueField(null=True, stored=False)
+    acl_anonymous = indexes.BooleanField(default=False, stored=False)
+    acl_owner = indexes.IntegerField(model_attr="owner_id", null=True, stored=False)
+    acl_group = indexes.IntegerField(model_attr="group_id", null=True, stored=False)
+    is_published = indexes.BooleanField(model_attr="is_published")
+    is_approved = indexes.BooleanField(model_attr="is_approved", stored=False)
+    dirty_state = indexes.BooleanField(model_attr="dirty_state", stored=False)
+
+    def index_queryset(self, using=None):
+        # the related objects rendered in the documents
+        return self.get_model()._default_manager.select_related(
+            'owner', 'category', 'group').prefetch_related('keywords', 'regions')
+
+    def prepare(self, obj):
+        data = super(ResourceBaseACLIndex, self).prepare(obj)
+        users, groups, anonymous = get_view_principals(obj)
+        data[self.fields['acl_users'].index_fieldname] = users
+        data[self.fields['acl_groups'].index_fieldname] = groups
+        data[self.fields['acl_anonymous'].index_fieldname] = anonymous
+        return data
+
+
+def get_view_principals(resource):
+    """
+    Returns the ids of the users and of the groups allowed to view
+    ``resource`` and whether anonymous users are allowed to view it.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+
+    perms_filter = dict(
+        content_type=ContentType.objects.get_for_model(ResourceBase),
+        object_pk=str(resource.id),
+        permission__codename='view_resourcebase')
+    users = []
+    groups = []
+    anonymous = False
+    for user_id, username in UserObjectPermission.objects.filter(
+            **perms_filter).values_list('user_id', 'user__username'):
+        users.append(user_id)
+        anonymous = anonymous or username == guardian_settings.ANONYMOUS_USER_NAME
+    for group_id, group_name in GroupObjectPermission.objects.filter(
+            **perms_filter).values_list('group_id', 'group__name'):
+        groups.append(group_id)
+        anonymous = anonymous or group_name == 'anonymous'
+    return users, groups, anonymous
+
+
+def object_permission_changed(sender, instance, **kwargs):
+    """
+    Queues the update of the search document of the resource whose view
+    permissions have been changed. Connected to the guardian object
+    permissions signals.
+    """
+    from geonode.base.models import ResourceBase
+
+    if instance.content_type_id != ContentType.objects.get_for_model(ResourceBase).id or \
+            instance.permission.codename != 'view_resourcebase':
+        return
+    try:
+        resource = ResourceBase.objects.non_polymorphic().get(id=int(instance.object_pk))
+    except (ResourceBase.DoesNotExist, ValueError):
+        # the resource is being deleted
+        return
+    queue_search_index_updates([resource])
+
+
+def resources_permissions_bulk_changed(sender, resources, **kwargs):
+    """
+    Queues the update of the search documents of the resources updated by
+    set_permissions_bulk, whose rows are created without signals.
+    """
+    queue_search_index_updates(resources)
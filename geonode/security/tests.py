@@ -26,6 +26,10 @@ import logging
 import gisdata
 import contextlib
 
+try:
+    import unittest.mock as mock
+except ImportError:
+    import mock
 from urllib.request import urlopen, Request
 from tastypie.test import ResourceTestCaseMixin
 
@@ -59,12 +63,15 @@ from geonode.layers.populate_layers_data import create_layer_data
 from .utils import (
     purge_geofence_all,
     get_users_with_perms,
+    get_visible_resources,
     get_geofence_rules,
     get_geofence_rules_count,
     get_highest_priority,
     set_geofence_all,
     sync_geofence_with_guardian,
-    sync_resources_with_guardian
+    sync_geofence_layers_with_guardian,
+    sync_resources_with_guardian,
+    set_permissions_bulk
 )
 
 
@@ -273,6 +280,63 @@ class BulkPermissionsTests(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
         self.perm_spec = {
             "users": {"admin": ["view_resourcebase"]}, "groups": []}
 
+    @dump_func_name
+    def test_set_permissions_bulk(self):
+        """Test that set_permissions_bulk sets the same permissions as
+        set_permissions and notifies the changes once"""
+        from .signals import permissions_bulk_changed
+
+        layers = list(Layer.objects.all()[:3])
+        perm_spec = {
+            "users": {
+                "bobby": ["view_resourcebase", "download_resourcebase", "change_layer_style"],
+                "AnonymousUser": ["view_resourcebase"]},
+            "groups": {"bar": ["view_resourcebase"]}}
+        layers[0].set_permissions(perm_spec)
+
+        receiver = mock.MagicMock()
+        permissions_bulk_changed.connect(receiver)
+        try:
+            perm_specs = set_permissions_bulk(layers[1:], perm_spec)
+        finally:
+            permissions_bulk_changed.disconnect(receiver)
+        self.assertEqual(receiver.call_count, 1)
+        self.assertEqual(receiver.call_args[1]['resources'], layers[1:])
+        self.assertEqual(sorted(perm_specs), sorted(_l.id for _l in layers[1:]))
+
+        def _perms(layer):
+            info = layer.get_all_level_info()
+            return (
+                {_u.username: sorted(_p) for _u, _p in info['users'].items() if _u != layer.owner},
+                {_g.name: sorted(_p) for _g, _p in info['groups'].items()})
+
+        for layer in layers[1:]:
+            self.assertEqual(_perms(layer), _perms(layers[0]))
+            self.assertTrue(layer.owner.has_perm('change_resourcebase', layer.get_self_resource()))
+            self.assertTrue(layer.owner.has_perm('change_layer_data', layer))
+
+    @dump_func_name
+    def test_search_index_view_principals(self):
+        """Test that the search documents carry the principals allowed to
+        view the resource"""
+        from .search_indexes import get_view_principals
+
+        layer = Layer.objects.all()[0]
+        bobby = get_user_model().objects.get(username='bobby')
+        group = Group.objects.get(name='bar')
+        layer.set_permissions({
+            "users": {"bobby": ["view_resourcebase"]},
+            "groups": {"bar": ["view_resourcebase", "download_resourcebase"]}})
+        users, groups, anonymous = get_view_principals(layer)
+        self.assertEqual(sorted(users), sorted([bobby.id, layer.owner.id]))
+        self.assertEqual(groups, [group.id])
+        self.assertFalse(anonymous)
+
+        layer.set_permissions({"users": {"AnonymousUser": ["view_resourcebase"]}})
+        users, groups, anonymous = get_view_principals(layer)
+        self.assertNotIn(bobby.id, users)
+        self.assertTrue(anonymous)
+
     @dump_func_name
     def test_set_bulk_permissions(self):
         """Test that after restrict view permissions on two layers
@@ -1434,6 +1498,36 @@ class PermissionsTest(GeoNodeBaseTestSupport):
             response = self.client.get(reverse('layer_style_manage', args=(layer.alternate,)))
             self.assertTrue(response.status_code in (302, 403))
 
+    @dump_func_name
+    def test_visible_resources_match_has_perm(self):
+        """Verify that the sub-query based visibility filter returns the same
+        resources of the per-object has_perm check
+        """
+        layer = Layer.objects.all()[0]
+        remove_perm('view_resourcebase', self.anonymous_user, layer.get_self_resource())
+        anonymous_group = Group.objects.get(name='anonymous')
+        remove_perm('view_resourcebase', anonymous_group, layer.get_self_resource())
+        bobby = get_user_model().objects.get(username='bobby')
+        assign_perm('view_resourcebase', bobby, layer.get_self_resource())
+
+        for user in (self.anonymous_user, bobby):
+            expected = set(
+                _l.id for _l in Layer.objects.all()
+                if user.has_perm('view_resourcebase', _l.get_self_resource()))
+            visible = get_visible_resources(
+                Layer.objects.all(),
+                user,
+                admin_approval_required=True,
+                unpublished_not_visible=True,
+                private_groups_not_visibile=True)
+            self.assertEqual(set(visible.values_list('id', flat=True)), expected)
+        self.assertNotIn(
+            layer.id,
+            get_visible_resources(
+                Layer.objects.all(),
+                self.anonymous_user,
+                admin_approval_required=True).values_list('id', flat=True))
+
 
 class GisBackendSignalsTests(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
 
@@ -1610,3 +1704,50 @@ class SecurityRulesTest(ResourceTestCaseMixin, GeoNodeBaseTestSupport):
             clean_layer = Layer.objects.get(pk=self._l.id)
             # Check dirty state
             self.assertFalse(clean_layer.dirty_state)
+
+    @on_ogc_backend(geoserver.BACKEND_PACKAGE)
+    @mock.patch('geonode.security.utils.set_geofence_invalidate_cache')
+    @mock.patch('geonode.security.utils._toggle_geofence_layer_cache')
+    @mock.patch('geonode.security.utils._update_geofence_rule')
+    @mock.patch('geonode.security.utils._delete_geofence_rule')
+    @mock.patch('geonode.security.utils._get_geofence_layer_rules')
+    @mock.patch('geonode.security.utils.get_geofence_rules_for_perm_spec')
+    def test_sync_geofence_layers_only_applies_changes(
+            self, mock_rules_for, mock_current_rules, mock_delete, mock_update, mock_toggle, mock_invalidate):
+        def current(_id, priority, **kwargs):
+            return dict(id=_id, priority=priority, workspace='geonode', layer=self._l.name, **kwargs)
+
+        mock_current_rules.return_value = [
+            current(1, 10, userName='bobby', service='WMS', access='ALLOW'),
+            current(2, 11, roleName='ROLE_BAR', service='WMS', access='ALLOW'),
+            current(3, 12, service='WMS', access='ALLOW'),
+        ]
+        mock_rules_for.return_value = ([
+            dict(service='WMS', user='bobby'),
+            dict(service='WMS', group='baz'),
+            dict(service='WMS'),
+        ], False)
+        with self.settings(DELAYED_SECURITY_SIGNALS=False):
+            failed = sync_geofence_layers_with_guardian([(self._l, {}, None)])
+        self.assertEqual(failed, [])
+        mock_delete.assert_called_once_with(2)
+        # the new rule is inserted before the unchanged anonymous one
+        self.assertEqual(mock_update.call_count, 1)
+        self.assertEqual(mock_update.call_args[1]['group'], 'baz')
+        self.assertEqual(mock_update.call_args[1]['priority'], 12)
+        mock_invalidate.assert_called_once_with()
+
+        # nothing to do when the rules are up to date
+        mock_delete.reset_mock()
+        mock_update.reset_mock()
+        mock_invalidate.reset_mock()
+        mock_current_rules.return_value = [
+            current(1, 10, userName='bobby', service='WMS', access='ALLOW'),
+            current(4, 11, roleName='ROLE_BAZ', service='WMS', access='ALLOW'),
+            current(3, 12, service='WMS', access='ALLOW'),
+        ]
+        with self.settings(DELAYED_SECURITY_SIGNALS=False):
+            sync_geofence_layers_with_guardian([(self._l, {}, None)])
+        mock_delete.assert_not_called()
+        mock_update.assert_not_called()
+        mock_invalidate.assert_not_called()
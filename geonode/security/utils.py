@@ -25,15 +25,17 @@ from defusedxml import lxml as dlxml
 
 import json
 import logging
+import threading
 import traceback
 import requests
 
 from six import string_types
 from requests.auth import HTTPBasicAuth
 from django.conf import settings
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, IntegerField
+from django.db.models.functions import Cast
 from django.contrib.auth import get_user_model
-from django.core.exceptions import PermissionDenied
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import Group, Permission
 from django.core.exceptions import ObjectDoesNotExist
@@ -107,20 +109,53 @@ def get_visible_resources(queryset,
             filter_set = filter_set.exclude(Q(dirty_state=True))
 
         if admin_approval_required or unpublished_not_visible or private_groups_not_visibile:
-            _allowed_resources = []
-            for _obj in filter_set.all():
-                try:
-                    resource = _obj.get_self_resource()
-                    if user.has_perm('base.view_resourcebase', resource) or \
-                    user.has_perm('view_resourcebase', resource):
-                        _allowed_resources.append(resource.id)
-                except (PermissionDenied, Exception) as e:
-                    logger.debug(e)
-            return filter_set.filter(id__in=_allowed_resources)
+            return filter_set.filter(get_resources_with_perms_filter(user))
 
     return filter_set
 
 
+def get_resources_with_perms_filter(user, perms=('view_resourcebase', )):
+    """
+    Returns a ``Q`` object selecting the ResourceBase ids on which ``user``
+    has been granted at least one of ``perms``, either directly or through
+    one of its groups (the ``anonymous`` group always included).
+
+    The object permissions are resolved by two sub-queries over the Guardian
+    user/group object permission tables, hence the filter can be applied to
+    any ResourceBase (or subclass) queryset without evaluating it.
+    Semantics are the same of ``user.has_perm(perm, resource)``.
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+
+    if not user:
+        return Q(id__in=[])
+    if user.is_anonymous:
+        user = get_anonymous_user()
+    if not user.is_active:
+        return Q(id__in=[])
+    if user.is_superuser:
+        return Q()
+
+    ctype = ContentType.objects.get_for_model(ResourceBase)
+    perms_filter = Q(content_type=ctype) & Q(permission__codename__in=perms)
+    groups = Group.objects.filter(
+        Q(user=user) | Q(name='anonymous') | Q(groupprofile__groupmember__user=user)
+    ).values('id')
+
+    user_perms = UserObjectPermission.objects.filter(
+        perms_filter, user=user
+    ).annotate(
+        resource_id=Cast('object_pk', IntegerField())
+    ).values('resource_id')
+    group_perms = GroupObjectPermission.objects.filter(
+        perms_filter, group__in=groups
+    ).annotate(
+        resource_id=Cast('object_pk', IntegerField())
+    ).values('resource_id')
+    return Q(id__in=user_perms) | Q(id__in=group_perms)
+
+
 def get_users_with_perms(obj):
     """
     Override of the Guardian get_users_with_perms
@@ -152,6 +187,74 @@ def get_users_with_perms(obj):
     return profiles
 
 
+_geofence_local = threading.local()
+
+# number of rules fetched by each GeoFence request
+GEOFENCE_RULES_PAGE_SIZE = getattr(settings, 'GEOFENCE_RULES_PAGE_SIZE', 500)
+
+
+def _geofence_request(method, path, **kwargs):
+    """Send a request to the GeoServer REST API over a pooled session.
+
+    Each thread keeps its own session, so that the connections to GeoServer
+    are reused by the many requests needed to manage the GeoFence rules.
+    """
+    session = getattr(_geofence_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _geofence_local.session = session
+    kwargs.setdefault('timeout', 30)
+    return session.request(
+        method,
+        settings.OGC_SERVER['default']['LOCATION'] + path,
+        auth=HTTPBasicAuth(
+            settings.OGC_SERVER['default']['USER'],
+            settings.OGC_SERVER['default']['PASSWORD']),
+        **kwargs)
+
+
+def _get_geofence_layer_rules(workspace=None, layer_name=None):
+    """Return the GeoFence rules sorted by priority, fetched page by page.
+
+    If ``layer_name`` is given only the rules of this layer are returned.
+    """
+    params = {'entries': GEOFENCE_RULES_PAGE_SIZE}
+    if layer_name:
+        params.update(workspace=workspace, layer=layer_name)
+    rules = []
+    page = 0
+    while True:
+        params['page'] = page
+        r = _geofence_request(
+            'get', 'rest/geofence/rules.json',
+            params=params,
+            headers={'Content-type': 'application/json'},
+            verify=False)
+        if r.status_code < 200 or r.status_code >= 300:
+            raise RuntimeError(
+                "Could not retrieve GeoFence Rules: [{}] {}".format(r.status_code, r.text))
+        _rules = r.json().get('rules') or []
+        rules.extend(_rules)
+        if len(_rules) < GEOFENCE_RULES_PAGE_SIZE:
+            break
+        page += 1
+    if layer_name:
+        rules = [_r for _r in rules if _r.get('layer') == layer_name]
+    return sorted(rules, key=lambda _r: _r['priority'])
+
+
+def _delete_geofence_rule(rule_id):
+    """
+    curl -X DELETE -u admin:geoserver http://<host>:<port>/geoserver/rest/geofence/rules/id/{r_id}
+    """
+    r = _geofence_request(
+        'delete', 'rest/geofence/rules/id/{}'.format(rule_id),
+        headers={'Content-type': 'application/json'})
+    if r.status_code < 200 or r.status_code > 201:
+        logger.debug("Response [{}] : {}".format(r.status_code, r.text))
+        raise RuntimeError("Could not DELETE GeoServer Rule id[{}]".format(rule_id))
+
+
 @on_ogc_backend(geoserver.BACKEND_PACKAGE)
 def get_geofence_rules(page=0, entries=1, count=False):
     """Get the number of available GeoFence Cache Rules"""
@@ -267,40 +370,11 @@ def purge_geofence_layer_rules(resource):
     curl -u admin:geoserver
     http://<host>:<port>/geoserver/rest/geofence/rules.json?workspace=geonode&layer={layer}
     """
-    url = settings.OGC_SERVER['default']['LOCATION']
-    user = settings.OGC_SERVER['default']['USER']
-    passwd = settings.OGC_SERVER['default']['PASSWORD']
-    headers = {'Content-type': 'application/json'}
     workspace = get_layer_workspace(resource.layer)
     try:
-        r = requests.get(
-            "{}rest/geofence/rules.json?workspace={}&layer={}".format(
-                url, workspace, resource.layer.name),
-            headers=headers,
-            auth=HTTPBasicAuth(user, passwd),
-            timeout=10,
-            verify=False
-        )
-        if (r.status_code >= 200 and r.status_code < 300):
-            gs_rules = r.json()
-            r_ids = []
-            if gs_rules and gs_rules['rules']:
-                for r in gs_rules['rules']:
-                    if r['layer'] and r['layer'] == resource.layer.name:
-                        r_ids.append(r['id'])
-
-            # Delete GeoFence Rules associated to the Layer
-            # curl -X DELETE -u admin:geoserver http://<host>:<port>/geoserver/rest/geofence/rules/id/{r_id}
-            for i, r_id in enumerate(r_ids):
-                r = requests.delete(url + 'rest/geofence/rules/id/' + str(r_id),
-                                    headers=headers,
-                                    auth=HTTPBasicAuth(user, passwd))
-                if (r.status_code < 200 or r.status_code > 201):
-                    msg = "Could not DELETE GeoServer Rule for Layer "
-                    msg = msg + str(resource.layer.name)
-                    e = Exception(msg)
-                    logger.debug("Response [{}] : {}".format(r.status_code, r.text))
-                    raise e
+        # Delete GeoFence Rules associated to the Layer
+        for rule in _get_geofence_layer_rules(workspace, resource.layer.name):
+            _delete_geofence_rule(rule['id'])
     except Exception as e:
         logger.exception(e)
 
@@ -531,13 +605,19 @@ def set_geofence_all(instance):
             resource.set_dirty_state()
 
 
-@on_ogc_backend(geoserver.BACKEND_PACKAGE)
-def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms=None):
+def _get_geofence_layer_name(layer):
+    return layer.name if layer and hasattr(layer, 'name') else layer.alternate.split(":")[0]
+
+
+def _get_geofence_rules_for(layer, perms, user=None, group=None, group_perms=None):
     """
-    Sync Guardian permissions to GeoFence.
+    Return the GeoFence rules granting ``perms`` on ``layer`` to ``user``, to
+    ``group`` or, if none of them is given, to anyone.
+
+    The rules are returned in priority order as dictionaries of the arguments
+    of ``_update_geofence_rule``, along with a flag telling if geo-limits
+    apply, in which case the layer must not be served from the tiles cache.
     """
-    _layer_name = layer.name if layer and hasattr(layer, 'name') else layer.alternate.split(":")[0]
-    _layer_workspace = get_layer_workspace(layer)
     # Create new rule-set
     gf_services = {}
     gf_services["WMS"] = 'view_resourcebase' in perms or 'change_layer_style' in perms
@@ -558,7 +638,7 @@ def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms
                 user = get_user_model().objects.get(username=user)
             user_groups = list(user.groups.all().values_list('name', flat=True))
             for _group, _perm in group_perms.items():
-                if 'change_layer_data' in _perm and _group in user_groups:
+                if 'change_layer_data' in _perm and str(_group) in user_groups:
                     _skip_perm = True
                     break
         if not _skip_perm:
@@ -593,30 +673,13 @@ def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms
         _disable_layer_cache = anonymous_geolimits.count() > 0
 
     if _disable_layer_cache:
-        # delete_layer_cache('{}:{}'.format(_layer_workspace, _layer_name))
-        filters = None
-        formats = None
         # Re-order dictionary
         # - if geo-limits have been defined for this user/group, the "*" rule must be the first one
         gf_services_limits_first = {"*": gf_services.pop('*')}
         gf_services_limits_first.update(gf_services)
         gf_services = gf_services_limits_first
-    else:
-        filters = [{
-            "styleParameterFilter": {
-                "STYLES": ""
-            }
-        }]
-        formats = [
-            'application/json;type=utfgrid',
-            'image/png',
-            'image/vnd.jpeg-png',
-            'image/jpeg',
-            'image/gif',
-            'image/png8'
-        ]
-    toggle_layer_cache('{}:{}'.format(_layer_workspace, _layer_name), enable=True, filters=filters, formats=formats)
 
+    rules = []
     for service, allowed in gf_services.items():
         if allowed:
             if _user:
@@ -626,9 +689,8 @@ def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms
                     _wkt = users_geolimits.last().wkt
                 if service in gf_requests:
                     for request, enabled in gf_requests[service].items():
-                        _update_geofence_rule(layer, _layer_name, _layer_workspace,
-                                              service, request=request, user=_user, allow=enabled)
-                _update_geofence_rule(layer, _layer_name, _layer_workspace, service, user=_user, geo_limit=_wkt)
+                        rules.append(dict(service=service, request=request, user=_user, allow=enabled))
+                rules.append(dict(service=service, user=_user, geo_limit=_wkt))
             elif not _group:
                 logger.debug("Adding to geofence the rule: %s %s *" % (layer, service))
                 _wkt = None
@@ -636,9 +698,8 @@ def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms
                     _wkt = anonymous_geolimits.last().wkt
                 if service in gf_requests:
                     for request, enabled in gf_requests[service].items():
-                        _update_geofence_rule(layer, _layer_name, _layer_workspace,
-                                              service, request=request, user=_user, allow=enabled)
-                _update_geofence_rule(layer, _layer_name, _layer_workspace, service, geo_limit=_wkt)
+                        rules.append(dict(service=service, request=request, user=_user, allow=enabled))
+                rules.append(dict(service=service, geo_limit=_wkt))
             if _group:
                 logger.debug("Adding 'group' to geofence the rule: %s %s %s" % (layer, service, _group))
                 _wkt = None
@@ -646,9 +707,60 @@ def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms
                     _wkt = groups_geolimits.last().wkt
                 if service in gf_requests:
                     for request, enabled in gf_requests[service].items():
-                        _update_geofence_rule(layer, _layer_name, _layer_workspace,
-                                              service, request=request, group=_group, allow=enabled)
-                _update_geofence_rule(layer, _layer_name, _layer_workspace, service, group=_group, geo_limit=_wkt)
+                        rules.append(dict(service=service, request=request, group=_group, allow=enabled))
+                rules.append(dict(service=service, group=_group, geo_limit=_wkt))
+    return rules, _disable_layer_cache
+
+
+def _toggle_geofence_layer_cache(layer, limited):
+    if limited:
+        # delete_layer_cache('{}:{}'.format(_layer_workspace, _layer_name))
+        filters = None
+        formats = None
+    else:
+        filters = [{
+            "styleParameterFilter": {
+                "STYLES": ""
+            }
+        }]
+        formats = [
+            'application/json;type=utfgrid',
+            'image/png',
+            'image/vnd.jpeg-png',
+            'image/jpeg',
+            'image/gif',
+            'image/png8'
+        ]
+    toggle_layer_cache(
+        '{}:{}'.format(get_layer_workspace(layer), _get_geofence_layer_name(layer)),
+        enable=True, filters=filters, formats=formats)
+
+
+def _add_geofence_rules(layer, rules, priority=None):
+    """Add ``rules`` to GeoFence, in this order, starting at ``priority``.
+
+    GeoFence shifts the rules from ``priority`` on, by default the new rules
+    are inserted right before the rule with the highest priority.
+    """
+    if not rules:
+        return
+    if priority is None:
+        priority = max(get_highest_priority(), 0)
+    _layer_name = _get_geofence_layer_name(layer)
+    _layer_workspace = get_layer_workspace(layer)
+    for i, rule in enumerate(rules):
+        _update_geofence_rule(layer, _layer_name, _layer_workspace, priority=priority + i, **rule)
+
+
+@on_ogc_backend(geoserver.BACKEND_PACKAGE)
+def sync_geofence_with_guardian(layer, perms, user=None, group=None, group_perms=None):
+    """
+    Sync Guardian permissions to GeoFence.
+    """
+    rules, limited = _get_geofence_rules_for(
+        layer, perms, user=user, group=group, group_perms=group_perms)
+    _toggle_geofence_layer_cache(layer, limited)
+    _add_geofence_rules(layer, rules)
     if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
         set_geofence_invalidate_cache()
     else:
@@ -679,11 +791,12 @@ def set_owner_permissions(resource, members=None):
                         assign_perm(perm, user, resource.layer)
 
 
-def remove_object_permissions(instance):
+def remove_object_permissions(instance, purge_geofence=True):
     """Remove object permissions on given resource.
 
     If is a layer removes the layer specific permissions then the
-    resourcebase permissions
+    resourcebase permissions. The GeoFence rules of the layer are purged
+    unless ``purge_geofence`` is False, when the caller reconciles them.
 
     """
     from guardian.models import UserObjectPermission, GroupObjectPermission
@@ -699,7 +812,7 @@ def remove_object_permissions(instance):
                 object_pk=instance.id
             ).delete()
             if settings.OGC_SERVER['default']['GEOFENCE_SECURITY_ENABLED']:
-                if not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
+                if purge_geofence and not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False):
                     purge_geofence_layer_rules(resource)
                     set_geofence_invalidate_cache()
             else:
@@ -715,9 +828,134 @@ def remove_object_permissions(instance):
                                          object_pk=instance.id).delete()
 
 
+# the permissions which are assigned on the layer instead of its resource base
+LAYER_PERMISSIONS = (
+    'change_layer_data',
+    'change_layer_style',
+    'add_layer',
+    'change_layer',
+    'delete_layer',
+)
+
+PERMISSIONS_BULK_BATCH_SIZE = getattr(settings, 'PERMISSIONS_BULK_BATCH_SIZE', 1000)
+
+
+def set_permissions_bulk(resources, perm_spec):
+    """
+    Sets the permissions of many resources at once.
+
+    The permissions are set as ``PermissionLevelMixin.set_permissions`` does,
+    but the users, groups and permissions are fetched once and the object
+    permissions of all the resources are replaced in a single transaction
+    with bulk queries. ``perm_spec`` is either the permissions of all the
+    resources or a callable returning the permissions of a given resource.
+
+    A single ``permissions_bulk_changed`` signal is then sent for all the
+    resources, its receivers sync the GeoFence rules and drop the ACLs and
+    facets caches.
+
+    :return: The perm_spec set on each resource, by resource id
+    :rtype: dict
+    """
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from geonode.base.models import ResourceBase
+    from geonode.layers.models import Layer
+    from .models import VIEW_PERMISSIONS, ADMIN_PERMISSIONS, LAYER_ADMIN_PERMISSIONS
+    from .signals import permissions_bulk_changed
+
+    resources = list(resources)
+    if not resources:
+        return {}
+
+    perm_specs = {}
+    usernames = set()
+    group_names = {'anonymous'}
+    for resource in resources:
+        _spec = perm_spec(resource) if callable(perm_spec) else perm_spec
+        _spec = {
+            'users': {
+                getattr(_u, 'username', _u): _p for _u, _p in (_spec.get('users') or {}).items()},
+            'groups': {
+                getattr(_g, 'name', _g): _p for _g, _p in (_spec.get('groups') or {}).items()}
+        }
+        usernames.update(_spec['users'])
+        group_names.update(_spec['groups'])
+        perm_specs[resource.id] = _spec
+
+    # resolve all the principals and permissions at once
+    users = {_u.username: _u.id for _u in get_user_model().objects.filter(username__in=usernames)}
+    if usernames - set(users):
+        raise get_user_model().DoesNotExist(
+            "Users {} do not exist".format(", ".join(usernames - set(users))))
+    groups = {_g.name: _g.id for _g in Group.objects.filter(name__in=group_names)}
+    if group_names - set(groups):
+        raise Group.DoesNotExist(
+            "Groups {} do not exist".format(", ".join(group_names - set(groups))))
+    base_ctype = ContentType.objects.get_for_model(ResourceBase)
+    layer_ctype = ContentType.objects.get_for_model(Layer)
+    permissions = {
+        (_p.content_type_id, _p.codename): _p.id
+        for _p in Permission.objects.filter(content_type__in=(base_ctype, layer_ctype))}
+
+    owner_perms = VIEW_PERMISSIONS + ADMIN_PERMISSIONS
+    if settings.RESOURCE_PUBLISHING or settings.ADMIN_MODERATE_UPLOADS:
+        owner_perms = [_p for _p in owner_perms
+                       if _p not in ('change_resourcebase_permissions', 'publish_resourcebase')]
+
+    def _row(principal_id, resource, is_layer, perm):
+        ctype_id = layer_ctype.id if is_layer and perm in LAYER_PERMISSIONS else base_ctype.id
+        try:
+            return principal_id, ctype_id, str(resource.id), permissions[(ctype_id, perm)]
+        except KeyError:
+            raise Permission.DoesNotExist("Permission {} does not exist".format(perm))
+
+    user_rows = set()
+    group_rows = set()
+    base_pks = []
+    layer_pks = []
+    for resource in resources:
+        is_layer = resource.polymorphic_ctype_id == layer_ctype.id
+        base_pks.append(str(resource.id))
+        if is_layer:
+            layer_pks.append(str(resource.id))
+
+        # default permissions for resource owner
+        for perm in owner_perms + (LAYER_ADMIN_PERMISSIONS if is_layer else []):
+            user_rows.add(_row(resource.owner_id, resource, is_layer, perm))
+        _spec = perm_specs[resource.id]
+        for username, perms in _spec['users'].items():
+            for perm in perms:
+                if username == "AnonymousUser":
+                    # both the anonymous group and the guardian anonymous user
+                    group_rows.add(_row(groups['anonymous'], resource, is_layer, perm))
+                    user_rows.add(_row(users[username], resource, is_layer, perm))
+                elif users[username] != resource.owner_id:
+                    user_rows.add(_row(users[username], resource, is_layer, perm))
+        for group_name, perms in _spec['groups'].items():
+            for perm in perms:
+                group_rows.add(_row(groups[group_name], resource, is_layer, perm))
+
+    with transaction.atomic():
+        for _model in (UserObjectPermission, GroupObjectPermission):
+            _model.objects.filter(content_type=base_ctype, object_pk__in=base_pks).delete()
+            if layer_pks:
+                _model.objects.filter(content_type=layer_ctype, object_pk__in=layer_pks).delete()
+        UserObjectPermission.objects.bulk_create([
+            UserObjectPermission(user_id=_u, content_type_id=_c, object_pk=_o, permission_id=_p)
+            for _u, _c, _o, _p in user_rows], batch_size=PERMISSIONS_BULK_BATCH_SIZE)
+        GroupObjectPermission.objects.bulk_create([
+            GroupObjectPermission(group_id=_g, content_type_id=_c, object_pk=_o, permission_id=_p)
+            for _g, _c, _o, _p in group_rows], batch_size=PERMISSIONS_BULK_BATCH_SIZE)
+    logger.debug("Set {} user and {} group permissions on {} resources".format(
+        len(user_rows), len(group_rows), len(resources)))
+
+    permissions_bulk_changed.send(sender=ResourceBase, resources=resources, perm_specs=perm_specs)
+    return perm_specs
+
+
 def _get_geofence_payload(layer, layer_name, workspace, access, user=None, group=None,
-                          service=None, request=None, geo_limit=None):
-    highest_priority = get_highest_priority()
+                          service=None, request=None, geo_limit=None, priority=None):
+    highest_priority = get_highest_priority() if priority is None else priority
     root_el = etree.Element("Rule")
     username_el = etree.SubElement(root_el, "userName")
     if user is not None:
@@ -756,7 +994,7 @@ def _get_geofence_payload(layer, layer_name, workspace, access, user=None, group
 def _update_geofence_rule(layer, layer_name, workspace,
                           service, request=None,
                           user=None, group=None,
-                          geo_limit=None, allow=True):
+                          geo_limit=None, allow=True, priority=None):
     payload = _get_geofence_payload(
         layer=layer,
         layer_name=layer_name,
@@ -766,20 +1004,16 @@ def _update_geofence_rule(layer, layer_name, workspace,
         group=group,
         service=service,
         request=request,
-        geo_limit=geo_limit
+        geo_limit=geo_limit,
+        priority=priority
     )
     logger.debug("request data: {}".format(payload))
-    response = requests.post(
-        "{base_url}rest/geofence/rules".format(
-            base_url=settings.OGC_SERVER['default']['LOCATION']),
+    response = _geofence_request(
+        'post', 'rest/geofence/rules',
         data=payload,
         headers={
             'Content-type': 'application/xml'
-        },
-        auth=HTTPBasicAuth(
-            username=settings.OGC_SERVER['default']['USER'],
-            password=settings.OGC_SERVER['default']['PASSWORD']
-        )
+        }
     )
     logger.debug("response status_code: {}".format(response.status_code))
     if response.status_code not in (200, 201):
@@ -791,6 +1025,187 @@ def _update_geofence_rule(layer, layer_name, workspace,
             raise RuntimeError(msg)
 
 
+GEOFENCE_OWNER_PERMISSIONS = [
+    "view_resourcebase",
+    "change_layer_data",
+    "change_layer_style",
+    "change_resourcebase",
+    "change_resourcebase_permissions",
+    "download_resourcebase"]
+
+
+def _get_geofence_rule_key(user=None, role=None, service=None, request=None, access=None):
+    return (
+        user or None,
+        role or None,
+        None if service in (None, '', '*') else service,
+        None if request in (None, '', '*') else request,
+        access)
+
+
+def _get_current_geofence_rule_key(rule):
+    if rule.get('access') == 'LIMIT':
+        # geo-limits can't be reliably compared, such rules are always replaced
+        return object()
+    return _get_geofence_rule_key(
+        rule.get('userName'), rule.get('roleName'),
+        rule.get('service'), rule.get('request'), rule.get('access'))
+
+
+def _get_desired_geofence_rule_key(rule):
+    if rule.get('service') == '*' and rule.get('geo_limit'):
+        return object()
+    return _get_geofence_rule_key(
+        rule.get('user'),
+        "ROLE_{}".format(rule['group'].upper()) if rule.get('group') else None,
+        rule.get('service'), rule.get('request'),
+        "ALLOW" if rule.get('allow', True) else "DENY")
+
+
+def get_geofence_rules_for_perm_spec(layer, perm_spec, owner=None):
+    """
+    Return the GeoFence rules implementing ``perm_spec`` on ``layer``.
+
+    The owner, if given, gets the full set of permissions. Then come the
+    users, the groups and, being the broadest ones, the rules applying to
+    anyone.
+
+    :return: Tuple (rules, limited) as ``_get_geofence_rules_for``
+    """
+    users = perm_spec.get('users') or {}
+    groups = perm_spec.get('groups') or {}
+    subjects = []
+    if owner:
+        subjects.append((GEOFENCE_OWNER_PERMISSIONS, owner, None))
+    anonymous = []
+    for user, perms in users.items():
+        username = getattr(user, 'username', user)
+        if "AnonymousUser" in username:
+            anonymous.append(perms)
+        elif not owner or username != owner.username:
+            subjects.append((perms, username, None))
+    for group, perms in groups.items():
+        group_name = getattr(group, 'name', group)
+        if group_name == 'anonymous':
+            anonymous.insert(0, perms)
+        else:
+            subjects.append((perms, None, group_name))
+    subjects.extend((perms, None, None) for perms in anonymous)
+
+    rules = []
+    keys = set()
+    limited = False
+    for perms, user, group in subjects:
+        _rules, _limited = _get_geofence_rules_for(
+            layer, perms, user=user, group=group, group_perms=groups if user else None)
+        limited = limited or _limited
+        for rule in _rules:
+            key = _get_desired_geofence_rule_key(rule)
+            # GeoFence would refuse the duplicates anyway
+            if key not in keys:
+                keys.add(key)
+                rules.append(rule)
+    return rules, limited
+
+
+@on_ogc_backend(geoserver.BACKEND_PACKAGE)
+def sync_geofence_layers_with_guardian(layers_perms, invalidate=None, purge=True):
+    """
+    Reconcile the GeoFence rules of one or many layers with their permissions.
+
+    ``layers_perms`` is an iterable of ``(layer, perm_spec, owner)`` tuples.
+    The current rules are fetched once, page by page, and compared with the
+    rules implementing the permissions. Only the rules in between the
+    unchanged head and tail of the rule-set of a layer are deleted and added
+    again, so that the rules keep their priority order. If ``purge`` is False
+    the current rules are all kept and only the missing ones are added.
+
+    The GeoFence cache is invalidated once at the end; if ``invalidate`` is
+    None and DELAYED_SECURITY_SIGNALS is set, the changed layers are marked
+    as dirty instead.
+
+    :return: The layers which could not be synchronized
+    :rtype: list
+    """
+    layers_perms = list(layers_perms)
+    if not layers_perms:
+        return []
+    if len(layers_perms) == 1:
+        layer = layers_perms[0][0]
+        current_rules = _get_geofence_layer_rules(
+            get_layer_workspace(layer), _get_geofence_layer_name(layer))
+        highest_priority = None
+    else:
+        current_rules = _get_geofence_layer_rules()
+        highest_priority = max([_r['priority'] for _r in current_rules] or [0])
+    layers_rules = {}
+    for rule in current_rules:
+        layers_rules.setdefault((rule.get('workspace'), rule.get('layer')), []).append(rule)
+
+    failed = []
+    changed = []
+    added = deleted = 0
+    for layer, perm_spec, owner in layers_perms:
+        try:
+            rules, limited = get_geofence_rules_for_perm_spec(layer, perm_spec, owner=owner)
+            current = layers_rules.get(
+                (get_layer_workspace(layer), _get_geofence_layer_name(layer)), [])
+            current_keys = [_get_current_geofence_rule_key(_r) for _r in current]
+            desired_keys = [_get_desired_geofence_rule_key(_r) for _r in rules]
+
+            if purge:
+                head = 0
+                while head < min(len(current), len(rules)) and current_keys[head] == desired_keys[head]:
+                    head += 1
+                tail = 0
+                while tail < min(len(current), len(rules)) - head and \
+                        current_keys[-1 - tail] == desired_keys[-1 - tail]:
+                    tail += 1
+                to_delete = current[head:len(current) - tail]
+                to_add = rules[head:len(rules) - tail]
+            else:
+                tail = 0
+                to_delete = []
+                to_add = [_r for _r, _k in zip(rules, desired_keys) if _k not in current_keys]
+            if not to_delete and not to_add:
+                continue
+
+            for rule in to_delete:
+                _delete_geofence_rule(rule['id'])
+                current_rules.remove(rule)
+                deleted += 1
+            if to_add:
+                # insert before the unchanged tail, or before the last rule
+                if tail:
+                    priority = current[len(current) - tail]['priority']
+                else:
+                    if highest_priority is None:
+                        highest_priority = max(get_highest_priority(), 0)
+                    priority = highest_priority
+                _add_geofence_rules(layer, to_add, priority=priority)
+                added += len(to_add)
+                # GeoFence shifted the rules from priority on
+                for rule in current_rules:
+                    if rule['priority'] >= priority:
+                        rule['priority'] += len(to_add)
+                if highest_priority is not None and priority <= highest_priority:
+                    highest_priority += len(to_add)
+            _toggle_geofence_layer_cache(layer, limited)
+            changed.append(layer)
+        except Exception as e:
+            logger.exception(e)
+            failed.append(layer)
+    logger.debug("GeoFence rules: {} added, {} deleted".format(added, deleted))
+
+    if invalidate or (invalidate is None and not getattr(settings, 'DELAYED_SECURITY_SIGNALS', False)):
+        if invalidate or changed:
+            set_geofence_invalidate_cache()
+    else:
+        for layer in changed:
+            layer.set_dirty_state()
+    return failed
+
+
 def sync_resources_with_guardian(resource=None):
     """
     Sync resources with Guardian and clear their dirty state
@@ -805,30 +1220,26 @@ def sync_resources_with_guardian(resource=None):
         dirty_resources = ResourceBase.objects.filter(dirty_state=True)
     if dirty_resources and dirty_resources.count() > 0:
         logger.debug(" --------------------------- synching with guardian!")
+        layers_perms = []
+        resources = {}
         for r in dirty_resources:
             if r.polymorphic_ctype.name == 'layer':
-                layer = None
                 try:
-                    purge_geofence_layer_rules(r)
                     layer = Layer.objects.get(id=r.id)
                     perm_spec = layer.get_all_level_info()
                     logger.debug(" %s --------------------------- %s " % (layer, perm_spec))
-                    # All the other users
-                    if 'users' in perm_spec:
-                        for user, perms in perm_spec['users'].items():
-                            user = get_user_model().objects.get(username=user)
-                            # Set the GeoFence User Rules
-                            geofence_user = str(user)
-                            if "AnonymousUser" in geofence_user:
-                                geofence_user = None
-                            sync_geofence_with_guardian(layer, perms, user=geofence_user)
-                    # All the other groups
-                    if 'groups' in perm_spec:
-                        for group, perms in perm_spec['groups'].items():
-                            group = Group.objects.get(name=group)
-                            # Set the GeoFence Group Rules
-                            sync_geofence_with_guardian(layer, perms, group=group)
-                    r.clear_dirty_state()
+                    layers_perms.append((layer, perm_spec, None))
+                    resources[layer.id] = r
                 except Exception as e:
                     logger.exception(e)
                     logger.warn("!WARNING! - Failure Synching-up Security Rules for Resource [%s]" % (r))
+        try:
+            failed = [_l.id for _l in sync_geofence_layers_with_guardian(layers_perms, invalidate=True)]
+        except Exception as e:
+            logger.exception(e)
+            failed = list(resources)
+        for layer_id, r in resources.items():
+            if layer_id in failed:
+                logger.warn("!WARNING! - Failure Synching-up Security Rules for Resource [%s]" % (r))
+            else:
+                r.clear_dirty_state()
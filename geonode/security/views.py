@@ -37,6 +37,7 @@ from geonode.base.models import (
     GroupGeoLimit)
 from geonode.layers.models import Layer
 from geonode.groups.models import GroupProfile
+from geonode.security.utils import set_permissions_bulk
 
 if "notification" in settings.INSTALLED_APPS:
     from notification import models as notification
@@ -402,16 +403,17 @@ def set_bulk_permissions(request):
     resource_ids = request.POST.getlist('resources', [])
     if permission_spec is not None:
         not_permitted = []
+        resources = []
         for resource_id in resource_ids:
             try:
-                resource = resolve_object(
+                resources.append(resolve_object(
                     request, ResourceBase, {
                         'id': resource_id
                     },
-                    'base.change_resourcebase_permissions')
-                resource.set_permissions(permission_spec)
+                    'base.change_resourcebase_permissions'))
             except PermissionDenied:
                 not_permitted.append(ResourceBase.objects.get(id=resource_id).title)
+        set_permissions_bulk(resources, permission_spec)
 
         return HttpResponse(
             json.dumps({'success': 'ok', 'not_changed': not_permitted}),
@@ -47,4 +47,11 @@ class ServiceAdmin(admin.ModelAdmin):
     )
 
 
+class ServiceProbeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'service', 'checked', 'status', 'latency')
+    list_filter = ('status', )
+    date_hierarchy = 'checked'
+
+
 admin.site.register(models.Service, ServiceAdmin)
+admin.site.register(models.ServiceProbe, ServiceProbeAdmin)
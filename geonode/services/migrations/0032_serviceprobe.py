@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2020-12-04 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0031_service_probe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceProbe',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('status', models.IntegerField()),
+                ('latency', models.FloatField(blank=True, null=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='probes', to='services.Service')),
+            ],
+            options={
+                'ordering': ('-checked',),
+            },
+        ),
+    ]
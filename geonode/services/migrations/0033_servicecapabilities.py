@@ -0,0 +1,25 @@
+# Generated by Django 2.2.16 on 2020-12-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0032_serviceprobe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceCapabilities',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=32, unique=True)),
+                ('url', models.TextField()),
+                ('content', models.BinaryField()),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=255, null=True)),
+                ('checked', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
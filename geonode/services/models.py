@@ -173,10 +173,11 @@ class Service(ResourceBase):
     def get_absolute_url(self):
         return '/services/%i' % self.id
 
-    def probe_service(self):
+    def probe_service(self, timeout=None):
         from geonode.utils import http_client
         try:
-            resp, content = http_client.request(self.service_url)
+            resp, content = http_client.request(self.service_url, stream=True, timeout=timeout)
+            resp.close()
             return resp.status_code
         except Exception:
             return 404
@@ -193,6 +194,43 @@ class ServiceProfileRole(models.Model):
         'function performed by the responsible party'))
 
 
+class ServiceProbe(models.Model):
+    """
+    Availability and latency of a remote service at a given time.
+    """
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        related_name='probes'
+    )
+    checked = models.DateTimeField(auto_now_add=True, db_index=True)
+    status = models.IntegerField()
+    # seconds
+    latency = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-checked',)
+
+    def __str__(self):
+        return "{0} {1}: {2}".format(self.service, self.checked, self.status)
+
+
+class ServiceCapabilities(models.Model):
+    """
+    Capabilities document of a remote service, shared by all the processes
+    harvesting it, with the headers needed to revalidate it.
+    """
+    url_hash = models.CharField(max_length=32, unique=True)
+    url = models.TextField()
+    content = models.BinaryField()
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=255, null=True, blank=True)
+    checked = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return "{0} {1}".format(self.url, self.checked)
+
+
 class HarvestJob(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     resource_id = models.CharField(max_length=255)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright (C) 2017 OSGeo
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+"""
+Concurrent probing of the registered remote services.
+
+The services are probed by a bounded pool of threads. Requests to the same
+host are spaced by at least SERVICES_PROBE_HOST_INTERVAL seconds so that a
+remote server hosting many services is not flooded. The results are written
+with a single UPDATE, which does not fire the ResourceBase save signals, and
+recorded in the ServiceProbe history.
+"""
+import time
+import logging
+import threading
+
+from datetime import timedelta
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.db.models import Case, IntegerField, Value, When
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+PROBE_WORKERS = getattr(settings, 'SERVICES_PROBE_WORKERS', 16)
+PROBE_TIMEOUT = getattr(settings, 'SERVICES_PROBE_TIMEOUT', 10)
+PROBE_HOST_INTERVAL = getattr(settings, 'SERVICES_PROBE_HOST_INTERVAL', 1.0)
+PROBE_HISTORY_DAYS = getattr(settings, 'SERVICES_PROBE_HISTORY_DAYS', 30)
+
+
+class HostRateLimiter(object):
+    """
+    Spaces the requests to a same host by at least ``interval`` seconds.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next = {}
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _probe(service, limiter, timeout):
+    try:
+        limiter.wait(service.service_url)
+        start = time.time()
+        status = service.probe_service(timeout=timeout)
+        return service, status, time.time() - start
+    finally:
+        # the http client might have looked up an access token
+        connection.close()
+
+
+def probe_services(services=None, workers=PROBE_WORKERS, timeout=PROBE_TIMEOUT,
+                   host_interval=PROBE_HOST_INTERVAL):
+    """
+    Probes the services concurrently and stores the results.
+
+    :return: Dict of the probe status by service id
+    :rtype: dict
+    """
+    if services is None:
+        services = models.Service.objects.only('id', 'base_url', 'proxy_base', 'probe')
+    services = list(services)
+    if not services:
+        return {}
+
+    limiter = HostRateLimiter(host_interval)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(services)))) as executor:
+        results = list(executor.map(lambda s: _probe(s, limiter, timeout), services))
+
+    changed = [(service.id, status) for service, status, _ in results if service.probe != status]
+    if changed:
+        models.Service.objects.filter(id__in=[_id for _id, _ in changed]).update(
+            probe=Case(
+                *[When(id=_id, then=Value(status)) for _id, status in changed],
+                output_field=IntegerField()))
+    models.ServiceProbe.objects.bulk_create([
+        models.ServiceProbe(
+            service_id=service.id,
+            status=status,
+            latency=latency if status < 400 else None)
+        for service, status, latency in results])
+    if PROBE_HISTORY_DAYS:
+        models.ServiceProbe.objects.filter(
+            checked__lt=timezone.now() - timedelta(days=PROBE_HISTORY_DAYS)).delete()
+    logger.debug("Probed {} services, {} changed".format(len(results), len(changed)))
+    return {service.id: status for service, status, _ in results}
@@ -20,11 +20,14 @@
 """Remote service handling base classes and helpers."""
 
 import logging
+import requests
 
+from hashlib import md5
 from urllib.parse import quote
 
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 from six.moves.urllib.parse import urlencode, urlparse, urljoin, parse_qs, urlunparse
 
 from geonode import geoserver
@@ -40,6 +43,9 @@ else:
 
 logger = logging.getLogger(__name__)
 
+# seconds a stored capabilities document is used without being revalidated
+CAPABILITIES_CACHE_TIMEOUT = getattr(settings, 'SERVICES_CAPABILITIES_CACHE_TIMEOUT', 300)
+
 
 def get_proxified_ows_url(url, version=None, proxy_base=None):
     """
@@ -86,6 +92,46 @@ def get_proxified_ows_url(url, version=None, proxy_base=None):
     return (version, proxified_url, base_ows_url)
 
 
+def get_capabilities(url, timeout=30):
+    """Return the capabilities document found at ``url``.
+
+    The document is stored in the database, shared by all the processes
+    harvesting the same service, along with its ETag and Last-Modified
+    headers. Once older than SERVICES_CAPABILITIES_CACHE_TIMEOUT seconds it
+    is revalidated with a conditional request, so that an unchanged document
+    is not downloaded again.
+    """
+    url_hash = md5(url.encode('utf-8')).hexdigest()
+    entry = models.ServiceCapabilities.objects.filter(url_hash=url_hash).first()
+    now = timezone.now()
+    if entry and (now - entry.checked).total_seconds() < CAPABILITIES_CACHE_TIMEOUT:
+        return bytes(entry.content)
+
+    headers = {}
+    if entry and entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry and entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+    response = requests.get(url, headers=headers, timeout=timeout)
+    if entry and response.status_code == 304:
+        logger.debug("Capabilities document {} not modified".format(url))
+        entry.checked = now
+        entry.save(update_fields=['checked'])
+        return bytes(entry.content)
+
+    response.raise_for_status()
+    models.ServiceCapabilities.objects.update_or_create(
+        url_hash=url_hash,
+        defaults={
+            'url': url,
+            'content': response.content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked': now,
+        })
+    return response.content
+
+
 def get_geoserver_cascading_workspace(create=True):
     """Return the geoserver workspace used for cascaded services
     The workspace can be created it if needed.
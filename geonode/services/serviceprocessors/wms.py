@@ -61,6 +61,20 @@ from . import base
 logger = logging.getLogger(__name__)
 
 
+def _get_capabilities_url(url, version):
+    parsed_url = urlparse(url)
+    get_args = parse_qsl(parsed_url.query)
+    get_args.extend([
+        ('service', 'WMS'),
+        ('request', 'GetCapabilities'),
+        ('version', version)
+    ])
+    return ParseResult(
+        parsed_url.scheme, parsed_url.netloc, parsed_url.path,
+        parsed_url.params, urlencode(get_args), parsed_url.fragment
+    ).geturl()
+
+
 def WebMapService(url,
                   version='1.3.0',
                   xml=None,
@@ -90,6 +104,9 @@ def WebMapService(url,
     if not proxy_base:
         clean_url = clean_ows_url(url)
         base_ows_url = clean_url
+        if xml is None and version in ['1.1.1', '1.3.0']:
+            xml = base.get_capabilities(
+                _get_capabilities_url(clean_url, version), timeout=timeout)
     else:
         (clean_version, proxified_url, base_ows_url) = base.get_proxified_ows_url(
             url, version=version, proxy_base=proxy_base)
@@ -153,14 +170,28 @@ class WmsServiceHandler(base.ServiceHandlerBase,
 
     @property
     def parsed_service(self):
-        cleaned_url, service, version, request = WmsServiceHandler.get_cleaned_url_params(self.url)
-        ogc_server_settings = settings.OGC_SERVER['default']
-        _url, _parsed_service = WebMapService(
-            cleaned_url,
-            version=version,
-            proxy_base=None,
-            timeout=ogc_server_settings.get('TIMEOUT', 60))
-        return _parsed_service
+        """The parsed capabilities of the service.
+
+        The capabilities document is parsed once per handler and fetched
+        through the capabilities cache, so that all the handlers of a service
+        share the same download.
+        """
+        if getattr(self, '_parsed_service', None) is None:
+            cleaned_url, service, version, request = WmsServiceHandler.get_cleaned_url_params(self.url)
+            ogc_server_settings = settings.OGC_SERVER['default']
+            _url, self._parsed_service = WebMapService(
+                cleaned_url,
+                version=version,
+                proxy_base=None,
+                timeout=ogc_server_settings.get('TIMEOUT', 60))
+        return self._parsed_service
+
+    def __getstate__(self):
+        # the handler is stored in the session, the parsed capabilities
+        # are rebuilt from the capabilities cache when needed
+        state = self.__dict__.copy()
+        state['_parsed_service'] = None
+        return state
 
     def create_cascaded_store(self):
         store = self._get_store(create=True)
@@ -449,8 +480,8 @@ class WmsServiceHandler(base.ServiceHandlerBase,
 
     def _offers_geonode_projection(self):
         geonode_projection = getattr(settings, "DEFAULT_MAP_CRS", "EPSG:3857")
-        if len(list(self.get_resources())) > 0:
-            first_layer = list(self.get_resources())[0]
+        first_layer = next(self.get_resources(), None)
+        if first_layer is not None:
             return geonode_projection in first_layer.crsOptions
         else:
             return geonode_projection
@@ -25,6 +25,7 @@ from django.db import IntegrityError, transaction
 
 from . import models
 from . import enumerations
+from . import probing
 from .serviceprocessors import get_service_handler
 
 from geonode.celery_app import app
@@ -50,16 +51,59 @@ logger = logging.getLogger(__name__)
     })
 def harvest_resource(self, harvest_job_id):
     harvest_job = models.HarvestJob.objects.get(pk=harvest_job_id)
+    _harvest_job(harvest_job)
+
+
+@app.task(
+    bind=True,
+    name='geonode.services.tasks.harvest_resources',
+    queue='update',
+    countdown=60,
+    # expires=120,
+    acks_late=True,
+    retry=True,
+    retry_policy={
+        'max_retries': 10,
+        'interval_start': 0,
+        'interval_step': 0.2,
+        'interval_max': 0.2,
+    })
+def harvest_resources(self, harvest_job_ids):
+    """Harvest a batch of resources.
+
+    The service handlers, and with them the parsed capabilities documents,
+    are shared by all the jobs of the batch.
+    """
+    handlers = {}
+    harvest_jobs = models.HarvestJob.objects.filter(
+        pk__in=harvest_job_ids).select_related('service')
+    for harvest_job in harvest_jobs:
+        try:
+            _harvest_job(harvest_job, handlers=handlers)
+        except IntegrityError:
+            # do not leave the rest of the batch unprocessed
+            logger.exception(msg="An error has occurred while harvesting "
+                                 "resource {!r}".format(harvest_job.resource_id))
+
+
+def _get_handler(service, handlers):
+    if service.id not in handlers:
+        handlers[service.id] = get_service_handler(
+            base_url=service.base_url,
+            proxy_base=service.proxy_base,
+            service_type=service.type
+        )
+    return handlers[service.id]
+
+
+def _harvest_job(harvest_job, handlers=None):
     harvest_job.update_status(
         status=enumerations.IN_PROCESS, details="Harvesting resource...")
     result = False
     details = ""
     try:
-        handler = get_service_handler(
-            base_url=harvest_job.service.base_url,
-            proxy_base=harvest_job.service.proxy_base,
-            service_type=harvest_job.service.type
-        )
+        handler = _get_handler(
+            harvest_job.service, handlers if handlers is not None else {})
         with transaction.atomic():
             logger.debug("harvesting resource...")
             handler.harvest_resource(
@@ -111,9 +155,7 @@ def probe_services(self):
     lock_id = f'{name.decode()}-lock-{hexdigest}'
     lock = memcache_lock(lock_id)
     if lock.acquire(blocking=False) is True:
-        for service in models.Service.objects.all():
-            try:
-                service.probe = service.probe_service()
-                service.save()
-            except Exception as e:
-                logger.error(e)
+        try:
+            probing.probe_services()
+        except Exception as e:
+            logger.error(e)
@@ -18,6 +18,11 @@
 #
 #########################################################################
 
+import time
+
+from datetime import timedelta
+
+from django.utils import timezone
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from django.test import Client
 from selenium import webdriver
@@ -35,8 +40,8 @@ from owslib.map.wms111 import ContentMetadata
 
 from geonode.services.utils import test_resource_table_status
 from geonode.tests.base import GeoNodeBaseTestSupport
-from . import enumerations, forms
-from .models import Service
+from . import enumerations, forms, probing
+from .models import Service, ServiceProbe
 from .serviceprocessors import (base,
                                 handler,
                                 wms,
@@ -100,6 +105,39 @@ class ModuleFunctionsTestCase(StandardTestCase):
             "http://www.geonode.org/{}".format(mock_settings.CASCADE_WORKSPACE)
         )
 
+    @mock.patch("geonode.services.serviceprocessors.base.models.ServiceCapabilities")
+    @mock.patch("geonode.services.serviceprocessors.base.requests")
+    def test_get_capabilities_revalidates_stored_document(self, mock_requests, mock_capabilities):
+        phony_url = "http://fake?service=WMS&request=GetCapabilities"
+        entry = mock_capabilities.objects.filter.return_value.first.return_value
+        entry.content = b'<WMS_Capabilities/>'
+        entry.etag = '"v1"'
+        entry.last_modified = None
+        entry.checked = timezone.now() - timedelta(days=1)
+        mock_requests.get.return_value.status_code = 304
+        content = base.get_capabilities(phony_url)
+        self.assertEqual(content, b'<WMS_Capabilities/>')
+        mock_requests.get.assert_called_once_with(
+            phony_url, headers={'If-None-Match': '"v1"'}, timeout=30)
+        entry.save.assert_called_once_with(update_fields=['checked'])
+
+        # a fresh entry is used without any request
+        mock_requests.get.reset_mock()
+        content = base.get_capabilities(phony_url)
+        self.assertEqual(content, b'<WMS_Capabilities/>')
+        mock_requests.get.assert_not_called()
+
+        # a changed document is stored with its new headers
+        entry.checked = timezone.now() - timedelta(days=1)
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.get.return_value.content = b'<WMS_Capabilities version="1.3.0"/>'
+        mock_requests.get.return_value.headers = {'ETag': '"v2"'}
+        content = base.get_capabilities(phony_url)
+        self.assertEqual(content, b'<WMS_Capabilities version="1.3.0"/>')
+        defaults = mock_capabilities.objects.update_or_create.call_args[1]['defaults']
+        self.assertEqual(defaults['etag'], '"v2"')
+        self.assertEqual(defaults['content'], b'<WMS_Capabilities version="1.3.0"/>')
+
     @mock.patch("geonode.services.serviceprocessors.handler.WmsServiceHandler",
                 autospec=True)
     def test_get_service_handler_wms(self, mock_wms_handler):
@@ -483,6 +521,16 @@ class WmsServiceHandlerTestCase(GeoNodeBaseTestSupport):
         self.assertEqual(result.name, handler.name)
         self.assertEqual(result.title, self.phony_title)
 
+    @mock.patch("geonode.services.serviceprocessors.wms.WebMapService",
+                autospec=True)
+    def test_parsed_service_is_memoized(self, mock_wms):
+        mock_wms.return_value = (self.phony_url, self.parsed_wms)
+        handler = wms.WmsServiceHandler(self.phony_url)
+        handler.create_geonode_service(self.test_user)
+        list(handler.get_resources())
+        self.assertEqual(mock_wms.call_count, 1)
+        self.assertIsNone(handler.__getstate__()['_parsed_service'])
+
     @mock.patch("geonode.services.serviceprocessors.wms.WebMapService",
                 autospec=True)
     def test_get_keywords(self, mock_wms):
@@ -628,6 +676,48 @@ class WmsServiceHandlerTestCase(GeoNodeBaseTestSupport):
         self.assertEqual(Service.objects.count(), 1)
 
 
+class ServiceProbingTestCase(GeoNodeBaseTestSupport):
+
+    def setUp(self):
+        super(ServiceProbingTestCase, self).setUp()
+        owner = get_user_model().objects.get(username="admin")
+        self.services = [
+            Service.objects.create(
+                base_url="http://fake-{}.org/wms".format(i),
+                type=enumerations.WMS,
+                method=enumerations.INDEXED,
+                name="fake-{}".format(i),
+                title="fake-{}".format(i),
+                owner=owner)
+            for i in range(3)
+        ]
+
+    def test_host_rate_limiter(self):
+        limiter = probing.HostRateLimiter(0.2)
+        start = time.time()
+        limiter.wait("http://fake-0.org/wms")
+        limiter.wait("http://fake-1.org/wms")
+        self.assertLess(time.time() - start, 0.2)
+        limiter.wait("http://fake-0.org/wms?request=GetCapabilities")
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+    @mock.patch("geonode.services.models.Service.probe_service",
+                autospec=True)
+    def test_probe_services(self, mock_probe_service):
+        mock_probe_service.side_effect = lambda service, timeout=None: (
+            404 if service.name == "fake-0" else 200)
+        with mock.patch("geonode.services.models.Service.save") as mock_save:
+            results = probing.probe_services(host_interval=0)
+        mock_save.assert_not_called()
+        self.assertEqual(results[self.services[0].id], 404)
+        self.assertEqual(results[self.services[1].id], 200)
+        self.assertEqual(Service.objects.get(id=self.services[0].id).probe, 404)
+        self.assertEqual(Service.objects.get(id=self.services[1].id).probe, 200)
+        self.assertEqual(ServiceProbe.objects.count(), 3)
+        self.assertIsNone(ServiceProbe.objects.get(service=self.services[0]).latency)
+        self.assertIsNotNone(ServiceProbe.objects.get(service=self.services[1]).latency)
+
+
 class WmsServiceHarvestingTestCase(StaticLiveServerTestCase):
     selenium = None
 
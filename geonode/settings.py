@@ -23,6 +23,7 @@ import os
 import re
 import ast
 import sys
+import tempfile
 import subprocess
 from datetime import timedelta
 from distutils.util import strtobool  # noqa
@@ -956,6 +957,14 @@ OGC_SERVER = {
 
 USE_GEOSERVER = 'geonode.geoserver' in INSTALLED_APPS and OGC_SERVER['default']['BACKEND'] == 'geonode.geoserver'
 
+# Layer ACLs served to the GeoServer auth callbacks: seconds the computed ACLs are
+# cached for, seconds the verified basic auth credentials are trusted for,
+# size and lifetime of the in-process LRU in front of the Django cache
+LAYER_ACLS_CACHE_TIMEOUT = int(os.getenv('LAYER_ACLS_CACHE_TIMEOUT', '600'))
+LAYER_ACLS_CREDENTIALS_TIMEOUT = int(os.getenv('LAYER_ACLS_CREDENTIALS_TIMEOUT', '60'))
+LAYER_ACLS_LOCAL_CACHE_SIZE = int(os.getenv('LAYER_ACLS_LOCAL_CACHE_SIZE', '1000'))
+LAYER_ACLS_LOCAL_CACHE_TIMEOUT = int(os.getenv('LAYER_ACLS_LOCAL_CACHE_TIMEOUT', '10'))
+
 # Uploader Settings
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 100000
 """
@@ -1183,15 +1192,33 @@ except ValueError:
 # The proxy to use when making cross origin requests.
 PROXY_URL = os.environ.get('PROXY_URL', '/proxy/?url=')
 
+# Proxied responses bigger than this (in bytes), or of unknown size, are
+# streamed to the client instead of being read in memory.
+PROXY_STREAMING_MIN_SIZE = int(os.getenv('PROXY_STREAMING_MIN_SIZE', 1024 * 1024))
+
+# Keep the ZIP archives of the downloaded layers, per user, until the layer gets updated.
+# The directory must not be served publicly: keep it out of MEDIA_ROOT and STATIC_ROOT
+DOWNLOAD_ARCHIVES_CACHE = ast.literal_eval(os.getenv('DOWNLOAD_ARCHIVES_CACHE', 'False'))
+DOWNLOAD_ARCHIVES_CACHE_DIR = os.getenv(
+    'DOWNLOAD_ARCHIVES_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'geonode_download_cache'))
+
 # Haystack Search Backend Configuration. To enable,
 # first install the following:
 # - pip install django-haystack
 # - pip install pyelasticsearch
 # Set HAYSTACK_SEARCH to True
-# Run "python manage.py rebuild_index"
+# Run "python manage.py rebuild_index", or "python manage.py rebuild_search_index"
+# to index the resources with parallel workers
 HAYSTACK_SEARCH = ast.literal_eval(os.getenv('HAYSTACK_SEARCH', 'False'))
+# Filter the search results on the permission fields of the search documents instead of
+# passing the ids of all the visible resources. The documents indexed before those fields
+# were added do not have them: run "python manage.py rebuild_search_index" before enabling it,
+# otherwise anonymous and regular users get no results
+HAYSTACK_PERMS_FIELDS = ast.literal_eval(os.getenv('HAYSTACK_PERMS_FIELDS', 'False'))
 # Avoid permissions prefiltering
 SKIP_PERMS_FILTER = ast.literal_eval(os.getenv('SKIP_PERMS_FILTER', 'False'))
+# Seconds the facet counts are cached for each user (invalidated on resources and permissions changes)
+FACETS_CACHE_TIMEOUT = int(os.getenv('FACETS_CACHE_TIMEOUT', '60'))
 # Update facet counts from Haystack
 HAYSTACK_FACET_COUNTS = ast.literal_eval(os.getenv('HAYSTACK_FACET_COUNTS', 'True'))
 if HAYSTACK_SEARCH:
@@ -1204,7 +1231,13 @@ if HAYSTACK_SEARCH:
             'INDEX_NAME': os.getenv('HAYSTACK_ENGINE_INDEX_NAME', 'haystack'),
         },
     }
-    HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+    # the search documents are updated in batches by the flush_search_index_queue task
+    HAYSTACK_SIGNAL_PROCESSOR = 'geonode.base.search.QueuedSignalProcessor'
+    # Seconds between two flushes of the queued search index updates
+    HAYSTACK_QUEUE_FLUSH_INTERVAL = float(os.getenv('HAYSTACK_QUEUE_FLUSH_INTERVAL', '10'))
+    # Seconds after which a flush is considered dead and the next one may run
+    HAYSTACK_QUEUE_FLUSH_TIMEOUT = int(os.getenv('HAYSTACK_QUEUE_FLUSH_TIMEOUT', '600'))
+    HAYSTACK_BATCH_SIZE = int(os.getenv('HAYSTACK_BATCH_SIZE', '1000'))
     HAYSTACK_SEARCH_RESULTS_PER_PAGE = int(os.getenv('HAYSTACK_SEARCH_RESULTS_PER_PAGE', '200'))
 
 # Available download formats
@@ -1655,6 +1688,10 @@ RABBITMQ_SIGNALS_BROKER_URL = 'amqp://localhost:5672'
 # REDIS_SIGNALS_BROKER_URL = 'redis://localhost:6379/0'
 LOCAL_SIGNALS_BROKER_URL = 'memory://'
 
+# Seconds during which the GeoServer catalog and data events are collected
+# by the messaging consumer before synchronizing the layers they concern
+GEOSERVER_EVENTS_COALESCE_INTERVAL = int(os.getenv('GEOSERVER_EVENTS_COALESCE_INTERVAL', 10))
+
 if ASYNC_SIGNALS:
     _BROKER_URL = RABBITMQ_SIGNALS_BROKER_URL
     CELERY_RESULT_BACKEND = 'rpc://'
@@ -1739,6 +1776,12 @@ if USE_GEOSERVER:
 #     },
 CELERY_BEAT_SCHEDULE = {}
 
+if HAYSTACK_SEARCH:
+    CELERY_BEAT_SCHEDULE['flush_search_index_queue'] = {
+        'task': 'geonode.tasks.search.flush_search_index_queue',
+        'schedule': HAYSTACK_QUEUE_FLUSH_INTERVAL,
+    }
+
 if 'geonode.services' in INSTALLED_APPS:
     CELERY_BEAT_SCHEDULE['probe_services'] = {
         'task': 'geonode.services.tasks.probe_services',
@@ -1963,6 +2006,20 @@ THUMBNAIL_GENERATOR = "geonode.layers.utils.create_gs_thumbnail_geonode"
 #THUMBNAIL_GENERATOR_DEFAULT_BG = r"http://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
 THUMBNAIL_GENERATOR_DEFAULT_BG = r"https://maps.wikimedia.org/osm-intl/{z}/{x}/{y}.png"
 THUMBNAIL_GENERATOR_DEFAULT_SIZE = {'width': 240, 'height': 200}
+# Max number of map tiles downloaded concurrently while rendering the thumbnails
+THUMBNAIL_GENERATOR_WORKERS = int(os.getenv('THUMBNAIL_GENERATOR_WORKERS', 8))
+
+# Remote services: seconds a stored GetCapabilities document is used without
+# being revalidated, and number of resources harvested by each task
+SERVICES_CAPABILITIES_CACHE_TIMEOUT = int(os.getenv('SERVICES_CAPABILITIES_CACHE_TIMEOUT', 300))
+SERVICES_HARVEST_BATCH_SIZE = int(os.getenv('SERVICES_HARVEST_BATCH_SIZE', 50))
+
+# Remote services probing: concurrent probes, seconds between two probes of
+# a same host, probe timeout and days of probe history to keep
+SERVICES_PROBE_WORKERS = int(os.getenv('SERVICES_PROBE_WORKERS', 16))
+SERVICES_PROBE_HOST_INTERVAL = float(os.getenv('SERVICES_PROBE_HOST_INTERVAL', 1.0))
+SERVICES_PROBE_TIMEOUT = int(os.getenv('SERVICES_PROBE_TIMEOUT', 10))
+SERVICES_PROBE_HISTORY_DAYS = int(os.getenv('SERVICES_PROBE_HISTORY_DAYS', 30))
 
 # define the urls after the settings are overridden
 if USE_GEOSERVER:
@@ -1999,6 +2056,19 @@ MONITORING_SERVICE_NAME = os.getenv("MONITORING_SERVICE_NAME", 'geonode')
 # how long monitoring data should be stored
 MONITORING_DATA_TTL = timedelta(days=int(os.getenv("MONITORING_DATA_TTL", 365)))
 
+# write the requests events from a background thread, in batches, instead of
+# doing it synchronously at the end of each request
+MONITORING_ASYNC_WRITES = ast.literal_eval(os.getenv('MONITORING_ASYNC_WRITES', 'False' if TEST else 'True'))
+# max number of events waiting to be written, and how many are written at once
+MONITORING_QUEUE_SIZE = int(os.getenv('MONITORING_QUEUE_SIZE', 10000))
+MONITORING_BATCH_SIZE = int(os.getenv('MONITORING_BATCH_SIZE', 200))
+# max seconds an event waits in the queue before being written
+MONITORING_FLUSH_INTERVAL = float(os.getenv('MONITORING_FLUSH_INTERVAL', 2))
+# under overload either 'drop' the events exceeding the queue size or
+# 'sample' one every MONITORING_OVERLOAD_SAMPLE_RATE events when the queue is 80% full
+MONITORING_OVERLOAD_POLICY = os.getenv('MONITORING_OVERLOAD_POLICY', 'drop')
+MONITORING_OVERLOAD_SAMPLE_RATE = int(os.getenv('MONITORING_OVERLOAD_SAMPLE_RATE', 10))
+
 # this will disable csrf check for notification config views,
 # use with caution - for dev purpose only
 MONITORING_DISABLE_CSRF = ast.literal_eval(os.environ.get('MONITORING_DISABLE_CSRF', 'False'))
@@ -2031,6 +2101,14 @@ if MONITORING_ENABLED:
         (timedelta(days=14), timedelta(days=1),),
     )
 
+    # sizes of the pre-aggregated metric buckets, refreshed as metrics are
+    # collected; charts are read from the coarsest bucket fitting their interval
+    MONITORING_METRIC_BUCKETS = (
+        timedelta(minutes=1),
+        timedelta(hours=1),
+        timedelta(days=1),
+    )
+
     CELERY_BEAT_SCHEDULE['collect_metrics'] = {
         'task': 'geonode.monitoring.tasks.collect_metrics',
         'schedule': 300.0,
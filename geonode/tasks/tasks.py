@@ -72,9 +72,12 @@ except Exception:
 logger = get_task_logger(__name__)
 
 
-def memcache_lock(lock_id):
+def memcache_lock(lock_id, expire=None):
     logger.info(f"Using '{lock_type}' lock type.")
-    lock = Lock(lock_id, client=memcache_client)
+    if expire:
+        lock = Lock(lock_id, client=memcache_client, expire=expire)
+    else:
+        lock = Lock(lock_id, client=memcache_client)
     return lock
 
 
@@ -144,3 +147,30 @@ def set_permissions(self, permissions_names, resources_names,
             set_layers_permissions(
                 permissions_name, resources_names, users_usernames, groups_names, delete_flag
             )
+
+
+@app.task(bind=True,
+          name='geonode.tasks.search.flush_search_index_queue',
+          queue='update',
+          ignore_result=True)
+def flush_search_index_queue(self):
+    """
+    Applies the queued updates of the search index.
+    A single flush runs at a time, the next ones skip while it is running.
+    """
+    from hashlib import md5
+    from geonode.base import search
+
+    # The cache key consists of the task name and the MD5 digest
+    # of the name.
+    name = b'flush_search_index_queue'
+    hexdigest = md5(name).hexdigest()
+    lock_id = f'{name.decode()}-lock-{hexdigest}'
+    lock = memcache_lock(lock_id, expire=getattr(settings, 'HAYSTACK_QUEUE_FLUSH_TIMEOUT', 600))
+    if lock.acquire(blocking=False) is True:
+        try:
+            search.flush_search_index_queue()
+        except Exception as e:
+            logger.error(e)
+        finally:
+            lock.release()
@@ -1,3 +1,4 @@
+import io
 import os
 import shutil
 import zipfile
@@ -7,9 +8,11 @@ from osgeo import ogr
 from datetime import datetime, timedelta
 from unittest.mock import patch
 
+from django.test import RequestFactory, override_settings
+
 from geonode.br.management.commands.utils.utils import ignore_time
 from geonode.tests.base import GeoNodeBaseTestSupport
-from geonode.utils import copy_tree, fixup_shp_columnnames, unzip_file
+from geonode.utils import copy_tree, fixup_shp_columnnames, unzip_file, zip_stream, HttpClient
 
 
 class TestCopyTree(GeoNodeBaseTestSupport):
@@ -109,3 +112,73 @@ class TestFixupShp(GeoNodeBaseTestSupport):
         shp_parent = os.path.dirname(layer_shp)
         if shp_parent.startswith(tempfile.gettempdir()):
             shutil.rmtree(shp_parent)
+
+
+class TestHttpClient(GeoNodeBaseTestSupport):
+
+    def test_sessions_are_shared_per_host(self):
+        client = HttpClient()
+        session = client.get_session('http://localhost:8080/geoserver/rest')
+        self.assertIs(session, HttpClient().get_session('http://localhost:8080/geoserver/ows'))
+        self.assertIsNot(session, client.get_session('https://localhost:8080/geoserver/rest'))
+        self.assertIsNot(session, client.get_session('http://localhost:8080/geoserver/rest', retries=1))
+
+    def test_sessions_are_reset_after_fork(self):
+        client = HttpClient()
+        session = client.get_session('http://localhost:8080/geoserver/rest')
+        with patch('os.getpid', return_value=-1):
+            self.assertIsNot(session, client.get_session('http://localhost:8080/geoserver/rest'))
+
+    def test_request_headers_are_not_shared(self):
+        client = HttpClient()
+        with patch.object(HttpClient, 'get_token', return_value='secret'), \
+                patch('requests.Session.get') as session_get:
+            client.get('http://localhost:8080/geoserver/rest', user='admin')
+            client.get('http://localhost:8080/geoserver/rest')
+        # the default headers dict must not keep the token of the previous call
+        self.assertNotIn('secret', str(session_get.call_args_list[-1][1]['headers']))
+        self.assertGreaterEqual(client.get_stats()['requests'], 2)
+
+
+class TestZipStream(GeoNodeBaseTestSupport):
+
+    def test_zip_stream(self):
+        entries = [
+            ('a.txt', 'text'),
+            ('b/c.bin', io.BytesIO(b'x' * 200000)),
+            ('.metadata/d', (chunk for chunk in (b'1', b'2'))),
+        ]
+        chunks = list(zip_stream(entries, chunk_size=1024))
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as z:
+            self.assertEqual(z.namelist(), ['a.txt', 'b/c.bin', '.metadata/d'])
+            self.assertEqual(z.read('a.txt'), b'text')
+            self.assertEqual(len(z.read('b/c.bin')), 200000)
+            self.assertEqual(z.read('.metadata/d'), b'12')
+            self.assertIsNone(z.testzip())
+
+
+class TestVersionAndContextCaching(GeoNodeBaseTestSupport):
+
+    def test_git_changeset_is_memoized(self):
+        from geonode import version
+        version.get_git_changeset.cache_clear()
+        with patch('subprocess.Popen') as popen:
+            popen.return_value.communicate.return_value = ('1600000000\n', '')
+            version.get_git_changeset()
+            version.get_git_changeset()
+        self.assertEqual(popen.call_count, 1)
+        version.get_git_changeset.cache_clear()
+
+    def test_context_processors_are_cached_per_request(self):
+        from geonode.context_processors import resource_urls
+        request = RequestFactory().get('/')
+        with patch('geonode.context_processors.Site.objects.get_current') as get_current:
+            context = resource_urls(request)
+            self.assertIs(resource_urls(request), context)
+            self.assertEqual(get_current.call_count, 1)
+            resource_urls(RequestFactory().get('/'))
+            self.assertEqual(get_current.call_count, 2)
+        # the values read from the settings follow their changes
+        with override_settings(SHOW_PROFILE_EMAIL=True):
+            self.assertTrue(resource_urls(RequestFactory().get('/'))['SHOW_PROFILE_EMAIL'])
@@ -1,9 +1,12 @@
 
 from django.core.cache import cache
 
+from geonode.decorators import request_cached
+
 from .models import GeoNodeThemeCustomization, THEME_CACHE_KEY
 
 
+@request_cached
 def custom_theme(request):
     theme = cache.get(THEME_CACHE_KEY)
     if theme is None:
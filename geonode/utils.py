@@ -34,6 +34,7 @@ import tarfile
 import datetime
 import requests
 import tempfile
+import threading
 import traceback
 import subprocess
 
@@ -42,12 +43,14 @@ from io import StringIO
 from decimal import Decimal
 from slugify import slugify
 from contextlib import closing
-from collections import defaultdict
+from http.cookiejar import DefaultCookiePolicy
+from collections import defaultdict, OrderedDict
 from math import atan, exp, log, pi, sin, tan, floor
 from zipfile import ZipFile, is_zipfile, ZIP_DEFLATED
 from requests.packages.urllib3.util.retry import Retry
 
 from django.conf import settings
+from django.utils import timezone
 from django.core.cache import cache
 from django.db.models import signals
 from django.utils.http import is_safe_url
@@ -1290,6 +1293,42 @@ class DisableDjangoSignals:
         del self.stashed_signals[signal]
 
 
+class LRUCache(object):
+    """
+    A thread-safe, size bounded, in-process cache whose entries expire
+    after ``timeout`` seconds.
+    """
+
+    def __init__(self, max_entries=1000, timeout=10):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
 def run_subprocess(*cmd, **kwargs):
     p = subprocess.Popen(
         ' '.join(cmd),
@@ -1401,6 +1440,27 @@ def check_ogc_backend(backend_package):
 
 
 class HttpClient(object):
+    """
+    HTTP client used to talk to GeoServer and the remote services.
+
+    Sessions are shared process-wide, one for each scheme/host (and retries
+    policy), so that connections are kept alive and reused across calls.
+    The registry is reset when the process is forked. Cookies are never
+    stored by the shared sessions, as they are used on behalf of different
+    users.
+
+    The bearer tokens of the users are cached until their expiration (or
+    at most ``TOKEN_CACHE_TIMEOUT`` seconds) and dropped as soon as the
+    remote server rejects them.
+    """
+
+    TOKEN_CACHE_TIMEOUT = 300
+
+    _lock = threading.Lock()
+    _pid = None
+    _sessions = {}
+    _tokens = {}
+    _stats = {'requests': 0, 'errors': 0, 'elapsed': 0.0}
 
     def __init__(self):
         self.timeout = 30
@@ -1423,18 +1483,107 @@ class HttpClient(object):
             self.username = ogc_server_settings['USER'] if 'USER' in ogc_server_settings else 'admin'
             self.password = ogc_server_settings['PASSWORD'] if 'PASSWORD' in ogc_server_settings else 'geoserver'
 
+    def _check_pid(self):
+        # Connections must not be shared with the parent of a forked process
+        if HttpClient._pid != os.getpid():
+            HttpClient._pid = os.getpid()
+            HttpClient._sessions = {}
+            HttpClient._tokens = {}
+
+    def get_session(self, url, retries=None):
+        """
+        Returns the shared session for the scheme/host of ``url``.
+        """
+        _url = urlsplit(url)
+        _retries = retries or self.retries
+        key = (_url.scheme, _url.netloc, _retries)
+        with HttpClient._lock:
+            self._check_pid()
+            session = HttpClient._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                retry = Retry(
+                    total=_retries,
+                    read=_retries,
+                    connect=_retries,
+                    backoff_factor=self.backoff_factor,
+                    status_forcelist=self.status_forcelist,
+                )
+                adapter = requests.adapters.HTTPAdapter(
+                    max_retries=retry,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_connections=self.pool_connections
+                )
+                session.mount("{scheme}://".format(scheme=_url.scheme), adapter)
+                session.verify = False
+                HttpClient._sessions[key] = session
+        return session
+
+    def get_token(self, user):
+        """
+        Returns the bearer token of ``user`` (a username or a user instance),
+        from the cache when still valid.
+        """
+        username = user if isinstance(user, six.string_types) else user.get_username()
+        with HttpClient._lock:
+            self._check_pid()
+            cached = HttpClient._tokens.get(username)
+        if cached and cached[1] > timezone.now():
+            return cached[0]
+
+        if isinstance(user, six.string_types):
+            user = get_user_model().objects.get(username=user)
+        access_token = get_or_create_token(user)
+        if access_token and not access_token.is_expired():
+            expires = min(
+                access_token.expires,
+                timezone.now() + datetime.timedelta(seconds=self.TOKEN_CACHE_TIMEOUT))
+            with HttpClient._lock:
+                HttpClient._tokens[username] = (access_token.token, expires)
+            return access_token.token
+        return None
+
+    def evict_token(self, user):
+        username = user if isinstance(user, six.string_types) else user.get_username()
+        with HttpClient._lock:
+            HttpClient._tokens.pop(username, None)
+
+    def get_stats(self):
+        """
+        Returns the number of requests, errors and the mean latency
+        together with the connections opened by the shared sessions.
+        """
+        with HttpClient._lock:
+            stats = dict(HttpClient._stats)
+            sessions = list(HttpClient._sessions.values())
+        connections = 0
+        pooled_requests = 0
+        for session in sessions:
+            for adapter in session.adapters.values():
+                for pool_key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(pool_key)
+                    if pool:
+                        connections += pool.num_connections
+                        pooled_requests += pool.num_requests
+        stats['connections'] = connections
+        stats['reused_connections'] = max(0, pooled_requests - connections)
+        stats['mean_latency'] = stats['elapsed'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
     def request(self, url, method='GET', data=None, headers={}, stream=False, timeout=None, retries=None, user=None):
+        headers = dict(headers or {})
+        token_user = None
         if (user or self.username != 'admin') and \
         check_ogc_backend(geoserver.BACKEND_PACKAGE) and 'Authorization' not in headers:
-            if connection.cursor().db.vendor not in ('sqlite', 'sqlite3', 'spatialite'):
+            if connection.vendor not in ('sqlite', 'sqlite3', 'spatialite'):
                 try:
-                    if user and isinstance(user, six.string_types):
-                        user = get_user_model().objects.get(username=user)
-                    _u = user or get_user_model().objects.get(username=self.username)
-                    access_token = get_or_create_token(_u)
-                    if access_token and not access_token.is_expired():
-                        headers['Authorization'] = 'Bearer %s' % access_token.token
+                    token_user = user or self.username
+                    access_token = self.get_token(token_user)
+                    if access_token:
+                        headers['Authorization'] = 'Bearer %s' % access_token
                 except Exception:
+                    token_user = None
                     tb = traceback.format_exc()
                     logger.debug(tb)
             elif user == self.username:
@@ -1444,31 +1593,31 @@ class HttpClient(object):
 
         response = None
         content = None
-        session = requests.Session()
-        retry = Retry(
-            total=retries or self.retries,
-            read=retries or self.retries,
-            connect=retries or self.retries,
-            backoff_factor=self.backoff_factor,
-            status_forcelist=self.status_forcelist,
-        )
-        adapter = requests.adapters.HTTPAdapter(
-            max_retries=retry,
-            pool_maxsize=self.pool_maxsize,
-            pool_connections=self.pool_connections
-        )
-        session.mount("{scheme}://".format(scheme=urlsplit(url).scheme), adapter)
-        session.verify = False
-        action = getattr(session, method.lower(), None)
-        if action:
-            response = action(
-                url=url,
-                data=data,
-                headers=headers,
-                timeout=timeout or self.timeout,
-                stream=stream)
-        else:
-            response = session.get(url, headers=headers, timeout=self.timeout)
+        session = self.get_session(url, retries=retries)
+        start = time.time()
+        try:
+            action = getattr(session, method.lower(), None)
+            if action:
+                response = action(
+                    url=url,
+                    data=data,
+                    headers=headers,
+                    timeout=timeout or self.timeout,
+                    stream=stream)
+            else:
+                response = session.get(url, headers=headers, timeout=self.timeout)
+        except Exception:
+            with HttpClient._lock:
+                HttpClient._stats['errors'] += 1
+            raise
+        finally:
+            with HttpClient._lock:
+                HttpClient._stats['requests'] += 1
+                HttpClient._stats['elapsed'] += time.time() - start
+
+        if token_user and response.status_code == 401:
+            # The cached token has been revoked in the meantime
+            self.evict_token(token_user)
 
         try:
             content = ensure_string(response.content) if not stream else response.raw
@@ -1519,6 +1668,65 @@ def zip_dir(basedir, archivename):
                 z.write(absfn, zfn)
 
 
+class _ZipStreamBuffer(object):
+    """
+    Write-only, unseekable file object collecting the bytes written by
+    ZipFile until they are popped out by ``zip_stream``.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_stream(entries, chunk_size=64 * 1024):
+    """
+    Generator of the bytes of a ZIP archive built on the fly.
+
+    *entries*: an iterable of ``(arcname, content)`` where content is bytes,
+        a string, a file object opened in binary mode (closed once read) or an
+        iterable of bytes chunks.
+
+    Nothing is staged on disk and at most one chunk at a time is kept in memory.
+    """
+    _buffer = _ZipStreamBuffer()
+    with ZipFile(_buffer, "w", ZIP_DEFLATED, allowZip64=True) as z:
+        for arcname, content in entries:
+            if isinstance(content, six.string_types):
+                content = content.encode('UTF-8')
+            if isinstance(content, bytes):
+                chunks = [content]
+            elif hasattr(content, 'read'):
+                chunks = iter(lambda: content.read(chunk_size), b'')
+            else:
+                chunks = content
+            try:
+                with z.open(arcname, "w", force_zip64=True) as entry:
+                    for chunk in chunks:
+                        entry.write(chunk)
+                        data = _buffer.pop()
+                        if data:
+                            yield data
+            finally:
+                if hasattr(content, 'close'):
+                    content.close()
+            data = _buffer.pop()
+            if data:
+                yield data
+    yield _buffer.pop()
+
+
 def copy_tree(src, dst, symlinks=False, ignore=None):
     try:
         for item in os.listdir(src):
@@ -22,6 +22,8 @@ import datetime
 import os
 import subprocess
 
+from functools import lru_cache
+
 
 def get_version(version=None):
     "Returns a PEP 386-compliant version number from VERSION."
@@ -55,12 +57,16 @@ def version(request, version=None):
     return HttpResponse(_v)
 
 
+@lru_cache(maxsize=None)
 def get_git_changeset():
     """Returns a numeric identifier of the latest git changeset.
 
     The result is the UTC timestamp of the changeset in YYYYMMDDHHMMSS format.
     This value isn't guaranteed to be unique, but collisions are very unlikely,
     so it's sufficient for generating the development version numbers.
+
+    The changeset is looked up once per process, the deployed code does not
+    change while it runs.
     """
     try:
         repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))